@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# Resultado de una verificación de contraseña:
+# correcta -> la contraseña coincide
+# espera_s -> segundos que faltan para poder reintentar (cuenta o IP bloqueada), 0 si no hay bloqueo
+# nuevo_hash -> hash recalculado con el coste configurado, si el guardado usaba otro (o None)
+# ocupado -> no había hueco en el pool de verificación; el cliente debe reintentar en unos segundos
+Verificacion = namedtuple("Verificacion", "correcta espera_s nuevo_hash ocupado")
+
+
+def coste_hash(hash_guardado):
+    """Factor de coste de un hash bcrypt ($2b$12$... -> 12), o None si no es un hash bcrypt."""
+    partes = hash_guardado.split("$")
+    if len(partes) < 4 or not partes[2].isdigit():
+        return None
+    return int(partes[2])
+
+
+class LimitadorIntentos:
+    """
+    Cuenta los fallos por clave (cuenta o IP) en una ventana deslizante de tiempo.
+    Las claves cuyos fallos ya han caducado se purgan como mucho una vez por ventana, así que la
+    memoria no crece con cada nombre de cuenta que alguien pruebe.
+    """
+
+    def __init__(self, max_fallos, ventana_s):
+        self.max_fallos = max_fallos
+        self.ventana_s = ventana_s
+        self._fallos = {}
+        self._lock = threading.Lock()
+        self._ultima_purga = time.monotonic()
+
+    def espera(self, clave):
+        """Segundos que faltan para que la clave pueda volver a intentarlo (0 si no está bloqueada)."""
+        with self._lock:
+            fallos = self._fallos.get(clave)
+            if not fallos:
+                return 0
+            ahora = time.monotonic()
+            while fallos and ahora - fallos[0] > self.ventana_s:
+                fallos.popleft()
+            if not fallos:
+                del self._fallos[clave]
+                return 0
+            if len(fallos) < self.max_fallos:
+                return 0
+            return self.ventana_s - (ahora - fallos[0])
+
+    def registrar_fallo(self, clave):
+        with self._lock:
+            ahora = time.monotonic()
+            if ahora - self._ultima_purga > self.ventana_s:
+                self._purgar(ahora)
+            self._fallos.setdefault(clave, deque(maxlen=self.max_fallos)).append(ahora)
+
+    def _purgar(self, ahora):
+        """Elimina las claves cuyo último fallo ya está fuera de la ventana (con el lock tomado)."""
+        for clave in [clave for clave, fallos in self._fallos.items() if ahora - fallos[-1] > self.ventana_s]:
+            del self._fallos[clave]
+        self._ultima_purga = ahora
+
+    def limpiar(self, clave):
+        with self._lock:
+            self._fallos.pop(clave, None)
+
+
+class VerificadorContrasenas:
+    """
+    Verifica contraseñas bcrypt en un pool de hilos acotado (bcrypt libera el GIL mientras calcula),
+    de modo que como mucho `max_workers` verificaciones consumen CPU a la vez y el resto espera turno.
+    Limita los intentos fallidos por cuenta y por IP, rechaza nuevas verificaciones si la cola está
+    llena y, tras un acceso correcto, recalcula el hash si su coste no es el configurado.
+    """
+
+    def __init__(self, max_workers=2, coste=12, max_fallos_cuenta=5, max_fallos_ip=20,
+                 ventana_s=900, max_en_cola=None):
+        self.coste = coste
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="bcrypt")
+        self._huecos = threading.BoundedSemaphore(max_en_cola or max_workers * 4)
+        self.por_cuenta = LimitadorIntentos(max_fallos_cuenta, ventana_s)
+        self.por_ip = LimitadorIntentos(max_fallos_ip, ventana_s)
+        # Hash con el que se verifica cuando la cuenta no existe, para que tarde lo mismo que una real
+        self._hash_ficticio = bcrypt.hashpw(b"cuenta-inexistente", bcrypt.gensalt(rounds=coste))
+
+    def hashear(self, contrasena):
+        """Calcula un hash con el coste configurado, también dentro del pool."""
+        return self._ejecutar(lambda: bcrypt.hashpw(contrasena.encode(), bcrypt.gensalt(rounds=self.coste)).decode())
+
+    def _ejecutar(self, funcion):
+        return self._executor.submit(funcion).result()
+
+    def verificar(self, cuenta, ip, contrasena, hash_guardado):
+        """
+        Comprueba la contraseña de `cuenta`. `hash_guardado` es None si la cuenta no existe: se
+        verifica igualmente contra un hash ficticio del mismo coste (misma duración) y cuenta como
+        fallo, para no dar pistas sobre qué cuentas existen.
+        """
+        espera = max(self.por_cuenta.espera(cuenta), self.por_ip.espera(ip) if ip else 0)
+        if espera:
+            return Verificacion(False, espera, None, False)
+
+        if not self._huecos.acquire(blocking=False):
+            return Verificacion(False, 0, None, True)
+        try:
+            hash_comprobado = hash_guardado.encode() if hash_guardado is not None else self._hash_ficticio
+            coincide = self._ejecutar(lambda: bcrypt.checkpw(contrasena.encode(), hash_comprobado))
+            correcta = hash_guardado is not None and coincide
+            nuevo_hash = None
+            if correcta and coste_hash(hash_guardado) != self.coste:
+                nuevo_hash = self.hashear(contrasena)
+        except ValueError:
+            # Hash guardado con formato inválido
+            correcta, nuevo_hash = False, None
+        finally:
+            self._huecos.release()
+
+        if correcta:
+            self.por_cuenta.limpiar(cuenta)
+        else:
+            self.por_cuenta.registrar_fallo(cuenta)
+            if ip:
+                self.por_ip.registrar_fallo(ip)
+        return Verificacion(correcta, 0, nuevo_hash, False)
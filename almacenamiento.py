@@ -0,0 +1,610 @@
+import hashlib
+import json
+import mmap
+import os
+import tempfile
+import threading
+import time
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import urllib.parse
+
+from azure.core import MatchConditions
+from azure.core.exceptions import ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
+from azure.storage.blob import BlobBlock, BlobSasPermissions, ContentSettings, generate_blob_sas
+
+# Propiedades de un blob, con los mismos nombres de campo que las de Azure
+PropiedadesBlob = namedtuple("PropiedadesBlob", "name size etag last_modified metadata content_type")
+
+# Caracteres que se escapan (%XX) en los nombres de fichero del almacenamiento local
+CARACTERES_RESERVADOS = '%<>:"|?*\\'
+
+# Tamaño de los trozos con los que descargar_en copia un blob a un fichero
+TAMANO_TROZO_DESCARGA = 4 * 1024 * 1024
+
+
+class Almacenamiento:
+    """
+    Interfaz del almacenamiento de blobs de la app (contenedor plano con nombres tipo ruta).
+
+    Todas las implementaciones lanzan las excepciones de azure.core: ResourceNotFoundError si el blob
+    no existe, y ResourceModifiedError / ResourceExistsError si no se cumple la condición de una
+    escritura (`etag`: solo si el blob no ha cambiado; `solo_si_no_existe`: solo si aún no existe).
+    Las escrituras devuelven {"etag", "last_modified"} como las de Azure.
+    `peticiones` cuenta las operaciones hechas por tipo.
+    """
+
+    # Indica si url_lectura puede generar enlaces de descarga directa
+    firma_urls = False
+
+    def __init__(self):
+        self.peticiones = Counter()
+        self._lock_contador = threading.Lock()
+
+    def _contar(self, operacion):
+        with self._lock_contador:
+            self.peticiones[operacion] += 1
+
+    def subir(self, nombre, datos, metadata=None, content_type=None, etag=None, solo_si_no_existe=False):
+        raise NotImplementedError
+
+    def subir_bloque(self, nombre, block_id, datos):
+        """Envía un bloque sin confirmar; solo pasa a formar parte del blob al llamar a confirmar_bloques."""
+        raise NotImplementedError
+
+    def confirmar_bloques(self, nombre, block_ids, metadata=None, content_type=None, solo_si_no_existe=False):
+        raise NotImplementedError
+
+    def descargar(self, nombre, offset=None, length=None, etag=None):
+        """Devuelve (contenido, propiedades) del blob entero o del rango indicado."""
+        raise NotImplementedError
+
+    def descargar_en(self, nombre, destino):
+        """Copia el blob en un fichero abierto para escritura, por trozos."""
+        inicio = 0
+        while True:
+            datos, propiedades = self.descargar(nombre, inicio, TAMANO_TROZO_DESCARGA)
+            destino.write(datos)
+            inicio += len(datos)
+            if not datos or inicio >= propiedades.size:
+                return
+
+    def propiedades(self, nombre):
+        raise NotImplementedError
+
+    def listar(self, prefijo=""):
+        """Propiedades (con metadatos) de los blobs cuyo nombre empieza por `prefijo`, en orden de nombre."""
+        raise NotImplementedError
+
+    def guardar_metadata(self, nombre, metadata, etag=None):
+        raise NotImplementedError
+
+    def eliminar(self, nombre, etag=None):
+        raise NotImplementedError
+
+    def crear_registro(self, nombre, datos=b"", metadata=None, etag=None, solo_si_no_existe=False):
+        """
+        Crea (o reemplaza) un blob de solo-añadir con un contenido inicial. La condición se aplica a la
+        creación; en Azure el contenido inicial va después en un append aparte, así que entre medias
+        el blob se puede leer vacío y otro proceso puede añadirle eventos.
+        """
+        raise NotImplementedError
+
+    def anadir(self, nombre, datos):
+        """Añade datos al final de un blob de solo-añadir, de forma atómica."""
+        raise NotImplementedError
+
+    def url_lectura(self, nombre, nombre_descarga=None, minutos=15, content_type=None):
+        """
+        URL de lectura directa de corta duración, o None si el almacenamiento no las admite.
+        Admite peticiones por rangos, así que también sirve para reproducir vídeos en el navegador.
+        """
+        return None
+
+
+def _comprobar_condicion(actual, etag, solo_si_no_existe):
+    """Lanza la excepción de Azure correspondiente si no se cumple la condición de escritura."""
+    if solo_si_no_existe and actual is not None:
+        raise ResourceExistsError("El blob ya existe.")
+    if etag and (actual is None or actual.etag != etag):
+        raise ResourceModifiedError("El blob ha cambiado.")
+
+
+class AlmacenamientoAzure(Almacenamiento):
+    """Contenedor de Azure Blob Storage."""
+
+    def __init__(self, container_client):
+        super().__init__()
+        self.container_client = container_client
+        self.firma_urls = bool(getattr(container_client.credential, "account_key", None))
+
+    @staticmethod
+    def _condicion(etag=None, solo_si_no_existe=False):
+        if solo_si_no_existe:
+            return {"match_condition": MatchConditions.IfMissing}
+        if etag:
+            return {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+        return {}
+
+    @staticmethod
+    def _propiedades(p):
+        return PropiedadesBlob(
+            p.name, p.size, p.etag, p.last_modified, p.metadata or {},
+            p.content_settings.content_type if p.content_settings else None
+        )
+
+    def _blob(self, nombre):
+        return self.container_client.get_blob_client(nombre)
+
+    def subir(self, nombre, datos, metadata=None, content_type=None, etag=None, solo_si_no_existe=False):
+        self._contar("subir")
+        return self._blob(nombre).upload_blob(
+            datos, overwrite=not solo_si_no_existe, metadata=metadata,
+            content_settings=ContentSettings(content_type=content_type) if content_type else None,
+            **self._condicion(etag)
+        )
+
+    def subir_bloque(self, nombre, block_id, datos):
+        self._contar("subir_bloque")
+        self._blob(nombre).stage_block(block_id, datos)
+
+    def confirmar_bloques(self, nombre, block_ids, metadata=None, content_type=None, solo_si_no_existe=False):
+        self._contar("confirmar_bloques")
+        return self._blob(nombre).commit_block_list(
+            [BlobBlock(block_id=block_id) for block_id in block_ids], metadata=metadata,
+            content_settings=ContentSettings(content_type=content_type) if content_type else None,
+            **self._condicion(solo_si_no_existe=solo_si_no_existe)
+        )
+
+    def descargar(self, nombre, offset=None, length=None, etag=None):
+        self._contar("descargar")
+        stream = self._blob(nombre).download_blob(offset=offset, length=length, **self._condicion(etag))
+        contenido = stream.readall()
+        # En una descarga por rangos el tamaño de las propiedades es el del rango: el total va en content_range
+        propiedades = self._propiedades(stream.properties)
+        rango = getattr(stream.properties, "content_range", None)
+        if rango:
+            propiedades = propiedades._replace(size=int(rango.rsplit("/", 1)[1]))
+        return contenido, propiedades._replace(name=nombre)
+
+    def propiedades(self, nombre):
+        self._contar("propiedades")
+        return self._propiedades(self._blob(nombre).get_blob_properties())._replace(name=nombre)
+
+    def listar(self, prefijo=""):
+        self._contar("listar")
+        for blob in self.container_client.list_blobs(name_starts_with=prefijo, include=["metadata"]):
+            yield self._propiedades(blob)
+
+    def guardar_metadata(self, nombre, metadata, etag=None):
+        self._contar("guardar_metadata")
+        return self._blob(nombre).set_blob_metadata(metadata, **self._condicion(etag))
+
+    def eliminar(self, nombre, etag=None):
+        self._contar("eliminar")
+        self._blob(nombre).delete_blob(**self._condicion(etag))
+
+    def crear_registro(self, nombre, datos=b"", metadata=None, etag=None, solo_si_no_existe=False):
+        self._contar("crear_registro")
+        # No se usa upload_blob(blob_type="AppendBlob"): con datos vacíos no crea el blob, y sin
+        # overwrite añade al existente en vez de fallar. La creación es la que lleva la condición
+        blob = self._blob(nombre)
+        resultado = blob.create_append_blob(metadata=metadata, **self._condicion(etag, solo_si_no_existe))
+        if datos:
+            self._contar("anadir")
+            resultado = blob.append_block(datos)
+        return resultado
+
+    def anadir(self, nombre, datos):
+        self._contar("anadir")
+        return self._blob(nombre).append_block(datos)
+
+    def url_lectura(self, nombre, nombre_descarga=None, minutos=15, content_type=None):
+        if not self.firma_urls:
+            return None
+        sas = generate_blob_sas(
+            account_name=self.container_client.account_name,
+            container_name=self.container_client.container_name,
+            blob_name=nombre,
+            account_key=self.container_client.credential.account_key,
+            permission=BlobSasPermissions(read=True),
+            expiry=datetime.now(timezone.utc) + timedelta(minutes=minutos),
+            content_disposition=(
+                f"attachment; filename*=UTF-8''{urllib.parse.quote(nombre_descarga)}" if nombre_descarga else None
+            ),
+            content_type=content_type
+        )
+        return f"{self._blob(nombre).url}?{sas}"
+
+
+class AlmacenamientoLocal(Almacenamiento):
+    """
+    Blobs guardados como ficheros bajo `raiz` (p. ej. la carpeta archivos/ del repositorio), para
+    despliegues locales y para trabajar sin conexión a Azure.
+
+    Cada escritura va a un fichero temporal y se publica con os.replace (atómico), las lecturas usan
+    mmap y los listados os.scandir. Los metadatos nativos se guardan aparte, en .propiedades/.
+    El ETag sale de la fecha de modificación y el tamaño del fichero. Las escrituras condicionales son
+    atómicas dentro del proceso; no se coordinan varios procesos escribiendo en la misma carpeta.
+    """
+
+    DIRECTORIOS_INTERNOS = (".propiedades", ".bloques", ".temporales")
+
+    def __init__(self, raiz):
+        super().__init__()
+        self.raiz = Path(raiz).resolve()
+        for directorio in self.DIRECTORIOS_INTERNOS:
+            (self.raiz / directorio).mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._ultimo_ns = 0
+
+    @staticmethod
+    def _codificar(nombre):
+        """Escapa los caracteres que Windows no admite en nombres de fichero (p. ej. ":" de las fechas)."""
+        return "".join(f"%{ord(c):02X}" if c in CARACTERES_RESERVADOS else c for c in nombre)
+
+    def _ruta(self, nombre):
+        ruta = (self.raiz / self._codificar(nombre)).resolve()
+        if self.raiz not in ruta.parents or ruta.relative_to(self.raiz).parts[0] in self.DIRECTORIOS_INTERNOS:
+            raise ValueError(f"Nombre de blob no válido: {nombre}")
+        return ruta
+
+    def _ruta_propiedades(self, nombre):
+        return self.raiz / ".propiedades" / f"{self._codificar(nombre)}.json"
+
+    def _publicar(self, ruta, escribir):
+        """Escribe en un temporal con `escribir(fichero)` y lo coloca en `ruta` con un rename atómico."""
+        ruta.parent.mkdir(parents=True, exist_ok=True)
+        fd, ruta_tmp = tempfile.mkstemp(dir=self.raiz / ".temporales")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                escribir(f)
+            os.replace(ruta_tmp, ruta)
+        except BaseException:
+            try:
+                os.remove(ruta_tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+    def _leer_extra(self, nombre):
+        try:
+            return json.loads(self._ruta_propiedades(nombre).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return {}
+
+    def _guardar_extra(self, nombre, metadata, content_type):
+        contenido = json.dumps({"metadata": metadata or {}, "content_type": content_type}).encode("utf-8")
+        self._publicar(self._ruta_propiedades(nombre), lambda f: f.write(contenido))
+
+    def _desde_stat(self, nombre, stat, extra=None):
+        extra = self._leer_extra(nombre) if extra is None else extra
+        return PropiedadesBlob(
+            nombre, stat.st_size, f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+            datetime.fromtimestamp(stat.st_mtime_ns / 1e9, timezone.utc),
+            extra.get("metadata", {}), extra.get("content_type")
+        )
+
+    def _actual(self, nombre):
+        try:
+            return self._desde_stat(nombre, os.stat(self._ruta(nombre)))
+        except FileNotFoundError:
+            return None
+
+    def _marcar_modificado(self, ruta):
+        """Garantiza que el ETag cambia aunque el sistema de ficheros tenga poca resolución de fechas."""
+        self._ultimo_ns = max(time.time_ns(), self._ultimo_ns + 1)
+        os.utime(ruta, ns=(self._ultimo_ns, self._ultimo_ns))
+
+    def _resultado(self, nombre):
+        propiedades = self._actual(nombre)
+        return {"etag": propiedades.etag, "last_modified": propiedades.last_modified}
+
+    def subir(self, nombre, datos, metadata=None, content_type=None, etag=None, solo_si_no_existe=False):
+        self._contar("subir")
+        return self._subir(nombre, datos, metadata, content_type, etag, solo_si_no_existe)
+
+    def _subir(self, nombre, datos, metadata, content_type, etag, solo_si_no_existe):
+        ruta = self._ruta(nombre)
+        with self._lock:
+            anterior = self._actual(nombre)
+            _comprobar_condicion(anterior, etag, solo_si_no_existe)
+            self._guardar_extra(nombre, metadata, content_type)
+            self._publicar(ruta, lambda f: f.write(datos))
+            self._marcar_modificado(ruta)
+            return self._resultado(nombre)
+
+    def _directorio_bloques(self, nombre):
+        return self.raiz / ".bloques" / hashlib.sha256(nombre.encode("utf-8")).hexdigest()
+
+    def subir_bloque(self, nombre, block_id, datos):
+        self._contar("subir_bloque")
+        directorio = self._directorio_bloques(nombre)
+        self._publicar(directorio / block_id.encode("utf-8").hex(), lambda f: f.write(datos))
+
+    def confirmar_bloques(self, nombre, block_ids, metadata=None, content_type=None, solo_si_no_existe=False):
+        self._contar("confirmar_bloques")
+        ruta = self._ruta(nombre)
+        directorio = self._directorio_bloques(nombre)
+
+        def escribir(f):
+            for block_id in block_ids:
+                with open(directorio / block_id.encode("utf-8").hex(), "rb") as bloque:
+                    while trozo := bloque.read(TAMANO_TROZO_DESCARGA):
+                        f.write(trozo)
+
+        with self._lock:
+            anterior = self._actual(nombre)
+            _comprobar_condicion(anterior, None, solo_si_no_existe)
+            self._guardar_extra(nombre, metadata, content_type)
+            self._publicar(ruta, escribir)
+            self._marcar_modificado(ruta)
+            for bloque in os.scandir(directorio):
+                os.remove(bloque.path)
+            os.rmdir(directorio)
+            return self._resultado(nombre)
+
+    def descargar(self, nombre, offset=None, length=None, etag=None):
+        self._contar("descargar")
+        try:
+            f = open(self._ruta(nombre), "rb")
+        except FileNotFoundError:
+            raise ResourceNotFoundError(f"No existe el blob {nombre}.") from None
+        with f:
+            # Lo que se lee es el fichero abierto, aunque otro hilo lo reemplace entretanto
+            propiedades = self._desde_stat(nombre, os.fstat(f.fileno()))
+            _comprobar_condicion(propiedades, etag, False)
+            inicio = offset or 0
+            fin = propiedades.size if length is None else min(propiedades.size, inicio + length)
+            if inicio >= fin:
+                return b"", propiedades
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                return m[inicio:fin], propiedades
+
+    def propiedades(self, nombre):
+        self._contar("propiedades")
+        propiedades = self._actual(nombre)
+        if propiedades is None:
+            raise ResourceNotFoundError(f"No existe el blob {nombre}.")
+        return propiedades
+
+    def listar(self, prefijo=""):
+        self._contar("listar")
+        # Solo se recorren las carpetas que pueden contener nombres con ese prefijo
+        carpeta, _, _ = prefijo.rpartition("/")
+        inicio = self.raiz / self._codificar(carpeta) if carpeta else self.raiz
+        encontrados = []
+        pendientes = [inicio] if inicio.is_dir() else []
+        while pendientes:
+            with os.scandir(pendientes.pop()) as it:
+                for entrada in it:
+                    nombre = urllib.parse.unquote(Path(entrada.path).relative_to(self.raiz).as_posix())
+                    if entrada.is_dir():
+                        if nombre not in self.DIRECTORIOS_INTERNOS:
+                            pendientes.append(entrada.path)
+                    elif nombre.startswith(prefijo):
+                        encontrados.append((nombre, entrada.stat()))
+        for nombre, stat in sorted(encontrados):
+            yield self._desde_stat(nombre, stat)
+
+    def guardar_metadata(self, nombre, metadata, etag=None):
+        self._contar("guardar_metadata")
+        with self._lock:
+            anterior = self._actual(nombre)
+            if anterior is None:
+                raise ResourceNotFoundError(f"No existe el blob {nombre}.")
+            _comprobar_condicion(anterior, etag, False)
+            self._guardar_extra(nombre, metadata, anterior.content_type)
+            self._marcar_modificado(self._ruta(nombre))
+            return self._resultado(nombre)
+
+    def eliminar(self, nombre, etag=None):
+        self._contar("eliminar")
+        with self._lock:
+            anterior = self._actual(nombre)
+            if anterior is None:
+                raise ResourceNotFoundError(f"No existe el blob {nombre}.")
+            _comprobar_condicion(anterior, etag, False)
+            os.remove(self._ruta(nombre))
+            try:
+                os.remove(self._ruta_propiedades(nombre))
+            except FileNotFoundError:
+                pass
+
+    def crear_registro(self, nombre, datos=b"", metadata=None, etag=None, solo_si_no_existe=False):
+        self._contar("crear_registro")
+        return self._subir(nombre, datos, metadata, None, etag, solo_si_no_existe)
+
+    def anadir(self, nombre, datos):
+        self._contar("anadir")
+        ruta = self._ruta(nombre)
+        with self._lock:
+            anterior = self._actual(nombre)
+            if anterior is None:
+                raise ResourceNotFoundError(f"No existe el blob {nombre}.")
+            with open(ruta, "ab") as f:
+                f.write(datos)
+            self._marcar_modificado(ruta)
+            return self._resultado(nombre)
+
+
+class AlmacenamientoMemoria(Almacenamiento):
+    """
+    Blobs en memoria del proceso, para pruebas y mediciones sin red.
+    Cada operación espera `latencia_ms` y, si se indica `mb_por_s`, el tiempo de transferir sus datos,
+    de modo que se puede simular el coste de un almacenamiento remoto.
+    """
+
+    def __init__(self, latencia_ms=0.0, mb_por_s=None):
+        super().__init__()
+        self.latencia_s = latencia_ms / 1000
+        self.bytes_por_s = mb_por_s * 1024 * 1024 if mb_por_s else None
+        self._blobs = {}  # nombre -> {"datos", "metadata", "content_type", "etag", "last_modified"}
+        self._bloques = {}  # (nombre, block_id) -> datos
+        self._version = 0
+        self._lock = threading.RLock()
+
+    def _esperar(self, operacion, num_bytes=0):
+        self._contar(operacion)
+        espera = self.latencia_s + (num_bytes / self.bytes_por_s if self.bytes_por_s else 0)
+        if espera:
+            time.sleep(espera)
+
+    def _propiedades(self, nombre):
+        blob = self._blobs.get(nombre)
+        if blob is None:
+            return None
+        return PropiedadesBlob(
+            nombre, len(blob["datos"]), blob["etag"], blob["last_modified"], dict(blob["metadata"]), blob["content_type"]
+        )
+
+    def _escribir(self, nombre, **cambios):
+        self._version += 1
+        blob = self._blobs.setdefault(nombre, {"datos": b"", "metadata": {}, "content_type": None})
+        blob.update(cambios, etag=f'"0x{self._version:X}"', last_modified=datetime.now(timezone.utc))
+        return {"etag": blob["etag"], "last_modified": blob["last_modified"]}
+
+    def subir(self, nombre, datos, metadata=None, content_type=None, etag=None, solo_si_no_existe=False):
+        self._esperar("subir", len(datos))
+        with self._lock:
+            _comprobar_condicion(self._propiedades(nombre), etag, solo_si_no_existe)
+            return self._escribir(nombre, datos=bytes(datos), metadata=dict(metadata or {}), content_type=content_type)
+
+    def subir_bloque(self, nombre, block_id, datos):
+        self._esperar("subir_bloque", len(datos))
+        with self._lock:
+            self._bloques[(nombre, block_id)] = bytes(datos)
+
+    def confirmar_bloques(self, nombre, block_ids, metadata=None, content_type=None, solo_si_no_existe=False):
+        self._esperar("confirmar_bloques")
+        with self._lock:
+            _comprobar_condicion(self._propiedades(nombre), None, solo_si_no_existe)
+            datos = b"".join(self._bloques.pop((nombre, block_id)) for block_id in block_ids)
+            for clave in [clave for clave in self._bloques if clave[0] == nombre]:
+                del self._bloques[clave]
+            return self._escribir(nombre, datos=datos, metadata=dict(metadata or {}), content_type=content_type)
+
+    def descargar(self, nombre, offset=None, length=None, etag=None):
+        with self._lock:
+            propiedades = self._propiedades(nombre)
+            if propiedades is None:
+                raise ResourceNotFoundError(f"No existe el blob {nombre}.")
+            _comprobar_condicion(propiedades, etag, False)
+            inicio = offset or 0
+            datos = self._blobs[nombre]["datos"][inicio:None if length is None else inicio + length]
+        self._esperar("descargar", len(datos))
+        return datos, propiedades
+
+    def propiedades(self, nombre):
+        self._esperar("propiedades")
+        with self._lock:
+            propiedades = self._propiedades(nombre)
+        if propiedades is None:
+            raise ResourceNotFoundError(f"No existe el blob {nombre}.")
+        return propiedades
+
+    def listar(self, prefijo=""):
+        self._esperar("listar")
+        with self._lock:
+            encontrados = [self._propiedades(nombre) for nombre in sorted(self._blobs) if nombre.startswith(prefijo)]
+        yield from encontrados
+
+    def guardar_metadata(self, nombre, metadata, etag=None):
+        self._esperar("guardar_metadata")
+        with self._lock:
+            propiedades = self._propiedades(nombre)
+            if propiedades is None:
+                raise ResourceNotFoundError(f"No existe el blob {nombre}.")
+            _comprobar_condicion(propiedades, etag, False)
+            return self._escribir(nombre, metadata=dict(metadata))
+
+    def eliminar(self, nombre, etag=None):
+        self._esperar("eliminar")
+        with self._lock:
+            propiedades = self._propiedades(nombre)
+            if propiedades is None:
+                raise ResourceNotFoundError(f"No existe el blob {nombre}.")
+            _comprobar_condicion(propiedades, etag, False)
+            del self._blobs[nombre]
+
+    def crear_registro(self, nombre, datos=b"", metadata=None, etag=None, solo_si_no_existe=False):
+        self._esperar("crear_registro", len(datos))
+        with self._lock:
+            _comprobar_condicion(self._propiedades(nombre), etag, solo_si_no_existe)
+            return self._escribir(nombre, datos=bytes(datos), metadata=dict(metadata or {}), content_type=None)
+
+    def anadir(self, nombre, datos):
+        self._esperar("anadir", len(datos))
+        with self._lock:
+            if nombre not in self._blobs:
+                raise ResourceNotFoundError(f"No existe el blob {nombre}.")
+            return self._escribir(nombre, datos=self._blobs[nombre]["datos"] + bytes(datos))
+
+
+class AlmacenamientoMedido(Almacenamiento):
+    """
+    Envoltorio de otro almacenamiento que registra en `metricas` (metricas.Metricas) la duración, los
+    bytes transferidos y los errores de cada operación. Las peticiones se siguen contando en el interno.
+    """
+
+    def __init__(self, interno, metricas):
+        self.interno = interno
+        self.metricas = metricas
+        self.firma_urls = interno.firma_urls
+
+    @property
+    def peticiones(self):
+        return self.interno.peticiones
+
+    def _medir(self, operacion, funcion, *args, num_bytes=0, **kwargs):
+        with self.metricas.medir("almacenamiento", operacion=operacion):
+            resultado = funcion(*args, **kwargs)
+        if num_bytes:
+            self.metricas.contar("almacenamiento_bytes_total", num_bytes, operacion=operacion)
+        return resultado
+
+    def subir(self, nombre, datos, metadata=None, content_type=None, etag=None, solo_si_no_existe=False):
+        return self._medir(
+            "subir", self.interno.subir, nombre, datos, metadata, content_type, etag, solo_si_no_existe,
+            num_bytes=len(datos)
+        )
+
+    def subir_bloque(self, nombre, block_id, datos):
+        return self._medir("subir_bloque", self.interno.subir_bloque, nombre, block_id, datos, num_bytes=len(datos))
+
+    def confirmar_bloques(self, nombre, block_ids, metadata=None, content_type=None, solo_si_no_existe=False):
+        return self._medir(
+            "confirmar_bloques", self.interno.confirmar_bloques, nombre, block_ids, metadata, content_type,
+            solo_si_no_existe
+        )
+
+    def descargar(self, nombre, offset=None, length=None, etag=None):
+        datos, propiedades = self._medir("descargar", self.interno.descargar, nombre, offset, length, etag)
+        self.metricas.contar("almacenamiento_bytes_total", len(datos), operacion="descargar")
+        return datos, propiedades
+
+    def propiedades(self, nombre):
+        return self._medir("propiedades", self.interno.propiedades, nombre)
+
+    def listar(self, prefijo=""):
+        # El listado se recorre entero aquí para medir el tiempo de todas sus páginas
+        return self._medir("listar", lambda: list(self.interno.listar(prefijo)))
+
+    def guardar_metadata(self, nombre, metadata, etag=None):
+        return self._medir("guardar_metadata", self.interno.guardar_metadata, nombre, metadata, etag)
+
+    def eliminar(self, nombre, etag=None):
+        return self._medir("eliminar", self.interno.eliminar, nombre, etag)
+
+    def crear_registro(self, nombre, datos=b"", metadata=None, etag=None, solo_si_no_existe=False):
+        return self._medir(
+            "crear_registro", self.interno.crear_registro, nombre, datos, metadata, etag, solo_si_no_existe,
+            num_bytes=len(datos)
+        )
+
+    def anadir(self, nombre, datos):
+        return self._medir("anadir", self.interno.anadir, nombre, datos, num_bytes=len(datos))
+
+    def url_lectura(self, nombre, nombre_descarga=None, minutos=15, content_type=None):
+        return self.interno.url_lectura(nombre, nombre_descarga, minutos, content_type)
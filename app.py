@@ -1,23 +1,47 @@
 import streamlit as st
 from pathlib import Path
 import os
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import pytz
-import pandas as pd
 from PIL import Image
 import json
 import base64
 import re
-import smtplib
 from itsdangerous import URLSafeTimedSerializer
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-import bcrypt
 from azure.storage.blob import BlobServiceClient
+from azure.core.exceptions import AzureError, ResourceExistsError, ResourceModifiedError, ResourceNotFoundError
 from io import BytesIO
 from streamlit_cookies_manager import EncryptedCookieManager
 from itsdangerous.exc import SignatureExpired, BadSignature
 import urllib.parse
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from azure.core.pipeline.transport import RequestsTransport
+import requests
+import tempfile
+import mimetypes
+from cache_contenidos import CacheContenidos
+from busqueda import IndiceBusqueda
+from usuarios import (
+    NOMBRE_BLOB_USUARIOS, NOMBRE_BLOB_USUARIOS_EXCEL, parsear_usuarios, serializar_usuarios, usuarios_desde_excel
+)
+from correo import ColaCorreo
+from acceso import VerificadorContrasenas
+from miniaturas import EXTENSIONES_VIDEO, admite_miniatura, generar_miniatura
+from metadatos import cabe_en_metadata, meta_a_metadata_blob, metadata_blob_a_meta
+from almacenamiento import AlmacenamientoAzure, AlmacenamientoLocal, AlmacenamientoMedido, AlmacenamientoMemoria
+from contenidos import blob_contenido, referencia_a_metadata_blob, referencia_desde_metadata, sha256_fichero
+from metricas import Metricas
+from reproduccion import ServidorVideo
+from exportacion import EscritorPorBloques, escribir_zip, nombres_unicos
+from enlaces import (
+    NOMBRE_ENLACES_ANTIGUO, NOMBRE_LOG_ENLACES, VistaEnlaces, evento_alta, evento_baja, eventos_desde_txt,
+    serializar_eventos
+)
 
 # RESUMEN de Herramientas y Servicios de la APP
 # Visual Studio Code para programar en python el código de la app (C:\Users\david\Documents\Streamlit\Albacete)
@@ -38,21 +62,129 @@ st.set_page_config(
 )
 st.markdown("<div id='inicio'></div>", unsafe_allow_html=True)
 
+def secreto_booleano(nombre, por_defecto):
+    """Lee un secreto de sí/no: un booleano de TOML o un texto como "true", "false", "1", "0" o "sí"."""
+    valor = st.secrets.get(nombre, por_defecto)
+    if isinstance(valor, bool):
+        return valor
+    return str(valor).strip().lower() in ("1", "true", "sí", "si", "yes")
+
 TIPOS_ARCHIVO = [
     "pdf", "doc", "docx", "ppt", "pptx",
     "xlsx", "xls", "csv", "mp4", "mov",
     "jpg", "jpeg", "png", "gif"
 ]
 
-# Configuración de Azure Blob Storage desde secrets
+# Modo de descarga en la cuadrícula de archivos:
+# "sas" -> enlace temporal firmado, el navegador descarga directamente desde Azure
+# "diferida" -> el contenido solo se trae al servidor cuando el usuario pulsa "Preparar descarga"
+MODO_DESCARGA = st.secrets.get("MODO_DESCARGA", "sas")
+MINUTOS_VALIDEZ_SAS = int(st.secrets.get("MINUTOS_VALIDEZ_SAS", 15))
+
+# Paginación de la cuadrícula de archivos y máximo de archivos listados en el sidebar
+TAMANO_PAGINA = int(st.secrets.get("TAMANO_PAGINA", 12))
+MAX_ARCHIVOS_SIDEBAR = int(st.secrets.get("MAX_ARCHIVOS_SIDEBAR", 25))
+
+# Dónde se guardan los metadatos de cada archivo:
+# "blob" -> metadatos nativos del propio blob (una sola escritura y se leen al listar)
+# "sidecar" -> blob <nombre>.meta.json adicional (formato antiguo)
+# La lectura admite ambos formatos mientras se migra con migrar_metadatos.py
+MODO_METADATOS = st.secrets.get("MODO_METADATOS", "blob")
+
+# Subida por bloques: los archivos mayores que un bloque se envían en trozos, con varios bloques
+# en vuelo a la vez. La memoria usada queda acotada por TAMANO_BLOQUE x MAX_BLOQUES_SIMULTANEOS
+TAMANO_BLOQUE = int(st.secrets.get("TAMANO_BLOQUE_MB", 8)) * 1024 * 1024
+MAX_BLOQUES_SIMULTANEOS = int(st.secrets.get("MAX_BLOQUES_SIMULTANEOS", 4))
+MAX_REINTENTOS_BLOQUE = 3
+# Archivos de un mismo lote que se suben a la vez
+MAX_SUBIDAS_SIMULTANEAS = int(st.secrets.get("MAX_SUBIDAS_SIMULTANEAS", 3))
+
+# Caché local en disco del contenido de los blobs (LRU por nombre + ETag)
+DIRECTORIO_CACHE = st.secrets.get("DIRECTORIO_CACHE", os.path.join(tempfile.gettempdir(), "centro_recursos_cache"))
+MAX_MB_CACHE = int(st.secrets.get("MAX_MB_CACHE", 1024))
+
+# Índice (manifiesto) por área con los metadatos de todos sus archivos: <prefijo>_index.json
+NOMBRE_INDICE = "_index.json"
+VERSION_INDICE = 1
+MAX_REINTENTOS_INDICE = 5
+
+ROL_ADMIN = "Administrador"
+
+# Las miniaturas de cada archivo se guardan junto a él: <prefijo>_miniaturas/<nombre>.webp
+PREFIJO_MINIATURAS = "_miniaturas/"
+
+# Exportación en ZIP: hasta MAX_MB_ZIP_DIRECTO se genera en memoria y se ofrece con download_button;
+# por encima se escribe en un blob temporal bajo PREFIJO_EXPORTACIONES y se comparte con un enlace SAS
+MAX_MB_ZIP_DIRECTO = int(st.secrets.get("MAX_MB_ZIP_DIRECTO", 50))
+MAX_DESCARGAS_ZIP_SIMULTANEAS = int(st.secrets.get("MAX_DESCARGAS_ZIP_SIMULTANEAS", 4))
+MINUTOS_VALIDEZ_EXPORTACION = int(st.secrets.get("MINUTOS_VALIDEZ_EXPORTACION", 60))
+PREFIJO_EXPORTACIONES = "_exportaciones/"
+TAMANO_TROZO_ZIP = 4 * 1024 * 1024
+
+# Reproducción de vídeos en la app: el navegador pide por rangos solo lo que reproduce. Con Azure y
+# clave de cuenta se usa un enlace SAS; si no, un pequeño servidor de rangos de este proceso que
+# escucha en PUERTO_VIDEO y al que el navegador llega por URL_VIDEO (sin URL_VIDEO no se reproduce)
+MINUTOS_VALIDEZ_VIDEO = int(st.secrets.get("MINUTOS_VALIDEZ_VIDEO", 240))
+PUERTO_VIDEO = int(st.secrets.get("PUERTO_VIDEO", 8502))
+URL_VIDEO = st.secrets.get("URL_VIDEO")
+
+# Los listados de cada área se guardan en memoria del proceso y se revalidan comparando el ETag
+# del índice (una petición HEAD) como mucho una vez cada INTERVALO_COMPROBACION_S segundos
+INTERVALO_COMPROBACION_S = int(st.secrets.get("INTERVALO_COMPROBACION_S", 10))
+
+# Número máximo de descargas simultáneas de metadatos (.meta.json) al reconstruir un índice
+MAX_WORKERS_METADATOS = int(st.secrets.get("MAX_WORKERS_METADATOS", 8))
+
+# Dónde se guardan los archivos:
+# "azure" -> contenedor de Azure Blob Storage (AZURE_CONNECTION_STRING)
+# "local" -> carpeta del servidor (DIRECTORIO_ALMACENAMIENTO), para despliegues sin Azure
+# "memoria" -> en memoria del proceso, con latencia simulada (LATENCIA_MEMORIA_MS), para pruebas y mediciones
+ALMACENAMIENTO = st.secrets.get("ALMACENAMIENTO", "azure")
+DIRECTORIO_ALMACENAMIENTO = st.secrets.get("DIRECTORIO_ALMACENAMIENTO", "archivos")
+LATENCIA_MEMORIA_MS = float(st.secrets.get("LATENCIA_MEMORIA_MS", 0))
+
+# Métricas del proceso (operaciones de almacenamiento, cachés, tiempos de cada ejecución de la página),
+# visibles para los administradores y exportables en formato Prometheus. Desactivadas no cuestan nada
+METRICAS = secreto_booleano("METRICAS", True)
+
+@st.cache_resource
+def get_metricas():
+    """Registro de métricas compartido por todas las sesiones del proceso."""
+    return Metricas(activadas=METRICAS)
+metricas = get_metricas()
+ejecucion = metricas.iniciar_ejecucion()
+
 # Conexiones y Clientes (Cacheado)
 @st.cache_resource
-def get_container_client():
-    """Crea y devuelve un cliente para el contenedor de Azure, cacheado para reutilización."""
-    blob_service_client = BlobServiceClient.from_connection_string(st.secrets["AZURE_CONNECTION_STRING"])
-    container_client = blob_service_client.get_container_client("archivos-app")
-    return container_client
-container_client = get_container_client()
+def get_almacenamiento():
+    """Crea y devuelve el almacenamiento configurado, cacheado para reutilización."""
+    almacen = crear_almacenamiento()
+    return AlmacenamientoMedido(almacen, get_metricas()) if METRICAS else almacen
+
+def crear_almacenamiento():
+    if ALMACENAMIENTO == "local":
+        return AlmacenamientoLocal(DIRECTORIO_ALMACENAMIENTO)
+    if ALMACENAMIENTO == "memoria":
+        return AlmacenamientoMemoria(latencia_ms=LATENCIA_MEMORIA_MS)
+    # Pool de conexiones HTTP compartido, con tamaño suficiente para las descargas en paralelo
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(
+        pool_maxsize=max(MAX_WORKERS_METADATOS, MAX_SUBIDAS_SIMULTANEAS * MAX_BLOQUES_SIMULTANEOS, 10)
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    blob_service_client = BlobServiceClient.from_connection_string(
+        st.secrets["AZURE_CONNECTION_STRING"],
+        transport=RequestsTransport(session=session, session_owner=False)
+    )
+    return AlmacenamientoAzure(blob_service_client.get_container_client("archivos-app"))
+
+almacenamiento = get_almacenamiento()
+
+@st.cache_resource
+def get_cache_contenidos():
+    """Caché de contenidos compartida por todas las sesiones del proceso."""
+    return CacheContenidos(DIRECTORIO_CACHE, MAX_MB_CACHE * 1024 * 1024)
 
 # Inicializar cookies con clave secreta desde st.secrets
 cookies = EncryptedCookieManager(
@@ -67,6 +199,18 @@ SMTP_SERVER = st.secrets["SMTP_SERVER"]
 SMTP_PORT = st.secrets["SMTP_PORT"]
 SMTP_USER = st.secrets["SMTP_USER"]
 SMTP_PASS = st.secrets["SMTP_PASS"]
+# STARTTLS se puede desactivar para probar contra un servidor SMTP local de depuración
+SMTP_STARTTLS = secreto_booleano("SMTP_STARTTLS", True)
+# Tiempo mínimo entre dos correos de recuperación a la misma dirección
+SEGUNDOS_ENTRE_CORREOS = int(st.secrets.get("SEGUNDOS_ENTRE_CORREOS", 60))
+
+@st.cache_resource
+def get_cola_correo():
+    """Cola de correo del proceso: un hilo en segundo plano con una conexión SMTP reutilizada."""
+    return ColaCorreo(
+        SMTP_SERVER, SMTP_PORT, SMTP_USER, SMTP_PASS,
+        usar_tls=SMTP_STARTTLS, intervalo_por_destinatario_s=SEGUNDOS_ENTRE_CORREOS, metricas=get_metricas()
+    )
 
 # URL base para enlaces de recuperación
 APP_URL = st.secrets["APP_URL"]
@@ -77,62 +221,228 @@ SECRET_KEY = st.secrets["SECRET_KEY"]
 SALT = "salt-recovery"
 serializer = URLSafeTimedSerializer(SECRET_KEY)
 
+# Verificación de contraseñas: coste bcrypt de los hashes nuevos, hilos dedicados y límites de intentos
+BCRYPT_COSTE = int(st.secrets.get("BCRYPT_COSTE", 12))
+MAX_WORKERS_BCRYPT = int(st.secrets.get("MAX_WORKERS_BCRYPT", 2))
+MAX_FALLOS_CUENTA = int(st.secrets.get("MAX_FALLOS_CUENTA", 5))
+MAX_FALLOS_IP = int(st.secrets.get("MAX_FALLOS_IP", 20))
+MINUTOS_BLOQUEO = int(st.secrets.get("MINUTOS_BLOQUEO", 15))
+
+@st.cache_resource
+def get_verificador():
+    """Verificador de contraseñas compartido por todas las sesiones del proceso."""
+    return VerificadorContrasenas(
+        max_workers=MAX_WORKERS_BCRYPT, coste=BCRYPT_COSTE, max_fallos_cuenta=MAX_FALLOS_CUENTA,
+        max_fallos_ip=MAX_FALLOS_IP, ventana_s=MINUTOS_BLOQUEO * 60
+    )
+
+# Proxies inversos de confianza delante de la app: cada uno añade a X-Forwarded-For la IP de quien le
+# llama. Con 0 se ignora la cabecera y se usa la IP de la conexión
+PROXIES_DE_CONFIANZA = int(st.secrets.get("PROXIES_DE_CONFIANZA", 1))
+
+def ip_cliente():
+    """
+    IP del cliente, o None si no se conoce. Detrás de PROXIES_DE_CONFIANZA proxies es la entrada de
+    X-Forwarded-For que añadió el más externo (la N-ésima empezando por la derecha): las anteriores las
+    pone el propio cliente y no sirven para limitar intentos por IP.
+    """
+    reenviada = st.context.headers.get("X-Forwarded-For")
+    if reenviada and PROXIES_DE_CONFIANZA > 0:
+        saltos = [ip.strip() for ip in reenviada.split(",")]
+        if len(saltos) >= PROXIES_DE_CONFIANZA:
+            return saltos[-PROXIES_DE_CONFIANZA]
+    return getattr(st.context, "ip_address", None)
+
+# Sesión persistente: un único token firmado en la cookie "sesion" con los datos del usuario
+SALT_SESION = "salt-sesion"
+DIAS_VALIDEZ_SESION = int(st.secrets.get("DIAS_VALIDEZ_SESION", 30))
+COOKIES_SESION_ANTIGUAS = ["usuario", "area", "permisos", "rol"]
+
 # --- FUNCIONES ---
 
-@st.cache_data
+@st.cache_resource
+def get_estado_usuarios():
+    """Índice en memoria mail -> registro de los usuarios, compartido por todas las sesiones."""
+    return {"lock": threading.Lock(), "usuarios": None, "etag": None, "comprobado": 0.0}
+
+def get_usuarios():
+    """
+    Devuelve el diccionario mail -> registro de usuarios (no se debe modificar).
+    Se revalida como los listados de las áreas: comparando el ETag de usuarios.jsonl como mucho
+    una vez cada INTERVALO_COMPROBACION_S y descargándolo solo si ha cambiado.
+    """
+    estado = get_estado_usuarios()
+    with estado["lock"]:
+        if estado["usuarios"] is not None:
+            if time.monotonic() - estado["comprobado"] < INTERVALO_COMPROBACION_S:
+                metricas.contar("cache_total", cache="usuarios", resultado="acierto")
+                return estado["usuarios"]
+            if estado["etag"] == etag_blob(NOMBRE_BLOB_USUARIOS):
+                metricas.contar("cache_total", cache="usuarios", resultado="revalidado")
+                estado["comprobado"] = time.monotonic()
+                return estado["usuarios"]
+        metricas.contar("cache_total", cache="usuarios", resultado="fallo")
+        estado["usuarios"], estado["etag"] = cargar_usuarios_desde_blob()
+        estado["comprobado"] = time.monotonic()
+        return estado["usuarios"]
+
+@metricas.cronometrado("funcion", funcion="cargar_usuarios_desde_blob")
 def cargar_usuarios_desde_blob():
-    blob_client = container_client.get_blob_client("usuarios.xlsx")
-    stream = BytesIO()
-    blob_client.download_blob().readinto(stream)
-    stream.seek(0)
-    return pd.read_excel(stream)
-
-def guardar_usuarios_en_blob(df):
-    blob_client = container_client.get_blob_client("usuarios.xlsx")
-    stream = BytesIO()
-    df.to_excel(stream, index=False)
-    stream.seek(0)
-    blob_client.upload_blob(stream, overwrite=True)
-
-@st.cache_data(ttl="5m")
+    """Descarga usuarios.jsonl y devuelve (usuarios, etag). Si aún no existe, se crea desde usuarios.xlsx."""
+    try:
+        contenido, etag = descargar_blob_con_etag(NOMBRE_BLOB_USUARIOS)
+        return parsear_usuarios(contenido), etag
+    except ResourceNotFoundError:
+        pass
+
+    usuarios = usuarios_desde_excel(BytesIO(descargar_blob(NOMBRE_BLOB_USUARIOS_EXCEL)))
+    try:
+        return usuarios, subir_a_blob_condicional(NOMBRE_BLOB_USUARIOS, serializar_usuarios(usuarios))
+    except ResourceExistsError:
+        # Otro proceso lo ha creado a la vez
+        contenido, etag = descargar_blob_con_etag(NOMBRE_BLOB_USUARIOS)
+        return parsear_usuarios(contenido), etag
+
+def buscar_usuario(mail):
+    return get_usuarios().get(mail)
+
+def actualizar_usuario(mail, cambios):
+    """
+    Modifica un único usuario con escritura condicional por ETag: si otro proceso cambió el almacén
+    entre la lectura y la escritura (p. ej. dos restablecimientos a la vez), se relee y se reintenta,
+    así que ningún cambio pisa a otro. Devuelve False si el usuario no existe.
+    """
+    for _ in range(MAX_REINTENTOS_INDICE):
+        usuarios, etag = cargar_usuarios_desde_blob()
+        if mail not in usuarios:
+            return False
+        usuarios[mail] = {**usuarios[mail], **cambios}
+        try:
+            etag_nuevo = subir_a_blob_condicional(NOMBRE_BLOB_USUARIOS, serializar_usuarios(usuarios), etag)
+        except (ResourceExistsError, ResourceModifiedError):
+            continue
+        estado = get_estado_usuarios()
+        with estado["lock"]:
+            estado["usuarios"], estado["etag"], estado["comprobado"] = usuarios, etag_nuevo, time.monotonic()
+        return True
+    raise RuntimeError("No se pudo guardar el usuario: el almacén se está modificando concurrentemente.")
+
+@metricas.cronometrado("funcion", funcion="get_archivos_area")
 def get_archivos_area(prefix):
     """
-    Obtiene y cachea una lista de diccionarios, cada uno con los datos y metadatos de un archivo.
+    Devuelve una lista de diccionarios, cada uno con los datos y metadatos de un archivo del área.
+    Sale del estado en memoria del área, que solo se recarga si su índice ha cambiado.
     """
-    archivos_con_meta = []
-    for blob in container_client.list_blobs(name_starts_with=prefix):
-        if not blob.name.endswith(".meta.json") and not blob.name.endswith("enlaces.txt"):
-            meta = {}
-            try:
-                # Intenta descargar y parsear el archivo de metadatos asociado
-                meta_blob_name = f"{blob.name}.meta.json"
-                meta_bytes = container_client.get_blob_client(meta_blob_name).download_blob().readall()
-                meta = json.loads(meta_bytes)
-            except Exception:
-                # Si no hay metadatos, se usan valores por defecto
-                meta = {"nombre_original": Path(blob.name).name, "comentario": "", "usuario": "N/A", "fecha": "N/A"}
-
-            archivos_con_meta.append({
-                "blob_name": blob.name,
-                "last_modified": blob.last_modified,
-                "meta": meta
-            })
-    return archivos_con_meta
-
-@st.cache_data(ttl="5m")
+    estado = get_estado_area(prefix)
+    with estado["lock"]:
+        return [archivo_desde_entrada(blob_name, entrada) for blob_name, entrada in estado["archivos"].items()]
+
+@metricas.cronometrado("funcion", funcion="cargar_areas")
+def cargar_areas(prefixes):
+    """
+    Archivos y enlaces de varias áreas, cargados a la vez: cada área usa su propio estado en memoria
+    (el mismo que la vista de un área), así que solo las que no estén al día van al almacenamiento.
+    Devuelve {prefix: (archivos, enlaces)}.
+    """
+    if len(prefixes) == 1:
+        return {prefixes[0]: (get_archivos_area(prefixes[0]), get_enlaces(prefixes[0]))}
+    with ThreadPoolExecutor(max_workers=len(prefixes)) as executor:
+        archivos = executor.map(get_archivos_area, prefixes)
+        enlaces = executor.map(get_enlaces, prefixes)
+        return dict(zip(prefixes, zip(archivos, enlaces)))
+
+@metricas.cronometrado("funcion", funcion="get_enlaces")
 def get_enlaces(prefix):
-    """Obtiene y cachea la lista de enlaces compartidos desde enlaces.txt."""
-    enlaces = []
-    enlace_blob_path = f"{prefix}enlaces.txt"
+    """
+    Devuelve la lista de enlaces compartidos del área como (id, nombre, url).
+    Sale de la vista en memoria del área, alimentada por el registro de eventos enlaces.jsonl: como
+    mucho cada INTERVALO_COMPROBACION_S se hace un HEAD y, si ha cambiado, solo se descarga lo añadido.
+    """
+    estado = get_estado_area_sin_cargar(prefix)
+    with estado["lock"]:
+        if estado["enlaces"] is None or time.monotonic() - estado["enlaces_comprobado"] >= INTERVALO_COMPROBACION_S:
+            _refrescar_enlaces(prefix, estado)
+        else:
+            metricas.contar("cache_total", cache="enlaces", resultado="acierto")
+        return estado["enlaces"].enlaces()
+
+def _refrescar_enlaces(prefix, estado):
+    """Pone al día la vista de enlaces del área (se llama con el lock del estado tomado)."""
+    nombre_log = f"{prefix}{NOMBRE_LOG_ENLACES}"
     try:
-        enlaces_bytes = container_client.get_blob_client(enlace_blob_path).download_blob().readall()
-        for line in enlaces_bytes.decode("utf-8").splitlines():
-            if "::" in line:
-                nombre, enlace = line.strip().split("::", 1)
-                enlaces.append((nombre, enlace))
-    except Exception:
-        pass # Si no existe el archivo, devuelve una lista vacía
-    return enlaces
+        propiedades = almacenamiento.propiedades(nombre_log)
+    except ResourceNotFoundError:
+        propiedades = _crear_log_enlaces(prefix)
+
+    vista = estado["enlaces"]
+    if vista is not None and propiedades.etag == estado["enlaces_etag"]:
+        metricas.contar("cache_total", cache="enlaces", resultado="revalidado")
+        estado["enlaces_comprobado"] = time.monotonic()
+        return
+    metricas.contar("cache_total", cache="enlaces", resultado="fallo")
+    generacion = propiedades.metadata.get("generacion")
+    if vista is None or vista.generacion != generacion or propiedades.size < vista.desplazamiento:
+        # Primera carga o registro compactado: se lee entero
+        vista = VistaEnlaces(generacion)
+    if propiedades.size > vista.desplazamiento:
+        vista.aplicar(almacenamiento.descargar(
+            nombre_log, offset=vista.desplazamiento, length=propiedades.size - vista.desplazamiento
+        )[0])
+    estado["enlaces"], estado["enlaces_etag"], estado["enlaces_comprobado"] = vista, propiedades.etag, time.monotonic()
+
+def _crear_log_enlaces(prefix):
+    """Crea el registro de enlaces del área, importando el antiguo enlaces.txt si existe. Devuelve sus propiedades."""
+    try:
+        eventos = eventos_desde_txt(descargar_blob(f"{prefix}{NOMBRE_ENLACES_ANTIGUO}"))
+    except ResourceNotFoundError:
+        eventos = []
+    try:
+        almacenamiento.crear_registro(
+            f"{prefix}{NOMBRE_LOG_ENLACES}", serializar_eventos(eventos),
+            metadata={"generacion": uuid.uuid4().hex}, solo_si_no_existe=True
+        )
+    except ResourceExistsError:
+        pass # Otro proceso lo ha creado a la vez
+    return almacenamiento.propiedades(f"{prefix}{NOMBRE_LOG_ENLACES}")
+
+def registrar_evento_enlace(prefix, evento):
+    """
+    Añade un evento al registro de enlaces del área con un único append (atómico en Azure, así que
+    dos ediciones simultáneas se conservan las dos) y pone al día la vista en memoria del área.
+    """
+    estado = get_estado_area_sin_cargar(prefix)
+    with estado["lock"]:
+        try:
+            almacenamiento.anadir(f"{prefix}{NOMBRE_LOG_ENLACES}", serializar_eventos([evento]))
+        except ResourceNotFoundError:
+            _crear_log_enlaces(prefix)
+            almacenamiento.anadir(f"{prefix}{NOMBRE_LOG_ENLACES}", serializar_eventos([evento]))
+        _refrescar_enlaces(prefix, estado)
+        if estado["enlaces"].necesita_compactar():
+            compactar_enlaces(prefix, estado)
+
+def compactar_enlaces(prefix, estado):
+    """
+    Reescribe el registro con solo las altas de los enlaces vivos (vacío si no queda ninguno). La
+    creación del registro nuevo es condicional al ETag leído: si alguien ha añadido un evento
+    entretanto, no se compacta y se intentará en otra edición. Un evento que llegue entre la creación
+    y el append de las altas queda delante de ellas, y VistaEnlaces lo aplica igual.
+    """
+    try:
+        almacenamiento.crear_registro(
+            f"{prefix}{NOMBRE_LOG_ENLACES}", estado["enlaces"].contenido_compactado(),
+            metadata={"generacion": uuid.uuid4().hex}, etag=estado["enlaces_etag"]
+        )
+    except ResourceModifiedError:
+        return
+    estado["enlaces"] = None
+    _refrescar_enlaces(prefix, estado)
+
+def anadir_enlace(prefix, nombre, url, usuario):
+    registrar_evento_enlace(prefix, evento_alta(nombre, url, usuario))
+
+def eliminar_enlace(prefix, id_enlace, usuario):
+    registrar_evento_enlace(prefix, evento_baja(id_enlace, usuario))
 
 def send_recovery_email(mail_destino: str, token: str):
     # El token ya está en formato URL-safe, no lo volvemos a codificar
@@ -166,32 +476,700 @@ def send_recovery_email(mail_destino: str, token: str):
     msg.attach(MIMEText(texto_plano, "plain"))
     msg.attach(MIMEText(html, "html"))
 
-    try:
-        with smtplib.SMTP(SMTP_SERVER, SMTP_PORT) as server:
-            server.starttls()
-            server.login(SMTP_USER, SMTP_PASS)
-            server.send_message(msg)
-        st.success("✅ Enlace de recuperación enviado correctamente.")
-    except Exception as e:
-        st.error(f"❌ Error al enviar correo: {e}")
+    # El envío lo hace la cola en segundo plano: la página no espera al servidor SMTP
+    if get_cola_correo().encolar(msg):
+        st.success("✅ Enlace de recuperación en camino. Revisa tu correo en unos instantes.")
+    else:
+        st.warning("⏳ Ya se ha enviado un enlace a este correo hace poco. Espera un minuto antes de pedir otro.")
+
 
+# Funciones de almacenamiento (Azure, carpeta local o memoria según ALMACENAMIENTO)
+def subir_a_blob(nombre_archivo, contenido_bytes, metadata=None, content_type=None):
+    return almacenamiento.subir(nombre_archivo, contenido_bytes, metadata=metadata, content_type=content_type)
+
+def subir_a_blob_condicional(nombre_archivo, contenido_bytes, etag=None):
+    """
+    Sube el blob solo si no ha cambiado desde que se leyó con `etag` (o si no existe cuando etag es None).
+    Lanza ResourceModifiedError / ResourceExistsError si otro proceso lo ha modificado. Devuelve el nuevo ETag.
+    """
+    return almacenamiento.subir(nombre_archivo, contenido_bytes, etag=etag, solo_si_no_existe=not etag)["etag"]
+
+def subir_bloque_con_reintentos(nombre_archivo, block_id, datos):
+    """Envía un bloque sin confirmar, reintentándolo con espera exponencial si falla."""
+    for intento in range(MAX_REINTENTOS_BLOQUE):
+        try:
+            almacenamiento.subir_bloque(nombre_archivo, block_id, datos)
+            return
+        except (AzureError, OSError):
+            if intento == MAX_REINTENTOS_BLOQUE - 1:
+                raise
+            time.sleep(2 ** intento)
+
+def subir_a_blob_por_bloques(nombre_archivo, fichero, metadata=None, progreso=None, content_type=None,
+                             solo_si_no_existe=False):
+    """
+    Sube un fichero leyéndolo en bloques de TAMANO_BLOQUE, sin cargarlo entero en memoria.
+    Los bloques se envían con hasta MAX_BLOQUES_SIMULTANEOS en paralelo, cada uno se reintenta
+    por separado si falla y al final se confirma la lista de bloques.
+    `progreso(bytes_subidos)` se llama tras cada bloque enviado, en el hilo que llama a esta función;
+    si es un hilo de trabajo (como en subir_lote), no puede pintar en la página y debe ser seguro
+    entre hilos.
+    Con `solo_si_no_existe` la confirmación falla (ResourceExistsError) si el blob ya existe.
+    """
+    def subir_bloque(block_id, datos):
+        subir_bloque_con_reintentos(nombre_archivo, block_id, datos)
+        return len(datos)
+
+    bloques = []
+    subidos = 0
+    pendientes = set()
+    with ThreadPoolExecutor(max_workers=MAX_BLOQUES_SIMULTANEOS) as executor:
+        while True:
+            datos = fichero.read(TAMANO_BLOQUE)
+            if not datos:
+                break
+            # Los identificadores de bloque deben tener todos la misma longitud
+            block_id = base64.b64encode(f"{len(bloques):08d}".encode()).decode()
+            bloques.append(block_id)
+            pendientes.add(executor.submit(subir_bloque, block_id, datos))
+
+            # No se lee el siguiente bloque hasta que haya hueco: memoria acotada
+            while len(pendientes) >= MAX_BLOQUES_SIMULTANEOS:
+                terminados, pendientes = wait(pendientes, return_when=FIRST_COMPLETED)
+                for futuro in terminados:
+                    subidos += futuro.result()
+                    if progreso:
+                        progreso(subidos)
+
+        for futuro in pendientes:
+            subidos += futuro.result()
+            if progreso:
+                progreso(subidos)
+
+    return almacenamiento.confirmar_bloques(
+        nombre_archivo, bloques, metadata=metadata, content_type=content_type, solo_si_no_existe=solo_si_no_existe
+    )
 
-# Funciones Azure Blob
-def subir_a_blob(nombre_archivo, contenido_bytes):
-    blob_client = container_client.get_blob_client(nombre_archivo)
-    blob_client.upload_blob(contenido_bytes, overwrite=True)
+def descargar_blob(nombre_archivo, etag=None):
+    """
+    Descarga el contenido de un blob. Si se conoce su ETag, se sirve desde la caché local en disco
+    cuando está disponible y, si no, se descarga y se guarda en ella.
+    """
+    if etag:
+        return get_cache_contenidos().obtener(nombre_archivo, etag, lambda: descargar_blob_con_etag(nombre_archivo))
+    return almacenamiento.descargar(nombre_archivo)[0]
 
-def listar_blobs():
-    return container_client.list_blobs()
+def etag_blob(nombre_archivo):
+    """ETag actual de un blob (petición HEAD, sin descargar contenido), o None si no existe."""
+    try:
+        return almacenamiento.propiedades(nombre_archivo).etag
+    except ResourceNotFoundError:
+        return None
 
-def descargar_blob(nombre_archivo):
-    blob_client = container_client.get_blob_client(nombre_archivo)
-    stream = blob_client.download_blob()
-    return stream.readall()
+def descargar_blob_con_etag(nombre_archivo):
+    """Descarga un blob y devuelve (contenido, etag). Lanza ResourceNotFoundError si no existe."""
+    contenido, propiedades = almacenamiento.descargar(nombre_archivo)
+    return contenido, propiedades.etag
 
 def eliminar_blob(nombre_archivo):
-    blob_client = container_client.get_blob_client(nombre_archivo)
-    blob_client.delete_blob()
+    almacenamiento.eliminar(nombre_archivo)
+
+def subir_archivo_con_meta(nombre_archivo, fichero, size, meta, progreso=None):
+    """
+    Sube un fichero (objeto con read()) al área con sus metadatos según MODO_METADATOS.
+    Se calcula su SHA-256 leyéndolo por trozos: si el contenido ya está guardado (en esta u otra
+    área) no se vuelve a transferir. El blob del área es solo una referencia al contenido.
+    Devuelve (propiedades del blob del área, sha, datos de la subida anterior o None si era nuevo).
+    """
+    sha = sha256_fichero(fichero)
+    anterior = guardar_contenido(sha, fichero, size, meta["nombre_original"], nombre_archivo, progreso)
+    metadata = referencia_a_metadata_blob(sha, size)
+    nativa = {**metadata, **meta_a_metadata_blob(meta)}
+    en_blob = MODO_METADATOS == "blob" and cabe_en_metadata(nativa)
+    propiedades = subir_a_blob(nombre_archivo, b"", metadata=nativa if en_blob else metadata)
+    if not en_blob:
+        guardar_meta_sidecar(nombre_archivo, meta)
+    return propiedades, sha, anterior
+
+def guardar_meta(nombre_archivo, meta, sha=None, size=None):
+    """
+    Guarda los metadatos de un archivo ya subido según MODO_METADATOS.
+    Si el archivo es una referencia a un contenido (sha), se conserva la referencia.
+    Si no caben en los metadatos nativos (límite de 8 KB de Azure), van al .meta.json y se quitan
+    del blob, para que la lectura use el .meta.json como con el formato antiguo.
+    Devuelve el nuevo ETag del blob de datos si ha cambiado (metadatos nativos), o None.
+    """
+    if MODO_METADATOS != "blob":
+        guardar_meta_sidecar(nombre_archivo, meta)
+        return None
+    referencia = referencia_a_metadata_blob(sha, size) if sha else {}
+    metadata = {**meta_a_metadata_blob(meta), **referencia}
+    if cabe_en_metadata(metadata):
+        return almacenamiento.guardar_metadata(nombre_archivo, metadata)["etag"]
+    guardar_meta_sidecar(nombre_archivo, meta)
+    return almacenamiento.guardar_metadata(nombre_archivo, referencia)["etag"]
+
+def guardar_meta_sidecar(nombre_archivo, meta):
+    meta_str = json.dumps(meta, ensure_ascii=False)
+    subir_a_blob(f"{nombre_archivo}.meta.json", meta_str.encode("utf-8"))
+
+def eliminar_archivo_con_meta(nombre_archivo, miniatura=None, sha=None):
+    """Elimina un archivo, su .meta.json y su miniatura si los tiene, y libera su contenido si es una referencia."""
+    eliminar_blob(nombre_archivo)
+    for derivado in [f"{nombre_archivo}.meta.json", miniatura]:
+        if not derivado:
+            continue
+        try:
+            eliminar_blob(derivado)
+        except ResourceNotFoundError:
+            pass
+    if sha:
+        liberar_contenido(sha)
+
+# Contenidos compartidos (deduplicación por SHA-256)
+def guardar_contenido(sha, fichero, size, nombre_original, blob_name, progreso=None):
+    """
+    Garantiza que el contenido está guardado en _contenidos/ y le suma una referencia.
+    Devuelve None si se ha subido ahora, o {"nombre_original", "blob"} de la primera subida si
+    ya existía (en ese caso no se transfiere nada). El contador de referencias se modifica con
+    escritura condicional por ETag, así que dos subidas o borrados simultáneos no lo desincronizan.
+    """
+    nombre_contenido = blob_contenido(sha)
+    for _ in range(MAX_REINTENTOS_INDICE):
+        try:
+            propiedades = almacenamiento.propiedades(nombre_contenido)
+        except ResourceNotFoundError:
+            metadata = {
+                "referencias": "1",
+                "nombre_original": urllib.parse.quote(nombre_original, safe=""),
+                "blob": urllib.parse.quote(blob_name, safe="")
+            }
+            content_type = mimetypes.guess_type(nombre_original)[0]
+            try:
+                if size > TAMANO_BLOQUE:
+                    subir_a_blob_por_bloques(
+                        nombre_contenido, fichero, metadata=metadata, progreso=progreso,
+                        content_type=content_type, solo_si_no_existe=True
+                    )
+                else:
+                    almacenamiento.subir(
+                        nombre_contenido, fichero.read(), metadata=metadata, content_type=content_type,
+                        solo_si_no_existe=True
+                    )
+                return None
+            except ResourceExistsError:
+                # Otra subida del mismo contenido se ha adelantado: se cuenta como una referencia más
+                fichero.seek(0)
+                continue
+        metadata = dict(propiedades.metadata)
+        metadata["referencias"] = str(int(metadata.get("referencias", "0")) + 1)
+        try:
+            almacenamiento.guardar_metadata(nombre_contenido, metadata, etag=propiedades.etag)
+        except (ResourceModifiedError, ResourceNotFoundError):
+            continue
+        return {
+            "nombre_original": urllib.parse.unquote(metadata.get("nombre_original", "")),
+            "blob": urllib.parse.unquote(metadata.get("blob", ""))
+        }
+    raise RuntimeError("No se pudo registrar el contenido: se está modificando concurrentemente.")
+
+def liberar_contenido(sha):
+    """Resta una referencia al contenido y lo elimina cuando ya no lo usa ningún archivo."""
+    nombre_contenido = blob_contenido(sha)
+    for _ in range(MAX_REINTENTOS_INDICE):
+        try:
+            propiedades = almacenamiento.propiedades(nombre_contenido)
+        except ResourceNotFoundError:
+            return
+        metadata = dict(propiedades.metadata)
+        referencias = int(metadata.get("referencias", "1")) - 1
+        try:
+            if referencias <= 0:
+                almacenamiento.eliminar(nombre_contenido, etag=propiedades.etag)
+            else:
+                metadata["referencias"] = str(referencias)
+                almacenamiento.guardar_metadata(nombre_contenido, metadata, etag=propiedades.etag)
+            return
+        except (ResourceModifiedError, ResourceNotFoundError):
+            continue
+    raise RuntimeError("No se pudo liberar el contenido: se está modificando concurrentemente.")
+
+def blob_de_datos(archivo_info):
+    """Blob que guarda los datos de un archivo del listado: el propio, o el contenido al que referencia."""
+    return blob_contenido(archivo_info["contenido"]) if archivo_info.get("contenido") else archivo_info["blob_name"]
+
+def descargar_archivo(archivo_info):
+    """Contenido de un archivo del listado, pasando por la caché local."""
+    if archivo_info.get("contenido"):
+        # Un contenido nunca cambia para un mismo hash: el hash sirve de versión en la caché
+        sha = archivo_info["contenido"]
+        return get_cache_contenidos().obtener(
+            blob_contenido(sha), sha, lambda: (descargar_blob(blob_contenido(sha)), sha)
+        )
+    return descargar_blob(archivo_info["blob_name"], archivo_info["etag"])
+
+def generar_url_descarga(nombre_archivo, nombre_descarga=None, minutos=MINUTOS_VALIDEZ_SAS):
+    """
+    Genera una URL SAS de solo lectura y corta duración para leer el blob directamente desde Azure.
+    Con `nombre_descarga` el navegador lo descarga como adjunto con ese nombre.
+    Devuelve None si el almacenamiento no permite firmarlas (Azure sin clave de cuenta, carpeta local o memoria).
+    """
+    return almacenamiento.url_lectura(nombre_archivo, nombre_descarga, minutos)
+
+def url_firmada_en_sesion(clave, minutos, generar):
+    """
+    URL firmada de `minutos` de validez que se reutiliza en las siguientes ejecuciones de la página
+    mientras le quede al menos la mitad: si cambiara en cada rerun, el navegador no podría cachearla y
+    un reproductor de vídeo se recargaría perdiendo la posición. `generar()` crea una nueva (o None).
+    """
+    urls = st.session_state.setdefault("urls_firmadas", {})  # clave -> (url, caducidad)
+    ahora = time.time()
+    url, caduca = urls.get(clave, (None, 0.0))
+    if url is None or caduca - ahora < minutos * 30:
+        for caducada in [c for c, (_, fin) in urls.items() if fin <= ahora]:
+            del urls[caducada]
+        url = generar()
+        if url is not None:
+            urls[clave] = (url, ahora + minutos * 60)
+    return url
+
+# Reproducción de vídeos
+@st.cache_resource
+def get_servidor_video():
+    """Servidor de rangos para los vídeos, o None si no está configurado o el puerto está ocupado."""
+    if not URL_VIDEO:
+        return None
+    try:
+        return ServidorVideo(almacenamiento, SECRET_KEY, PUERTO_VIDEO, URL_VIDEO, MINUTOS_VALIDEZ_VIDEO * 60)
+    except OSError:
+        return None
+
+def url_video(archivo_info):
+    """URL con soporte de rangos para reproducir un vídeo en el navegador, o None si no hay forma de servirlo."""
+    nombre_blob = blob_de_datos(archivo_info)
+    tipo = mimetypes.guess_type(archivo_info["meta"].get("nombre_original") or archivo_info["blob_name"])[0]
+
+    def generar():
+        url = almacenamiento.url_lectura(nombre_blob, minutos=MINUTOS_VALIDEZ_VIDEO, content_type=tipo)
+        if url:
+            return url
+        servidor = get_servidor_video()
+        return servidor.url(nombre_blob, tipo) if servidor else None
+
+    # La misma URL en cada rerun: si cambia el src, st.video recarga el reproductor y se pierde la posición
+    return url_firmada_en_sesion(("video", nombre_blob, archivo_info["etag"], tipo), MINUTOS_VALIDEZ_VIDEO, generar)
+
+# Exportación en ZIP
+def trozos_blob(nombre_archivo, size, etag=None):
+    """
+    Contenido de un blob en trozos de TAMANO_TROZO_ZIP (una petición por rango), sin descargarlo entero.
+    Con `etag`, cada rango lo exige: si el archivo se sobrescribe a mitad, falla en vez de mezclar versiones.
+    """
+    for inicio in range(0, size, TAMANO_TROZO_ZIP):
+        yield almacenamiento.descargar(
+            nombre_archivo, offset=inicio, length=min(TAMANO_TROZO_ZIP, size - inicio), etag=etag
+        )[0]
+
+def limpiar_exportaciones_caducadas():
+    """Elimina los ZIP temporales cuyo enlace ya ha caducado."""
+    limite = datetime.now(timezone.utc) - timedelta(minutes=MINUTOS_VALIDEZ_EXPORTACION)
+    for blob in almacenamiento.listar(PREFIJO_EXPORTACIONES):
+        if blob.last_modified < limite:
+            try:
+                eliminar_blob(blob.name)
+            except ResourceNotFoundError:
+                pass
+
+@metricas.cronometrado("funcion", funcion="exportar_zip")
+def exportar_zip(archivos, nombre_zip, progreso=None):
+    """
+    Empaqueta los archivos (diccionarios del listado) en un ZIP con sus nombres originales.
+    Si el total no supera MAX_MB_ZIP_DIRECTO se genera en memoria y devuelve ("datos", bytes).
+    Si lo supera, el ZIP se escribe por bloques directamente en un blob temporal y devuelve
+    ("url", enlace SAS válido MINUTOS_VALIDEZ_EXPORTACION), o (None, None) si no se pueden firmar SAS.
+    """
+    contenido = list(zip(
+        [a["blob_name"] for a in archivos],
+        nombres_unicos([nombre_visible(a["blob_name"], a["meta"]) for a in archivos]),
+        [a["last_modified"] for a in archivos]
+    ))
+
+    por_blob = {a["blob_name"]: a for a in archivos}
+
+    def abrir(blob_name):
+        archivo_info = por_blob[blob_name]
+        if archivo_info["contenido"]:
+            # Los contenidos compartidos no cambian nunca: no hace falta condicionar la lectura
+            return trozos_blob(blob_de_datos(archivo_info), archivo_info["size"])
+        return trozos_blob(blob_name, archivo_info["size"], archivo_info["etag"])
+
+    if sum(a["size"] for a in archivos) <= MAX_MB_ZIP_DIRECTO * 1024 * 1024:
+        destino = BytesIO()
+        escribir_zip(destino, contenido, abrir, MAX_DESCARGAS_ZIP_SIMULTANEAS, progreso=progreso)
+        return "datos", destino.getvalue()
+
+    if not almacenamiento.firma_urls:
+        return None, None
+    limpiar_exportaciones_caducadas()
+    nombre_blob = f"{PREFIJO_EXPORTACIONES}{uuid.uuid4().hex}/{nombre_zip}"
+    bloques = []
+
+    def subir_bloque(datos):
+        block_id = base64.b64encode(f"{len(bloques):08d}".encode()).decode()
+        subir_bloque_con_reintentos(nombre_blob, block_id, datos)
+        bloques.append(block_id)
+
+    escritor = EscritorPorBloques(subir_bloque, TAMANO_BLOQUE)
+    escribir_zip(escritor, contenido, abrir, MAX_DESCARGAS_ZIP_SIMULTANEAS, progreso=progreso)
+    escritor.cerrar()
+    almacenamiento.confirmar_bloques(nombre_blob, bloques, content_type="application/zip")
+    return "url", generar_url_descarga(nombre_blob, nombre_zip, MINUTOS_VALIDEZ_EXPORTACION)
+
+# Índice de archivos por área
+def es_archivo_de_datos(nombre_blob):
+    """Indica si el blob es un archivo subido por un usuario (no metadatos, enlaces, índice ni miniaturas)."""
+    return not (
+        f"/{PREFIJO_MINIATURAS}" in nombre_blob
+        or nombre_blob.endswith(".meta.json")
+        or nombre_blob.endswith(NOMBRE_ENLACES_ANTIGUO)
+        or nombre_blob.endswith(NOMBRE_LOG_ENLACES)
+        or nombre_blob.endswith(NOMBRE_INDICE)
+    )
+
+def meta_por_defecto(nombre_blob):
+    return {"nombre_original": Path(nombre_blob).name, "comentario": "", "usuario": "N/A", "fecha": "N/A"}
+
+def entrada_indice(meta, last_modified, size, etag, miniatura=None, contenido=None):
+    return {
+        "meta": meta,
+        "last_modified": last_modified.isoformat(),
+        "size": size,
+        "etag": etag,
+        "miniatura": miniatura,
+        "contenido": contenido
+    }
+
+def leer_indice(prefix):
+    """
+    Devuelve (indice, etag) del índice del área.
+    El índice es None si no existe, está corrupto o es de otra versión (el etag permite sobrescribirlo).
+    """
+    try:
+        contenido, etag = descargar_blob_con_etag(f"{prefix}{NOMBRE_INDICE}")
+    except ResourceNotFoundError:
+        return None, None
+    try:
+        indice = json.loads(contenido)
+    except ValueError:
+        return None, etag
+    if indice.get("version") != VERSION_INDICE:
+        return None, etag
+    return indice, etag
+
+def leer_meta_sidecar(blob_name):
+    try:
+        # Intenta descargar y parsear el archivo de metadatos asociado
+        return json.loads(descargar_blob(f"{blob_name}.meta.json"))
+    except Exception:
+        # Si no hay metadatos o están corruptos, se usan valores por defecto
+        return meta_por_defecto(blob_name)
+
+def leer_metas_en_paralelo(blob_names):
+    """
+    Descarga los .meta.json de varios archivos con un pool de hilos acotado (MAX_WORKERS_METADATOS).
+    Todos los hilos comparten el pool de conexiones del cliente cacheado. Devuelve los metadatos en el mismo orden.
+    """
+    if not blob_names:
+        return []
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS_METADATOS, len(blob_names))) as executor:
+        return list(executor.map(leer_meta_sidecar, blob_names))
+
+@metricas.cronometrado("funcion", funcion="reconstruir_indice")
+def reconstruir_indice(prefix):
+    """
+    Regenera el índice del área a partir de los metadatos de los blobs (nativos o .meta.json) y lo guarda.
+    Devuelve (indice, etag).
+    """
+    for _ in range(MAX_REINTENTOS_INDICE):
+        _, etag_actual = leer_indice(prefix)
+        blobs = []
+        sidecars = set()
+        miniaturas = {}
+        for blob in almacenamiento.listar(prefix):
+            if es_archivo_de_datos(blob.name):
+                blobs.append(blob)
+            elif blob.name.endswith(".meta.json"):
+                sidecars.add(blob.name)
+            elif blob.name.startswith(f"{prefix}{PREFIJO_MINIATURAS}"):
+                miniaturas[blob.name] = {"blob": blob.name, "etag": blob.etag}
+
+        # Los metadatos nativos llegan con el listado; solo se piden los .meta.json de archivos
+        # sin migrar que lo tengan, el resto usa los valores por defecto
+        metas = {blob.name: metadata_blob_a_meta(blob.metadata) for blob in blobs}
+        con_sidecar = [
+            blob.name for blob in blobs
+            if metas[blob.name] is None and f"{blob.name}.meta.json" in sidecars
+        ]
+        metas.update(zip(con_sidecar, leer_metas_en_paralelo(con_sidecar)))
+
+        archivos = {}
+        for blob in sorted(blobs, key=lambda b: b.name):
+            meta = metas.get(blob.name) or meta_por_defecto(blob.name)
+            # Las referencias a un contenido compartido son blobs vacíos: el tamaño real va en sus metadatos
+            sha, size = referencia_desde_metadata(blob.metadata)
+            archivos[blob.name] = entrada_indice(
+                meta, blob.last_modified, size if sha else blob.size, blob.etag,
+                miniaturas.get(ruta_miniatura(prefix, blob.name)), sha
+            )
+
+        indice = {"version": VERSION_INDICE, "archivos": archivos}
+        try:
+            etag = subir_a_blob_condicional(
+                f"{prefix}{NOMBRE_INDICE}", json.dumps(indice, ensure_ascii=False).encode("utf-8"), etag_actual
+            )
+            return indice, etag
+        except (ResourceExistsError, ResourceModifiedError):
+            # Otro proceso ha escrito el índice mientras lo reconstruíamos
+            indice, etag = leer_indice(prefix)
+            if indice is not None:
+                return indice, etag
+    # Si no se pudo guardar, al menos se devuelve el índice calculado
+    return indice, None
+
+def actualizar_indice(prefix, blob_names, modificar):
+    """
+    Aplica `modificar(archivos)` sobre el índice del área con escritura condicional por ETag.
+    Si otro proceso lo modificó entre la lectura y la escritura, se vuelve a leer y se reintenta.
+    Después aplica los cambios de `blob_names` al estado en memoria del área, sin recargarlo.
+    """
+    for _ in range(MAX_REINTENTOS_INDICE):
+        indice, etag = leer_indice(prefix)
+        if indice is None:
+            # La reconstrucción ya refleja el estado actual del almacenamiento
+            reemplazar_estado_area(prefix, *reconstruir_indice(prefix))
+            return
+        modificar(indice["archivos"])
+        try:
+            etag_nuevo = subir_a_blob_condicional(
+                f"{prefix}{NOMBRE_INDICE}", json.dumps(indice, ensure_ascii=False).encode("utf-8"), etag
+            )
+        except (ResourceExistsError, ResourceModifiedError):
+            continue
+        aplicar_cambios_estado_area(prefix, etag, etag_nuevo, indice, blob_names)
+        return
+    # Si no se pudo actualizar, se elimina para forzar su reconstrucción en la próxima lectura
+    try:
+        eliminar_blob(f"{prefix}{NOMBRE_INDICE}")
+    except ResourceNotFoundError:
+        pass
+    invalidar_estado_area(prefix)
+
+def indexar_archivos(prefix, nuevas):
+    """Añade o reemplaza en el índice del área, con una sola escritura, las entradas {blob_name: entrada} recién subidas."""
+    actualizar_indice(prefix, list(nuevas), lambda archivos: archivos.update(nuevas))
+
+def actualizar_meta_en_indice(prefix, blob_name, meta, etag=None):
+    """Reemplaza los metadatos (y el ETag si ha cambiado) de un archivo ya indexado, p. ej. al editar el comentario."""
+    def modificar(archivos):
+        if blob_name in archivos:
+            archivos[blob_name]["meta"] = meta
+            if etag:
+                archivos[blob_name]["etag"] = etag
+    actualizar_indice(prefix, [blob_name], modificar)
+
+def desindexar_archivo(prefix, blob_name):
+    """Quita un archivo del índice del área tras eliminarlo."""
+    actualizar_indice(prefix, [blob_name], lambda archivos: archivos.pop(blob_name, None))
+
+# Miniaturas (derivados) de los archivos
+def ruta_miniatura(prefix, blob_name):
+    return f"{prefix}{PREFIJO_MINIATURAS}{blob_name[len(prefix):]}.webp"
+
+def crear_miniatura(prefix, blob_name, origen):
+    """
+    Genera y sube la miniatura de un archivo a partir de `origen` (objeto fichero, o ruta/URL para vídeos).
+    Devuelve {"blob", "etag"} para guardarlo en el índice, o None si el tipo no admite miniatura.
+    """
+    contenido = generar_miniatura(origen, Path(blob_name).suffix)
+    if contenido is None:
+        return None
+    nombre_miniatura = ruta_miniatura(prefix, blob_name)
+    propiedades = subir_a_blob(nombre_miniatura, contenido, content_type="image/webp")
+    return {"blob": nombre_miniatura, "etag": propiedades["etag"]}
+
+def generar_miniaturas_pendientes(prefix):
+    """
+    Genera en lote las miniaturas de los archivos del área que aún no la tienen y las registra
+    en el índice con una sola escritura. Devuelve cuántas se han generado.
+    """
+    pendientes = [
+        archivo_info for archivo_info in get_archivos_area(prefix)
+        if not archivo_info["miniatura"] and admite_miniatura(Path(archivo_info["blob_name"]).suffix.lower())
+    ]
+
+    def procesar(archivo_info):
+        blob_name = archivo_info["blob_name"]
+        if Path(blob_name).suffix.lower() in EXTENSIONES_VIDEO:
+            # ffmpeg lee directamente desde Azure solo el trozo que necesita
+            url = generar_url_descarga(blob_de_datos(archivo_info))
+            if url:
+                return crear_miniatura(prefix, blob_name, url)
+            # Se cierra antes de pasárselo a ffmpeg: en Windows no se puede reabrir mientras siga abierto
+            tmp = tempfile.NamedTemporaryFile(suffix=Path(blob_name).suffix, delete=False)
+            try:
+                with tmp:
+                    almacenamiento.descargar_en(blob_de_datos(archivo_info), tmp)
+                return crear_miniatura(prefix, blob_name, tmp.name)
+            finally:
+                os.remove(tmp.name)
+        return crear_miniatura(prefix, blob_name, BytesIO(descargar_archivo(archivo_info)))
+
+    if not pendientes:
+        return 0
+    with ThreadPoolExecutor(max_workers=min(MAX_WORKERS_METADATOS, len(pendientes))) as executor:
+        generadas = {
+            archivo_info["blob_name"]: miniatura
+            for archivo_info, miniatura in zip(pendientes, executor.map(procesar, pendientes))
+            if miniatura
+        }
+
+    def modificar(archivos):
+        for blob_name, miniatura in generadas.items():
+            if blob_name in archivos:
+                archivos[blob_name]["miniatura"] = miniatura
+    if generadas:
+        actualizar_indice(prefix, list(generadas), modificar)
+    return len(generadas)
+
+# Estado en memoria por área, compartido por todas las sesiones del proceso: archivos del índice,
+# mapa nombre_original -> blob_name (detección de duplicados al subir), índice de búsqueda y enlaces, cada uno con el
+# ETag del blob del que procede. Se invalida y actualiza por área, nunca de forma global.
+@st.cache_resource
+def get_estados_areas():
+    return {"lock": threading.Lock(), "areas": {}}
+
+def get_estado_area_sin_cargar(prefix):
+    """Devuelve el estado del área (creándolo vacío si no existe) sin cargar ni revalidar nada."""
+    registro = get_estados_areas()
+    with registro["lock"]:
+        if prefix not in registro["areas"]:
+            registro["areas"][prefix] = {
+                "lock": threading.Lock(),
+                "archivos": None, "nombres": {}, "busqueda": IndiceBusqueda(), "etag": None, "comprobado": 0.0,
+                "enlaces": None, "enlaces_etag": None, "enlaces_comprobado": 0.0
+            }
+        return registro["areas"][prefix]
+
+def get_estado_area(prefix):
+    """
+    Devuelve el estado del área con sus archivos cargados.
+    Como mucho cada INTERVALO_COMPROBACION_S se compara el ETag del índice (HEAD) y solo si ha
+    cambiado se vuelve a descargar.
+    """
+    estado = get_estado_area_sin_cargar(prefix)
+    with estado["lock"]:
+        if estado["archivos"] is not None:
+            if time.monotonic() - estado["comprobado"] < INTERVALO_COMPROBACION_S:
+                metricas.contar("cache_total", cache="areas", resultado="acierto")
+                return estado
+            if estado["etag"] and estado["etag"] == etag_blob(f"{prefix}{NOMBRE_INDICE}"):
+                metricas.contar("cache_total", cache="areas", resultado="revalidado")
+                estado["comprobado"] = time.monotonic()
+                return estado
+
+        metricas.contar("cache_total", cache="areas", resultado="fallo")
+        indice, etag = leer_indice(prefix)
+        if indice is None:
+            indice, etag = reconstruir_indice(prefix)
+        _cargar_estado(estado, indice, etag)
+        return estado
+
+def _cargar_estado(estado, indice, etag):
+    estado["archivos"] = {}
+    estado["nombres"] = {}
+    estado["busqueda"] = IndiceBusqueda()
+    for blob_name, entrada in indice["archivos"].items():
+        _aplicar_entrada(estado, blob_name, entrada)
+    estado["etag"] = etag
+    estado["comprobado"] = time.monotonic()
+
+def _aplicar_entrada(estado, blob_name, entrada):
+    """Aplica un único cambio al estado: alta o reemplazo (entrada) o baja (None)."""
+    anterior = estado["archivos"].pop(blob_name, None)
+    nombre_nuevo = nombre_visible(blob_name, entrada["meta"]) if entrada is not None else None
+    if anterior is not None:
+        nombre = nombre_visible(blob_name, anterior["meta"])
+        if nombre != nombre_nuevo and estado["nombres"].get(nombre) == blob_name:
+            # Si otro archivo del área tiene el mismo nombre, la entrada pasa a él en vez de borrarse
+            otro = next(
+                (otro for otro, e in estado["archivos"].items() if nombre_visible(otro, e["meta"]) == nombre), None
+            )
+            if otro is None:
+                del estado["nombres"][nombre]
+            else:
+                estado["nombres"][nombre] = otro
+        estado["busqueda"].eliminar(blob_name)
+    if entrada is not None:
+        estado["archivos"][blob_name] = entrada
+        if anterior is None or nombre != nombre_nuevo or nombre_nuevo not in estado["nombres"]:
+            estado["nombres"][nombre_nuevo] = blob_name
+        estado["busqueda"].agregar(blob_name, nombre_nuevo, entrada["meta"].get("comentario", ""))
+
+def aplicar_cambios_estado_area(prefix, etag_leido, etag_nuevo, indice, blob_names):
+    """
+    Tras escribir el índice, actualiza el estado en memoria del área.
+    Si el estado estaba al día (mismo ETag que el índice leído) solo se aplican las entradas cambiadas;
+    si no, se sustituye entero por el índice recién escrito.
+    """
+    estado = get_estado_area_sin_cargar(prefix)
+    with estado["lock"]:
+        if estado["archivos"] is not None and estado["etag"] == etag_leido:
+            for blob_name in blob_names:
+                _aplicar_entrada(estado, blob_name, indice["archivos"].get(blob_name))
+            estado["etag"] = etag_nuevo
+            estado["comprobado"] = time.monotonic()
+        else:
+            _cargar_estado(estado, indice, etag_nuevo)
+
+def reemplazar_estado_area(prefix, indice, etag):
+    estado = get_estado_area_sin_cargar(prefix)
+    with estado["lock"]:
+        _cargar_estado(estado, indice, etag)
+
+def invalidar_estado_area(prefix):
+    """Fuerza que la próxima lectura del área vuelva a descargar su índice."""
+    estado = get_estado_area_sin_cargar(prefix)
+    with estado["lock"]:
+        estado["archivos"] = None
+        estado["nombres"] = {}
+        estado["busqueda"] = IndiceBusqueda()
+
+def buscar_en_areas(prefixes, consulta):
+    """
+    Busca en el nombre y el comentario de los archivos de las áreas, sin distinguir tildes ni mayúsculas.
+    Todos los términos deben aparecer (como palabra o prefijo). Devuelve los blob_name por relevancia,
+    mezclando los resultados de todas las áreas.
+    """
+    resultados = []
+    for prefix in prefixes:
+        estado = get_estado_area(prefix)
+        with estado["lock"]:
+            resultados += estado["busqueda"].buscar_con_puntuacion(consulta)
+    return [blob_name for blob_name, _ in sorted(resultados, key=lambda r: (-r[1], r[0]))]
+
+def archivo_desde_entrada(blob_name, entrada):
+    return {
+        "blob_name": blob_name,
+        "last_modified": datetime.fromisoformat(entrada["last_modified"]),
+        "size": entrada["size"],
+        "etag": entrada["etag"],
+        "miniatura": entrada.get("miniatura"),
+        "contenido": entrada.get("contenido"),
+        "meta": dict(entrada["meta"])
+    }
+
+def nombre_visible(blob_name, meta):
+    return meta.get("nombre_original", Path(blob_name).name)
 
 # Funciones auxiliares
 def generar_id_archivo(nombre_archivo):
@@ -217,6 +1195,153 @@ def icono_archivo(nombre_archivo):
     else:
         return "📁"
 
+def formato_tamano(num_bytes):
+    if num_bytes >= 1024 ** 3:
+        return f"{num_bytes / 1024 ** 3:.1f} GB"
+    return f"{num_bytes / 1024 ** 2:.1f} MB"
+
+def insignia_area(nombre_area):
+    """Etiqueta con el nombre del área, para distinguir los archivos en la vista de todas las áreas."""
+    return (
+        "<span style='background-color: #e8f0fe; color: #1a56db; border-radius: 0.75rem; "
+        f"padding: 0.1rem 0.6rem; font-size: 0.8rem; font-weight: 600;'>{nombre_area}</span>"
+    )
+
+def etiqueta_descarga(nombre_archivo):
+    ext = Path(nombre_archivo).suffix.lower()
+    if ext == ".pdf":
+        return "📥 Descargar PDF"
+    elif ext in [".xlsx", ".xls", ".csv"]:
+        return "📥 Descargar Excel/CSV"
+    elif ext in [".mp4", ".mov"]:
+        return "📥 Descargar Vídeo"
+    elif ext in [".jpg", ".jpeg", ".png", ".gif"]:
+        return "📥 Descargar Imagen"
+    else:
+        return "📥 Descargar Archivo"
+
+def mostrar_boton_descarga(archivo_info, nombre_descarga):
+    """
+    Muestra el botón de descarga de un archivo sin transferir su contenido al pintar la cuadrícula.
+    Con SAS el navegador descarga directamente desde Azure; si no, el contenido se trae bajo demanda.
+    """
+    nombre_blob = archivo_info["blob_name"]
+    etiqueta = etiqueta_descarga(nombre_descarga)
+    if MODO_DESCARGA == "sas":
+        url = generar_url_descarga(blob_de_datos(archivo_info), nombre_descarga)
+        if url:
+            st.link_button(etiqueta, url)
+            return
+
+    # Descarga diferida: solo se descarga el blob en la ejecución en la que el usuario lo pide
+    if st.button("📦 Preparar descarga", key=f"preparar_{nombre_blob}"):
+        st.download_button(
+            etiqueta,
+            data=descargar_archivo(archivo_info),
+            file_name=nombre_descarga,
+            key=f"descargar_{nombre_blob}",
+            on_click="ignore"
+        )
+
+def filas_histogramas(nombre, etiqueta, columna):
+    """Filas de tabla (media, p95 y máximo en ms) de los histogramas `nombre`, una por valor de `etiqueta`."""
+    filas = []
+    for etiquetas, h in sorted(metricas.histogramas(nombre).items()):
+        filas.append({
+            columna: dict(etiquetas).get(etiqueta, ""), "Llamadas": h.cuenta,
+            "Media ms": round(h.suma / h.cuenta * 1000, 1),
+            "p95 ms": round(h.percentil(0.95) * 1000, 1), "Máx ms": round(h.maximo * 1000, 1)
+        })
+    return filas
+
+def mostrar_panel_metricas():
+    """Panel de métricas del proceso para administradores, con exportación en formato Prometheus."""
+    stats_cache = get_cache_contenidos().estadisticas()
+    for clave in ("aciertos", "fallos", "expulsiones", "bytes"):
+        metricas.fijar(f"cache_contenidos_{clave}", stats_cache[clave])
+
+    st.markdown("**Almacenamiento**")
+    filas = filas_histogramas("almacenamiento_segundos", "operacion", "Operación")
+    errores, transferidos = {}, {}
+    for etiquetas, valor in metricas.contadores("almacenamiento_errores_total").items():
+        operacion = dict(etiquetas)["operacion"]
+        errores[operacion] = errores.get(operacion, 0) + valor
+    for etiquetas, valor in metricas.contadores("almacenamiento_bytes_total").items():
+        transferidos[dict(etiquetas)["operacion"]] = valor
+    for fila in filas:
+        fila["Errores"] = int(errores.get(fila["Operación"], 0))
+        fila["MB"] = round(transferidos.get(fila["Operación"], 0) / 1024 / 1024, 2)
+    if filas:
+        st.dataframe(filas, hide_index=True)
+    else:
+        st.caption("Sin operaciones todavía.")
+
+    st.markdown("**Cachés**")
+    resultados = {}
+    for etiquetas, valor in metricas.contadores("cache_total").items():
+        etiquetas = dict(etiquetas)
+        resultados.setdefault(etiquetas["cache"], {})[etiquetas["resultado"]] = int(valor)
+    resultados["contenidos"] = {"acierto": stats_cache["aciertos"], "fallo": stats_cache["fallos"]}
+    lineas = []
+    for cache, r in sorted(resultados.items()):
+        total = sum(r.values())
+        if total:
+            lineas.append(
+                f"- {cache}: {(r.get('acierto', 0) + r.get('revalidado', 0)) / total:.0%} sin descarga "
+                f"({r.get('acierto', 0)} aciertos, {r.get('revalidado', 0)} revalidados, {r.get('fallo', 0)} fallos)"
+            )
+    st.markdown("\n".join(lineas) or "Sin datos todavía.")
+
+    filas = filas_histogramas("funcion_segundos", "funcion", "Función")
+    filas += [
+        {**fila, "Función": f"correo ({fila['Función']})"}
+        for fila in filas_histogramas("correo_segundos", "resultado", "Función")
+    ]
+    if filas:
+        st.markdown("**Funciones**")
+        st.dataframe(filas, hide_index=True)
+
+    st.markdown("**Últimas ejecuciones de la página (ms)**")
+    filas = []
+    for anterior in metricas.ultimas_ejecuciones():
+        fila = {
+            "Hora": datetime.fromtimestamp(anterior.fecha, pytz.timezone("Europe/Madrid")).strftime("%H:%M:%S"),
+            "Total": round(anterior.duracion_s * 1000) if anterior.duracion_s is not None else None
+        }
+        fila.update({nombre: round(segundos * 1000) for nombre, segundos in list(anterior.tramos)})
+        filas.append(fila)
+    st.dataframe(filas, hide_index=True)
+
+    st.download_button(
+        "⬇️ Exportar (Prometheus)", data=metricas.prometheus(), file_name="metricas.prom",
+        mime="text/plain", on_click="ignore"
+    )
+
+def mostrar_miniatura(miniatura):
+    """Muestra la miniatura de un archivo: unos pocos KB en lugar del archivo original."""
+    # La misma URL en cada rerun, para que el navegador pueda cachear la imagen
+    url = url_firmada_en_sesion(
+        ("miniatura", miniatura["blob"], miniatura["etag"]), MINUTOS_VALIDEZ_SAS,
+        lambda: generar_url_descarga(miniatura["blob"])
+    ) if MODO_DESCARGA == "sas" else None
+    if url:
+        st.image(url, use_container_width=True)
+    else:
+        st.image(descargar_blob(miniatura["blob"], miniatura["etag"]), use_container_width=True)
+
+def crear_token_sesion(usuario, area, permisos, rol):
+    """Token firmado (y con fecha, para caducar) con todos los datos de la sesión."""
+    return serializer.dumps(
+        {"usuario": usuario, "area": area, "permisos": permisos, "rol": rol}, salt=SALT_SESION
+    )
+
+def leer_token_sesion(token):
+    """Devuelve los datos de la sesión o None si el token es inválido o ha caducado."""
+    try:
+        return serializer.loads(token, salt=SALT_SESION, max_age=DIAS_VALIDEZ_SESION * 24 * 3600)
+    except (SignatureExpired, BadSignature):
+        return None
+
 # Procesar token desde URL
 params      = st.query_params
 token_param = params.get("token")
@@ -225,10 +1350,8 @@ token_param = params.get("token")
 # --- GESTOR DE ACCIONES (Logout) ---
 if params.get("action") == "logout":
     # Borramos las cookies del navegador
-    if cookies.get("usuario"): del cookies["usuario"]
-    if cookies.get("area"): del cookies["area"]
-    if cookies.get("permisos"): del cookies["permisos"]
-    if cookies.get("rol"): del cookies["rol"]
+    for nombre_cookie in ["sesion"] + COOKIES_SESION_ANTIGUAS:
+        if cookies.get(nombre_cookie): del cookies[nombre_cookie]
     cookies.save()
     # Limpiamos la sesión del servidor
     st.session_state.clear()
@@ -261,32 +1384,40 @@ if token_param:
 
         if st.button("Cambiar contraseña"):
             if nueva and nueva == confirmar:
-                hashed = bcrypt.hashpw(nueva.encode(), bcrypt.gensalt()).decode()
-                usuarios_df = cargar_usuarios_desde_blob()
-                usuarios_df.loc[usuarios_df["mail"] == email, "contraseña"] = hashed
-                guardar_usuarios_en_blob(usuarios_df)
-                cargar_usuarios_desde_blob.clear() 
-                st.success("🔄 Contraseña actualizada. Por favor vuelve a iniciar sesión.")
+                hashed = get_verificador().hashear(nueva)
+                if actualizar_usuario(email, {"contraseña": hashed}):
+                    st.success("🔄 Contraseña actualizada. Por favor vuelve a iniciar sesión.")
+                else:
+                    # La cuenta se ha borrado (o cambiado de correo) después de pedir el enlace
+                    st.error("❌ Esta cuenta ya no existe. Contacta con un administrador.")
             else:
                 st.error("❌ Las contraseñas no coinciden.")
 
         st.markdown("</div>", unsafe_allow_html=True)
         st.stop()
 
-# Si la sesión del servidor está vacía pero tenemos cookies válidas, restauramos la sesión.
-if "usuario" not in st.session_state and cookies.get("usuario"):
+# Si la sesión del servidor está vacía pero tenemos un token de sesión válido, restauramos la sesión.
+# No hace falta cargar la tabla de usuarios: solo se usa en los formularios de acceso y recuperación.
+if "usuario" not in st.session_state and cookies.get("sesion"):
+    datos_sesion = leer_token_sesion(cookies.get("sesion"))
+    if datos_sesion:
+        st.session_state.update(datos_sesion)
+elif "usuario" not in st.session_state and cookies.get("usuario"):
+    # Sesiones iniciadas con la versión anterior (una cookie por campo): se convierten al token
+    permisos_cookie = cookies.get("permisos")
     st.session_state.usuario = cookies.get("usuario")
     st.session_state.area = cookies.get("area")
-    permisos_cookie = cookies.get("permisos")
-    if permisos_cookie:
-        st.session_state.permisos = permisos_cookie.split(",")
-    else:
-        st.session_state.permisos = []
+    st.session_state.permisos = permisos_cookie.split(",") if permisos_cookie else []
     st.session_state.rol = cookies.get("rol")
+    cookies["sesion"] = crear_token_sesion(
+        st.session_state.usuario, st.session_state.area, st.session_state.permisos, st.session_state.rol
+    )
+    for nombre_cookie in COOKIES_SESION_ANTIGUAS:
+        if cookies.get(nombre_cookie):
+            del cookies[nombre_cookie]
+    cookies.save()
 
 # --- LOGIN ---
-usuarios_df = cargar_usuarios_desde_blob()
-
 # --- LOGO Y TÍTULO --
 if "usuario" not in st.session_state:
     logo_path = Path("assets/logo.png")
@@ -334,20 +1465,28 @@ if "usuario" not in st.session_state:
         contrasena_input = st.text_input("Contraseña", type="password")
 
         if st.button("Acceder"):
-            user_row = usuarios_df[usuarios_df["mail"] == usuario_input]
-            if (not user_row.empty and
-                bcrypt.checkpw(contrasena_input.encode(), user_row.iloc[0]["contraseña"].encode())):
-
-                st.session_state.usuario = user_row.iloc[0]["usuario"]
-                st.session_state.area = user_row.iloc[0]["area"]
-                st.session_state.permisos = user_row.iloc[0]["permisos"].split(",")
-                st.session_state.rol = user_row.iloc[0]["rol"]
-
-                # Guardar también en cookies
-                cookies["usuario"] = st.session_state.usuario
-                cookies["area"] = st.session_state.area
-                cookies["permisos"] = ",".join(st.session_state.permisos)
-                cookies["rol"] = st.session_state.rol
+            user_row = buscar_usuario(usuario_input)
+            verificacion = get_verificador().verificar(
+                usuario_input, ip_cliente(), contrasena_input, user_row["contraseña"] if user_row else None
+            )
+            if verificacion.espera_s:
+                st.error(f"Demasiados intentos fallidos. Vuelve a intentarlo en {int(verificacion.espera_s // 60) + 1} min.")
+            elif verificacion.ocupado:
+                st.warning("Hay muchos accesos en este momento. Vuelve a intentarlo en unos segundos.")
+            elif verificacion.correcta:
+                if verificacion.nuevo_hash:
+                    # El hash guardado usaba otro coste: se actualiza de forma transparente
+                    actualizar_usuario(usuario_input, {"contraseña": verificacion.nuevo_hash})
+
+                st.session_state.usuario = user_row["usuario"]
+                st.session_state.area = user_row["area"]
+                st.session_state.permisos = user_row["permisos"].split(",")
+                st.session_state.rol = user_row["rol"]
+
+                # Guardar también en la cookie, como un único token firmado
+                cookies["sesion"] = crear_token_sesion(
+                    st.session_state.usuario, st.session_state.area, st.session_state.permisos, st.session_state.rol
+                )
                 cookies.save()
 
                 st.rerun()
@@ -360,7 +1499,7 @@ if "usuario" not in st.session_state:
         mail_recup = st.text_input("Introduce tu correo para recuperación", key="recup")
         if st.button("Enviar enlace de recuperación"):
             
-            if mail_recup in usuarios_df["mail"].values:
+            if buscar_usuario(mail_recup) is not None:
                 token = serializer.dumps(mail_recup, salt=SALT)
                 send_recovery_email(mail_recup, token)
             else:
@@ -375,6 +1514,8 @@ if "usuario" in st.session_state:
         st.query_params["action"] = "logout"
 
 
+ejecucion.tramo("sesion")
+
 # --- VARIABLES DE SESIÓN ---
 usuario_actual = st.session_state.usuario
 area_original = st.session_state.area
@@ -387,6 +1528,16 @@ area_map = {
     "Cuerpo Técnico": "cuerpo_tecnico",
     "Servicios Médicos": "servicios_medicos"
 }
+# Opción de los usuarios con acceso a todas las áreas para verlas juntas en una sola página
+TODAS_LAS_AREAS = "Todas las áreas"
+
+def prefijo_de_blob(blob_name):
+    return blob_name.split("/", 1)[0] + "/"
+
+def area_de_blob(blob_name):
+    """Nombre visible del área a la que pertenece un blob (o un prefijo)."""
+    prefijo = blob_name.split("/", 1)[0]
+    return next((nombre for nombre, carpeta in area_map.items() if carpeta == prefijo), prefijo)
 
 # Sidebar con logo y temporada
 if "usuario" in st.session_state:
@@ -412,155 +1563,319 @@ st.sidebar.success(f"{usuario_actual} ({rol})")
 # --- SELECCIÓN DE ÁREA (si tiene acceso total) ---
 if area_original == "todas":
     st.sidebar.markdown("---")
-    area_opciones = list(area_map.keys())
+    area_opciones = [TODAS_LAS_AREAS] + list(area_map.keys())
     area = st.sidebar.selectbox("Selecciona área", area_opciones)
 else:
     area = area_original
 
 # --- DEFINICIÓN DE PREFIJO PARA BLOB STORAGE ---
-azure_prefix = area_map[area] + "/" 
-
-# Llamamos a las funciones cacheadas UNA SOLA VEZ aquí.
-enlaces_lista = get_enlaces(azure_prefix)
-archivos_sidebar = get_archivos_area(azure_prefix) 
+# En la vista de todas las áreas se cargan y se muestran juntas; cada archivo o enlace se edita en
+# su propia área, y las subidas y enlaces nuevos van al área que se elija
+todas_las_areas = area == TODAS_LAS_AREAS
+areas_vista = list(area_map) if todas_las_areas else [area]
+prefijos_vista = [area_map[nombre_area] + "/" for nombre_area in areas_vista]
+azure_prefix = None if todas_las_areas else prefijos_vista[0]
+
+# Llamamos a las funciones cacheadas UNA SOLA VEZ aquí (todas las áreas de la vista a la vez).
+datos_areas = cargar_areas(prefijos_vista)
+archivos_sidebar, enlaces_lista, resumen_areas = [], [], []
+for nombre_area, prefijo in zip(areas_vista, prefijos_vista):
+    archivos_area, enlaces_area = datos_areas[prefijo]
+    for archivo_info in archivos_area:
+        archivo_info["area"] = nombre_area
+    archivos_sidebar += archivos_area
+    enlaces_lista += [(prefijo, id_enlace, nombre, enlace) for id_enlace, nombre, enlace in enlaces_area]
+    resumen_areas.append(
+        (nombre_area, len(archivos_area), sum(a["size"] for a in archivos_area), len(enlaces_area))
+    )
+ejecucion.tramo("datos_area")
 
 # Ordenar por fecha de modificación
 archivos_sidebar.sort(key=lambda x: x["last_modified"], reverse=True)
 
 # --- LISTADO DE ARCHIVOS EN SIDEBAR ---
 with st.sidebar.expander(f"📂 Archivos disponibles: {len(archivos_sidebar)}"):
-    for archivo_info in archivos_sidebar:
-        # La nueva estructura de datos es un diccionario
-        visible_name = archivo_info["meta"].get("nombre_original", Path(archivo_info["blob_name"]).name)
+    # Lista compacta (un único bloque markdown) con los archivos más recientes
+    lineas = []
+    for archivo_info in archivos_sidebar[:MAX_ARCHIVOS_SIDEBAR]:
+        visible_name = nombre_visible(archivo_info["blob_name"], archivo_info["meta"])
         ancla = generar_id_archivo(visible_name)
         icono = icono_archivo(visible_name)
-        st.markdown(f"- {icono} [{visible_name}](#{ancla})")
+        area_archivo = f" · *{archivo_info['area']}*" if todas_las_areas else ""
+        lineas.append(f"- {icono} [{visible_name}](#{ancla}){area_archivo}")
+    st.markdown("\n".join(lineas))
+    if len(archivos_sidebar) > MAX_ARCHIVOS_SIDEBAR:
+        st.caption(f"… y {len(archivos_sidebar) - MAX_ARCHIVOS_SIDEBAR} más. Usa el buscador para encontrarlos.")
 
 # --- ENLACES EN SIDEBAR (usando la variable ya cargada) ---
 with st.sidebar.expander(f"🔗 Enlaces compartidos: {len(enlaces_lista)}"):
-    for nombre, enlace in enlaces_lista:
-        st.markdown(f"- [{nombre}]({enlace})")
+    for prefijo, _, nombre, enlace in enlaces_lista:
+        st.markdown(f"- [{nombre}]({enlace})" + (f" · *{area_de_blob(prefijo)}*" if todas_las_areas else ""))
+
+# --- MANTENIMIENTO (solo administradores) ---
+if rol == ROL_ADMIN:
+    stats_cache = get_cache_contenidos().estadisticas()
+    st.sidebar.caption(
+        f"💾 Caché local: {stats_cache['aciertos']} aciertos, {stats_cache['fallos']} fallos, "
+        f"{stats_cache['expulsiones']} expulsiones · {stats_cache['bytes'] / 1024 / 1024:.1f} "
+        f"de {stats_cache['max_bytes'] / 1024 / 1024:.0f} MB"
+    )
+    if st.sidebar.button("🔄 Reconstruir índice del área", help="Regenera el índice desde los metadatos de los archivos"):
+        for prefijo in prefijos_vista:
+            reemplazar_estado_area(prefijo, *reconstruir_indice(prefijo))
+        st.rerun()
+    if st.sidebar.button("🖼️ Generar miniaturas pendientes", help="Crea las miniaturas de los archivos que aún no la tienen"):
+        with st.spinner("Generando miniaturas…"):
+            generadas = sum(generar_miniaturas_pendientes(prefijo) for prefijo in prefijos_vista)
+        st.sidebar.success(f"Miniaturas generadas: {generadas}")
+    if METRICAS:
+        with st.sidebar.expander("📊 Métricas del proceso"):
+            mostrar_panel_metricas()
+
 
+ejecucion.tramo("sidebar")
 
 # --- INTERFAZ PRINCIPAL ---
 st.markdown(f"## {area}")
+if todas_las_areas:
+    # Resumen por área y total
+    columnas_resumen = st.columns(len(resumen_areas) + 1)
+    total = (
+        "Total", sum(r[1] for r in resumen_areas), sum(r[2] for r in resumen_areas), sum(r[3] for r in resumen_areas)
+    )
+    for columna, (nombre_area, num_archivos, num_bytes, num_enlaces) in zip(columnas_resumen, resumen_areas + [total]):
+        columna.metric(nombre_area, f"{num_archivos} archivos")
+        columna.caption(f"{formato_tamano(num_bytes)} · {num_enlaces} enlaces")
 st.markdown("### 🔎 Buscar archivos")
 search_query = st.text_input("Buscar por nombre o descripción").lower()
 
 
 #--- SUBIDA DE ARCHIVOS ---
 
-def find_existing_blob_by_original_name(original_name_to_find, prefix):
+# Qué hacer con cada archivo del lote cuyo nombre ya existe en el área
+POLITICAS_CONFLICTO = ["Omitir", "Sobrescribir", "Conservar ambos"]
+
+def nombres_en_area(prefix):
     """
-    Busca en Azure Blob Storage si ya existe un blob con el mismo nombre original.
-    Devuelve el nombre del blob si lo encuentra, de lo contrario None.
+    Copia del mapa nombre_original -> blob_name del área, para resolver en una sola pasada todos
+    los conflictos de nombre de un lote. Es una consulta al estado en memoria, sin tráfico con Azure.
     """
-    for blob in container_client.list_blobs(name_starts_with=prefix):
-        # Nos interesan los archivos de metadatos para leer el nombre original
-        if blob.name.endswith(".meta.json"):
-            try:
-                meta_bytes = container_client.get_blob_client(blob.name).download_blob().readall()
-                meta = json.loads(meta_bytes)
-                # Si el nombre original coincide, hemos encontrado el archivo
-                if meta.get("nombre_original") == original_name_to_find:
-                    # Devolvemos el nombre del blob de datos (sin .meta.json)
-                    return blob.name.replace(".meta.json", "")
-            except Exception:
-                # Si hay un error al leer un meta, lo ignoramos y continuamos
-                continue
-    return None
+    estado = get_estado_area(prefix)
+    with estado["lock"]:
+        return dict(estado["nombres"])
+
+def nombre_libre(nombre, ocupados):
+    """Primer nombre "informe (2).pdf", "informe (3).pdf"... que no esté en `ocupados`."""
+    ruta = Path(nombre)
+    n = 2
+    while f"{ruta.stem} ({n}){ruta.suffix}" in ocupados:
+        n += 1
+    return f"{ruta.stem} ({n}){ruta.suffix}"
+
+def subida_anterior_visible(anterior, sha):
+    """
+    Indica si se puede decir al usuario dónde estaba ya un contenido repetido: solo si tiene acceso al
+    área de la primera subida y ese archivo sigue existiendo y apuntando al mismo contenido.
+    """
+    if area_original != "todas" and prefijo_de_blob(anterior["blob"]) != f"{area_map.get(area_original)}/":
+        return False
+    try:
+        metadata = almacenamiento.propiedades(anterior["blob"]).metadata
+    except ResourceNotFoundError:
+        return False
+    return referencia_desde_metadata(metadata)[0] == sha
 
 def fecha_actual_madrid():
     return datetime.now(pytz.timezone("Europe/Madrid")).strftime("%Y-%m-%d %H:%M:%S")
 
+@metricas.cronometrado("funcion", funcion="subir_lote")
+def subir_lote(prefix, subidas):
+    """
+    Sube un lote de archivos del file_uploader, `subidas` = [(blob_name, fichero, meta)].
+    Hasta MAX_SUBIDAS_SIMULTANEAS archivos se suben a la vez, con una barra de progreso común.
+    Después todos se registran en el índice del área con una única escritura.
+    Devuelve (fallidos, duplicados): [(nombre, error)] de los que no se pudieron subir y
+    [(nombre, subida anterior, sha)] de los que ya estaban guardados y no se han vuelto a transferir.
+    """
+    # Contenido al que apuntaban los archivos que se sobrescriben, para liberarlo después
+    contenidos_anteriores = {a["blob_name"]: a["contenido"] for a in get_archivos_area(prefix)}
+    total = max(sum(fichero.size for _, fichero, _ in subidas), 1)
+    subidos = {}  # blob_name -> bytes subidos, lo actualizan los hilos de subida
+    lock_subidos = threading.Lock()
+    barra = st.progress(0.0, text=f"Subiendo {len(subidas)} archivos…")
+
+    def subir(blob_name, fichero, meta):
+        def progreso(n):
+            with lock_subidos:
+                subidos[blob_name] = n
+        propiedades, sha, anterior = subir_archivo_con_meta(blob_name, fichero, fichero.size, meta, progreso=progreso)
+        with lock_subidos:
+            subidos[blob_name] = fichero.size
+        if contenidos_anteriores.get(blob_name):
+            liberar_contenido(contenidos_anteriores[blob_name])
+        fichero.seek(0)
+        return propiedades, sha, anterior, crear_miniatura(prefix, blob_name, fichero)
+
+    nuevas = {}
+    fallidos = []
+    duplicados = []
+    with ThreadPoolExecutor(max_workers=MAX_SUBIDAS_SIMULTANEAS) as executor:
+        futuros = {executor.submit(subir, *subida): subida for subida in subidas}
+        pendientes = set(futuros)
+        while pendientes:
+            # Los hilos no pueden pintar en la página: la barra se actualiza desde aquí
+            terminados, pendientes = wait(pendientes, timeout=0.5)
+            for futuro in terminados:
+                blob_name, fichero, meta = futuros[futuro]
+                try:
+                    propiedades, sha, anterior, miniatura = futuro.result()
+                except Exception as e:
+                    fallidos.append((meta["nombre_original"], e))
+                    continue
+                if anterior:
+                    duplicados.append((meta["nombre_original"], anterior, sha))
+                nuevas[blob_name] = entrada_indice(
+                    meta, propiedades["last_modified"], fichero.size, propiedades["etag"], miniatura, sha
+                )
+            with lock_subidos:
+                hechos = sum(subidos.values())
+            barra.progress(
+                min(hechos / total, 1.0),
+                text=f"Subiendo {len(subidas) - len(pendientes)}/{len(subidas)} archivos… {hechos * 100 // total}%"
+            )
+    barra.empty()
+
+    if nuevas:
+        indexar_archivos(prefix, nuevas)
+    return fallidos, duplicados
+
 if "subir" in permisos:
     st.markdown("### 📤 Subida de archivos")
-    comentario_input = st.text_area("Comentario o descripción (opcional)", key="comentario_subida")
-    uploaded_file = st.file_uploader(
-        "Arrastra un archivo o haz clic en ‘Browse files’ para seleccionarlo desde tu dispositivo",
-        type=TIPOS_ARCHIVO
+    # Resultado de la última subida (se muestra tras el rerun)
+    for tipo, mensaje in st.session_state.pop("resultado_subida", []):
+        getattr(st, tipo)(mensaje)
+
+    if todas_las_areas:
+        area_subida = st.selectbox("Área de destino", list(area_map), key="area_subida")
+        prefijo_subida = area_map[area_subida] + "/"
+    else:
+        prefijo_subida = azure_prefix
+    comentario_input = st.text_area(
+        "Comentario o descripción (opcional, común a todos los archivos)", key="comentario_subida"
+    )
+    # Cambiar la clave del file_uploader lo vacía después de cada subida
+    clave_subida = st.session_state.setdefault("clave_subida", 0)
+    uploaded_files = st.file_uploader(
+        "Arrastra uno o varios archivos o haz clic en ‘Browse files’ para seleccionarlos desde tu dispositivo",
+        type=TIPOS_ARCHIVO,
+        accept_multiple_files=True,
+        key=f"subida_{clave_subida}"
     )
 
-    if uploaded_file:
-        original_name = uploaded_file.name
-
-        # 1. VERIFICAR SI EL ARCHIVO YA EXISTE
-        existing_blob_name = find_existing_blob_by_original_name(original_name, azure_prefix)
-
-        if existing_blob_name:
-            # 2. SI EXISTE, MOSTRAR OPCIONES DE SOBRESCRITURA
-            st.warning(f"⚠️ Ya existe un archivo llamado **{original_name}**. ¿Qué deseas hacer?")
-
-            col1, col2 = st.columns(2)
-            with col1:
-                if st.button("🔄 Sobrescribir archivo existente"):
-                    # Subir el nuevo contenido sobre el blob existente
-                    subir_a_blob(existing_blob_name, uploaded_file.getvalue())
-
-                    # Actualizar los metadatos del archivo existente
-                    meta_blob_name = existing_blob_name + ".meta.json"
-                    try:
-                        # Intentar leer metadatos antiguos para mantenerlos si es posible
-                        meta_bytes = descargar_blob(meta_blob_name)
-                        meta = json.loads(meta_bytes)
-                    except Exception:
-                        meta = {} # Si no hay meta, se crea uno nuevo
-
-                    meta["usuario"] = st.session_state.usuario
-                    meta["fecha"] = fecha_actual_madrid()
-                    meta["comentario"] = comentario_input.strip()
-                    meta["nombre_original"] = original_name # Asegurarse que se mantiene
-
-                    meta_str = json.dumps(meta, ensure_ascii=False)
-                    subir_a_blob(meta_blob_name, meta_str.encode("utf-8"))
-                    get_archivos_area.clear()
-                    st.success(f"✅ Archivo **{original_name}** sobrescrito correctamente.")
-            with col2:
-                if st.button("❌ Cancelar subida"):
-                    st.info("Subida cancelada.")
-                    # No se hace nada, el rerun limpiará el estado
-        else:
-            # 3. SI NO EXISTE, PROCEDER CON LA SUBIDA NORMAL
-            timestamp_fn = fecha_actual_madrid()
-            safe_filename = f"{timestamp_fn}_{original_name}"
-            blob_name = f"{azure_prefix}{safe_filename}"
-
-            # Subir archivo
-            subir_a_blob(blob_name, uploaded_file.getvalue())
-
-            # Crear metadatos
-            meta = {
-                "usuario": st.session_state.usuario,
-                "fecha": fecha_actual_madrid(),
-                "comentario": comentario_input.strip(),
-                "nombre_original": original_name
-            }
-            meta_str = json.dumps(meta, ensure_ascii=False)
-            subir_a_blob(f"{blob_name}.meta.json", meta_str.encode("utf-8"))
-            get_archivos_area.clear()
-            st.success(f"✅ Archivo **{original_name}** subido.")
+    if uploaded_files:
+        # 1. VERIFICAR DE UNA VEZ QUÉ ARCHIVOS YA EXISTEN
+        nombres_area = nombres_en_area(prefijo_subida)
+        existentes = {f.name: nombres_area[f.name] for f in uploaded_files if f.name in nombres_area}
+
+        # 2. SI HAY CONFLICTOS, ELEGIR QUÉ HACER CON CADA UNO
+        politicas = {}
+        if existentes:
+            st.warning(f"⚠️ Ya existen en el área {len(existentes)} de los archivos. ¿Qué deseas hacer con cada uno?")
+            for nombre in existentes:
+                politicas[nombre] = st.selectbox(
+                    nombre, POLITICAS_CONFLICTO, key=f"politica_{clave_subida}_{nombre}"
+                )
+
+        # 3. SUBIR EL LOTE
+        if st.button(f"📤 Subir {len(uploaded_files)} archivo(s)"):
+            fecha = fecha_actual_madrid()
+            metas_actuales = {a["blob_name"]: a["meta"] for a in archivos_sidebar}
+            ocupados = set(nombres_area)
+            vistos = set()
+            subidas, omitidos = [], []
+            for uploaded_file in uploaded_files:
+                nombre = uploaded_file.name
+                politica = politicas.get(nombre)
+                if nombre in vistos:
+                    # El mismo nombre repetido dentro del lote
+                    politica = "Conservar ambos"
+                vistos.add(nombre)
+                ocupados.add(nombre)
+
+                if politica == "Omitir":
+                    omitidos.append(nombre)
+                    continue
+                if politica == "Sobrescribir":
+                    # Se parte de los metadatos actuales para mantenerlos
+                    blob_name = existentes[nombre]
+                    meta = dict(metas_actuales.get(blob_name, {}))
+                else:
+                    if politica == "Conservar ambos":
+                        nombre = nombre_libre(nombre, ocupados)
+                        ocupados.add(nombre)
+                    blob_name = f"{prefijo_subida}{fecha}_{nombre}"
+                    meta = {}
+                meta.update({
+                    "usuario": st.session_state.usuario,
+                    "fecha": fecha,
+                    "comentario": comentario_input.strip(),
+                    "nombre_original": nombre
+                })
+                subidas.append((blob_name, uploaded_file, meta))
+
+            fallidos, duplicados = subir_lote(prefijo_subida, subidas) if subidas else ([], [])
+            resultado = []
+            if len(subidas) > len(fallidos):
+                resultado.append(("success", f"✅ {len(subidas) - len(fallidos)} archivo(s) subido(s) correctamente."))
+            for nombre, anterior, sha in duplicados:
+                if subida_anterior_visible(anterior, sha):
+                    mensaje = (
+                        f"♻️ **{nombre}** ya estaba subido como **{anterior['nombre_original']}** "
+                        f"({area_de_blob(anterior['blob'])}): no se ha vuelto a transferir."
+                    )
+                else:
+                    mensaje = f"♻️ El contenido de **{nombre}** ya estaba guardado: no se ha vuelto a transferir."
+                resultado.append(("info", mensaje))
+            if omitidos:
+                resultado.append(("info", f"Omitidos por existir ya: {', '.join(omitidos)}"))
+            for nombre, error in fallidos:
+                resultado.append(("error", f"❌ No se pudo subir **{nombre}**: {error}"))
+            st.session_state.resultado_subida = resultado
+            st.session_state.clave_subida += 1
             st.rerun()
 
 
+ejecucion.tramo("subida")
+
 # --- VISUALIZACIÓN Y GESTIÓN DE ARCHIVOS ---
 st.markdown("---")
 st.markdown("### 📁 Archivos disponibles")
 
 # Controles de Vista
-col1, col2 = st.columns(2)
+col1, col2, col3 = st.columns(3)
 with col1:
-    orden = st.selectbox("Ordenar por", ["Más recientes", "Más antiguos", "Nombre A-Z", "Nombre Z-A"],index=0)
+    opciones_orden = ["Más recientes", "Más antiguos", "Nombre A-Z", "Nombre Z-A"]
+    if search_query.strip():
+        # Con una búsqueda activa se ofrece (y se usa por defecto) el orden por relevancia
+        opciones_orden = ["Relevancia"] + opciones_orden
+    orden = st.selectbox("Ordenar por", opciones_orden,index=0)
 with col2:
     vista = st.selectbox("Vista", ["1 columna", "2 columnas", "3 columnas"],index=1)
     num_cols = int(vista.split()[0])
-
-# Aplicar filtro
-filtered_files = []
-for archivo_info in archivos_sidebar:
-    nombre = archivo_info["meta"].get("nombre_original", "").lower()
-    comentario = archivo_info["meta"].get("comentario", "").lower()
-    if search_query in nombre or search_query in comentario:
-        filtered_files.append(archivo_info)
+with col3:
+    opciones_pagina = sorted({TAMANO_PAGINA, 12, 24, 48})
+    tamano_pagina = st.selectbox("Archivos por página", opciones_pagina, index=opciones_pagina.index(TAMANO_PAGINA))
+
+# Aplicar filtro (índices de búsqueda de las áreas, resultados ya ordenados por relevancia)
+if search_query.strip():
+    archivos_por_blob = {archivo_info["blob_name"]: archivo_info for archivo_info in archivos_sidebar}
+    filtered_files = [
+        archivos_por_blob[blob_name]
+        for blob_name in buscar_en_areas(prefijos_vista, search_query)
+        if blob_name in archivos_por_blob
+    ]
+else:
+    filtered_files = list(archivos_sidebar)
 
 # Aplicar orden
 if orden == "Más recientes":
@@ -574,8 +1889,70 @@ elif orden == "Nombre A-Z":
 elif orden == "Nombre Z-A":
     filtered_files.sort(key=lambda x: x["meta"].get("nombre_original", "").lower(), reverse=True)
 
+# Paginación: solo se pintan los archivos de la página actual. Se vuelve a la primera página
+# al cambiar de área, búsqueda, orden o tamaño de página
+total_paginas = max(1, -(-len(filtered_files) // tamano_pagina))
+contexto_pagina = (area, search_query, orden, tamano_pagina)
+if st.session_state.get("contexto_pagina") != contexto_pagina:
+    st.session_state.contexto_pagina = contexto_pagina
+    st.session_state.pagina = 0
+pagina = min(st.session_state.pagina, total_paginas - 1)
+archivos_pagina = filtered_files[pagina * tamano_pagina:(pagina + 1) * tamano_pagina]
+
+def cambiar_pagina(desplazamiento):
+    st.session_state.pagina = pagina + desplazamiento
+
+# Descarga en bloque: el área entera (o el resultado de la búsqueda) o una selección, en un ZIP
+with st.expander("📦 Descargar varios archivos en ZIP"):
+    if search_query.strip():
+        opcion_todo = "Resultado de la búsqueda"
+    else:
+        opcion_todo = "Todas las áreas" if todas_las_areas else "Toda el área"
+    alcance = st.radio("Qué incluir", [opcion_todo, "Selección"], horizontal=True, key="alcance_zip")
+    if alcance == "Selección":
+        archivos_por_blob = {archivo_info["blob_name"]: archivo_info for archivo_info in filtered_files}
+        seleccion = st.multiselect(
+            "Archivos", list(archivos_por_blob),
+            format_func=lambda b: nombre_visible(b, archivos_por_blob[b]["meta"]), key="seleccion_zip"
+        )
+        archivos_zip = [archivos_por_blob[b] for b in seleccion]
+    else:
+        archivos_zip = filtered_files
+    st.caption(f"{len(archivos_zip)} archivos · {sum(a['size'] for a in archivos_zip) / 1024 / 1024:.1f} MB")
+
+    if st.button("📦 Preparar ZIP", disabled=not archivos_zip):
+        nombre_zip = f"{area} {datetime.now(pytz.timezone('Europe/Madrid')):%Y-%m-%d %H%M}.zip"
+        barra = st.progress(0.0, text="Preparando ZIP…")
+        try:
+            tipo, resultado = exportar_zip(
+                archivos_zip, nombre_zip,
+                progreso=lambda n: barra.progress(
+                    n / len(archivos_zip), text=f"Preparando ZIP… {n}/{len(archivos_zip)}"
+                )
+            )
+        except ResourceModifiedError:
+            # Un archivo se ha sobrescrito mientras se empaquetaba: el ZIP mezclaría versiones
+            tipo, resultado = "error", "Un archivo ha cambiado mientras se preparaba el ZIP. Vuelve a intentarlo."
+        except AzureError as e:
+            tipo, resultado = "error", f"No se ha podido preparar el ZIP ({type(e).__name__}). Vuelve a intentarlo."
+        barra.empty()
+        if tipo == "error":
+            st.error(f"❌ {resultado}")
+        elif tipo == "datos":
+            st.download_button(
+                "📥 Descargar ZIP", data=resultado, file_name=nombre_zip, mime="application/zip", on_click="ignore"
+            )
+        elif tipo == "url":
+            st.link_button("📥 Descargar ZIP", resultado)
+            st.caption(f"El enlace caduca en {MINUTOS_VALIDEZ_EXPORTACION} minutos.")
+        else:
+            st.error(
+                f"La exportación supera {MAX_MB_ZIP_DIRECTO} MB y no se pueden generar enlaces temporales. "
+                "Selecciona menos archivos."
+            )
+
 # Mostrar archivos en cuadrícula
-chunks = [filtered_files[i:i + num_cols] for i in range(0, len(filtered_files), num_cols)]
+chunks = [archivos_pagina[i:i + num_cols] for i in range(0, len(archivos_pagina), num_cols)]
 for chunk in chunks:
     cols = st.columns(num_cols)
     for archivo_info, col in zip(chunk, cols):
@@ -584,62 +1961,79 @@ for chunk in chunks:
             meta = archivo_info["meta"]
             blob_path = Path(blob_name)
             original = meta.get("nombre_original", blob_path.name)
-            suffix = blob_path.suffix.lower()
             ancla = generar_id_archivo(original)
 
             st.markdown(f"<div id='{ancla}'></div>", unsafe_allow_html=True)
             st.markdown(f"### {original}", unsafe_allow_html=True)
+            if todas_las_areas:
+                st.markdown(insignia_area(archivo_info["area"]), unsafe_allow_html=True)
             usuario = meta.get("usuario", "desconocido")
             fecha = meta.get("fecha", "")
             st.markdown(f"*Subido por {usuario} el {fecha}*", unsafe_allow_html=True)
 
-            contenido = descargar_blob(blob_name)
-            if suffix == ".pdf":
-                st.download_button("📥 Descargar PDF", data=contenido, file_name=blob_path.name)
-            elif suffix in [".xlsx", ".xls", ".csv"]:
-                st.download_button("📥 Descargar Excel/CSV", data=contenido, file_name=blob_path.name)
-            elif suffix in [".mp4", ".mov"]:
-                st.download_button("📥 Descargar Vídeo", data=contenido, file_name=blob_path.name)
-                #st.video(contenido)
-            elif suffix in [".jpg", ".jpeg", ".png", ".gif"]:
-                st.download_button("📥 Descargar Imagen", data=contenido, file_name=blob_path.name)
-                #st.image(contenido, use_container_width=True)
-            else:
-                st.download_button("📥 Descargar Archivo", data=contenido, file_name=blob_path.name)
+            if archivo_info["miniatura"]:
+                mostrar_miniatura(archivo_info["miniatura"])
+
+            # El reproductor solo se monta si se pide, y lee el vídeo por rangos directamente del
+            # almacenamiento: se puede saltar a cualquier minuto sin cargarlo en el servidor
+            es_video = Path(original).suffix.lower() in EXTENSIONES_VIDEO
+            if es_video and st.toggle("▶️ Reproducir", key=f"reproducir_{blob_name}"):
+                url = url_video(archivo_info)
+                if url:
+                    st.video(url)
+                else:
+                    st.caption("La reproducción en la app no está disponible; descarga el vídeo para verlo.")
+
+            # No se descarga el contenido al pintar la tarjeta, solo cuando el usuario lo pide
+            mostrar_boton_descarga(archivo_info, blob_path.name)
 
             comentario = st.text_area("💬 Comentario", value=meta.get("comentario", ""), key=f"comentario_{blob_name}")
             if st.button("💾 Actualizar comentario", key=f"guardar_comentario_{blob_name}"):
                 meta["comentario"] = comentario
-                meta_str = json.dumps(meta, ensure_ascii=False)
-                subir_a_blob(blob_name + ".meta.json", meta_str.encode("utf-8"))
-                get_archivos_area.clear()
+                nuevo_etag = guardar_meta(blob_name, meta, archivo_info["contenido"], archivo_info["size"])
+                actualizar_meta_en_indice(prefijo_de_blob(blob_name), blob_name, meta, nuevo_etag)
                 st.success("Comentario actualizado.")
 
             if st.button("🗑️ Eliminar archivo", key=f"eliminar_{blob_name}"):
-                eliminar_blob(blob_name)
-                eliminar_blob(blob_name + ".meta.json")
-                get_archivos_area.clear()
+                eliminar_archivo_con_meta(
+                    blob_name, archivo_info["miniatura"]["blob"] if archivo_info["miniatura"] else None,
+                    archivo_info["contenido"]
+                )
+                desindexar_archivo(prefijo_de_blob(blob_name), blob_name)
                 st.warning("Archivo eliminado")
                 st.rerun()
 
             st.markdown("---")
 
+if total_paginas > 1:
+    col_anterior, col_info, col_siguiente = st.columns([1, 2, 1])
+    with col_anterior:
+        st.button("◀ Anterior", on_click=cambiar_pagina, args=(-1,), disabled=pagina == 0)
+    with col_info:
+        st.caption(f"Página {pagina + 1} de {total_paginas} · {len(filtered_files)} archivos")
+    with col_siguiente:
+        st.button("Siguiente ▶", on_click=cambiar_pagina, args=(1,), disabled=pagina >= total_paginas - 1)
+
+
+ejecucion.tramo("cuadricula")
 
 # --- ENLACES COMPARTIDOS ---
 st.markdown("### 🔗 Enlaces compartidos")
 
 # Formulario para añadir un nuevo enlace
 if "subir" in permisos:
+    if todas_las_areas:
+        area_enlace = st.selectbox("Área del enlace", list(area_map), key="area_enlace")
+        prefijo_enlace = area_map[area_enlace] + "/"
+    else:
+        prefijo_enlace = azure_prefix
     nombre_url = st.text_input("Título")
     url = st.text_input("Introduce un enlace (https://...)")
 
     if st.button("Guardar enlace"):
         # Se comprueba que el título no esté vacío y la URL sea válida
         if url and "https://" in url and nombre_url:
-            enlaces_lista.append((nombre_url, url))
-            nuevo_contenido = "\n".join([f"{nombre}::{enlace}" for nombre, enlace in enlaces_lista])
-            subir_a_blob(f"{azure_prefix}enlaces.txt", nuevo_contenido.encode("utf-8"))
-            get_enlaces.clear()
+            anadir_enlace(prefijo_enlace, nombre_url, url, st.session_state.usuario)
             st.success("✅ Enlace guardado correctamente.")
             st.rerun()
         else:
@@ -649,7 +2043,7 @@ if "subir" in permisos:
 if enlaces_lista:
     st.markdown("---")
 
-    for i, (nombre, enlace) in enumerate(enlaces_lista):
+    for prefijo, id_enlace, nombre, enlace in enlaces_lista:
         col1, col2 = st.columns([0.5, 0.5])
         with col1:
             st.markdown(f"""
@@ -657,20 +2051,19 @@ if enlaces_lista:
                     🔗 <a href="{enlace}" target="_blank" style="text-decoration: none; color: #0066cc;">
                         {nombre}
                     </a>
+                    {insignia_area(area_de_blob(prefijo)) if todas_las_areas else ""}
                 </p>
             """, unsafe_allow_html=True)
 
         with col2:
             st.markdown("<div style='display: flex; justify-content: flex-start;'>", unsafe_allow_html=True)
-            if "subir" in permisos and st.button("🗑️", key=f"eliminar_enlace_{i}", help="Eliminar enlace"):
-                enlaces_lista.pop(i)
-                nuevo_contenido = "\n".join([f"{n}::{u}" for n, u in enlaces_lista])
-                subir_a_blob(f"{azure_prefix}enlaces.txt", nuevo_contenido.encode("utf-8"))
-                get_enlaces.clear()
+            if "subir" in permisos and st.button("🗑️", key=f"eliminar_enlace_{id_enlace}", help="Eliminar enlace"):
+                eliminar_enlace(prefijo, id_enlace, st.session_state.usuario)
                 st.success("✅ Enlace eliminado.")
                 st.rerun()
             st.markdown("</div>", unsafe_allow_html=True)
 else:
-    st.info("No hay enlaces compartidos en esta área.")
-
+    st.info("No hay enlaces compartidos en ninguna área." if todas_las_areas else "No hay enlaces compartidos en esta área.")
 
+ejecucion.tramo("enlaces")
+ejecucion.terminar()
@@ -0,0 +1,458 @@
+import argparse
+import hashlib
+import json
+import math
+import mimetypes
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+import urllib.parse
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+from pathlib import Path
+
+# Mide cuánto tarda la página según el tamaño del área. Uso:
+#   python benchmark.py                                 -> áreas de 10, 100 y 1000 archivos, JSON por la salida estándar
+#   python benchmark.py --archivos 10 100 --salida resultados.json
+#   --metadatos sidecar mide el formato antiguo (un .meta.json por archivo)
+#   --almacenamiento azure-simulado pasa por AlmacenamientoAzure, con un contenedor simulado sobre la carpeta
+# Cada escenario se ejecuta en un proceso nuevo (cachés vacías y RSS máximo propio) con la app completa
+# en el AppTest de Streamlit, sobre el almacenamiento local en una carpeta temporal. Los archivos sintéticos
+# son ficheros dispersos: un área con vídeos de varios GB apenas ocupa disco.
+
+RAIZ = Path(__file__).resolve().parent
+RUTA_APP = RAIZ / "app.py"
+SEGUNDOS_MAX_EJECUCION = 600
+
+AREA = "Dirección Deportiva"
+PREFIJO = "direccion_deportiva/"
+MAIL = "benchmark@example.com"
+CLAVE = "benchmark"
+SESION = {"usuario": "Benchmark", "area": AREA, "permisos": ["ver", "subir"], "rol": "Administrador"}
+
+# Mezcla de archivos sintéticos: (extensión, peso, tamaño mínimo, tamaño máximo en MB, o None = --max-mb-video)
+TIPOS_SINTETICOS = [
+    (".pdf", 40, 0.05, 5),
+    (".docx", 15, 0.02, 2),
+    (".xlsx", 15, 0.01, 5),
+    (".jpg", 20, 0.1, 8),
+    (".mp4", 10, 20, None),
+]
+PALABRAS = ["informe", "partido", "entrenamiento", "análisis", "plantilla", "lesión", "rival", "táctica", "vídeo"]
+
+# Lote de la medida de subida: uno de los archivos tiene el nombre de uno que ya está en el área
+TAMANOS_SUBIDA_MB = [0.25, 0.25, 1, 12]
+
+
+class CookiesEnMemoria(dict):
+    """Sustituye al componente de cookies, que necesita un navegador: la app lo ve siempre listo."""
+
+    def __init__(self, prefix="", password=None):
+        super().__init__()
+
+    def ready(self):
+        return True
+
+    def save(self):
+        pass
+
+
+class _PropiedadesSimuladas:
+    """Lo que AlmacenamientoAzure usa de las BlobProperties del SDK."""
+
+    def __init__(self, propiedades, size=None, content_range=None):
+        self.name = propiedades.name
+        self.size = propiedades.size if size is None else size
+        self.etag = propiedades.etag
+        self.last_modified = propiedades.last_modified
+        self.metadata = propiedades.metadata
+        self.content_settings = types.SimpleNamespace(content_type=propiedades.content_type)
+        self.content_range = content_range
+
+
+class BlobSimulado:
+    """
+    BlobClient del SDK de Azure sobre otro almacenamiento, con la semántica del servicio: un append
+    blob se crea vacío con create_append_blob y append_block exige que exista; una subida sin
+    overwrite falla si el blob existe; en una descarga por rangos, properties.size es el del rango
+    y el total va en content_range. upload_blob solo admite blobs de bloques.
+    """
+
+    def __init__(self, interno, nombre, url):
+        self._interno = interno
+        self.blob_name = nombre
+        self.url = url
+
+    @staticmethod
+    def _condicion(etag=None, match_condition=None):
+        from azure.core import MatchConditions
+
+        if match_condition == MatchConditions.IfMissing:
+            return {"solo_si_no_existe": True}
+        if match_condition == MatchConditions.IfNotModified:
+            return {"etag": etag}
+        return {}
+
+    def upload_blob(self, datos, overwrite=False, metadata=None, content_settings=None, **condicion):
+        condicion = self._condicion(**condicion)
+        if not overwrite and not condicion:
+            condicion = {"solo_si_no_existe": True}
+        tipo = content_settings.content_type if content_settings else None
+        return self._interno.subir(self.blob_name, bytes(datos), metadata, tipo, **condicion)
+
+    def create_append_blob(self, metadata=None, **condicion):
+        return self._interno.crear_registro(self.blob_name, b"", metadata, **self._condicion(**condicion))
+
+    def append_block(self, datos):
+        return self._interno.anadir(self.blob_name, bytes(datos))
+
+    def stage_block(self, block_id, datos):
+        self._interno.subir_bloque(self.blob_name, block_id, bytes(datos))
+
+    def commit_block_list(self, bloques, metadata=None, content_settings=None, **condicion):
+        tipo = content_settings.content_type if content_settings else None
+        return self._interno.confirmar_bloques(
+            self.blob_name, [bloque.id for bloque in bloques], metadata, tipo, **self._condicion(**condicion)
+        )
+
+    def download_blob(self, offset=None, length=None, **condicion):
+        contenido, propiedades = self._interno.descargar(self.blob_name, offset, length, **self._condicion(**condicion))
+        descarga = types.SimpleNamespace(readall=lambda: contenido)
+        if offset is None:
+            descarga.properties = _PropiedadesSimuladas(propiedades)
+        else:
+            rango = f"bytes {offset}-{offset + len(contenido) - 1}/{propiedades.size}"
+            descarga.properties = _PropiedadesSimuladas(propiedades, size=len(contenido), content_range=rango)
+        return descarga
+
+    def get_blob_properties(self):
+        return _PropiedadesSimuladas(self._interno.propiedades(self.blob_name))
+
+    def set_blob_metadata(self, metadata, **condicion):
+        return self._interno.guardar_metadata(self.blob_name, metadata, **self._condicion(**condicion))
+
+    def delete_blob(self, **condicion):
+        self._interno.eliminar(self.blob_name, **self._condicion(**condicion))
+
+
+class ContenedorSimulado:
+    """ContainerClient del SDK de Azure sobre otro almacenamiento, sin clave de cuenta (no firma SAS)."""
+
+    account_name = "benchmark"
+    container_name = "archivos-app"
+    credential = types.SimpleNamespace(account_key=None)
+
+    def __init__(self, interno):
+        self.interno = interno
+
+    def get_blob_client(self, nombre):
+        return BlobSimulado(self.interno, nombre, f"https://{self.account_name}.blob.core.windows.net/{nombre}")
+
+    def list_blobs(self, name_starts_with="", include=None):
+        for propiedades in self.interno.listar(name_starts_with):
+            yield _PropiedadesSimuladas(propiedades)
+
+
+class ArchivoSubido(BytesIO):
+    """Lo que la app usa de los UploadedFile de Streamlit: nombre, tamaño, tipo y lectura."""
+
+    def __init__(self, nombre, datos):
+        super().__init__(datos)
+        self.name = nombre
+        self.size = len(datos)
+        self.type = mimetypes.guess_type(nombre)[0]
+
+
+def tamano_aleatorio(rng, minimo_mb, maximo_mb):
+    """Tamaño en bytes con distribución log-uniforme: muchos archivos pequeños y pocos grandes."""
+    return int(math.exp(rng.uniform(math.log(minimo_mb), math.log(maximo_mb))) * 1024 * 1024)
+
+
+def poblar_area(almacen, num_archivos, modo_metadatos, max_mb_video, semilla):
+    """
+    Crea `num_archivos` archivos sintéticos en el área con el formato actual (referencias a contenidos
+    en _contenidos/). Devuelve los nombres originales y el total de bytes.
+    """
+    from contenidos import blob_contenido, referencia_a_metadata_blob
+    from metadatos import meta_a_metadata_blob
+
+    rng = random.Random(semilla)
+    tipos = [(extension, minimo, maximo or max_mb_video) for extension, _, minimo, maximo in TIPOS_SINTETICOS]
+    pesos = [peso for _, peso, _, _ in TIPOS_SINTETICOS]
+    inicio = datetime(2025, 7, 1, 9, 0, 0)
+    nombres, total = [], 0
+    for i in range(num_archivos):
+        extension, minimo, maximo = rng.choices(tipos, weights=pesos)[0]
+        size = tamano_aleatorio(rng, minimo, maximo)
+        nombre = f"{rng.choice(PALABRAS)} {i:04d}{extension}"
+        fecha = (inicio + timedelta(minutes=17 * i)).strftime("%Y-%m-%d %H:%M:%S")
+        blob_name = f"{PREFIJO}{fecha}_{nombre}"
+        meta = {
+            "usuario": "benchmark", "fecha": fecha, "nombre_original": nombre,
+            "comentario": " ".join(rng.sample(PALABRAS, 3))
+        }
+        # El hash solo identifica el contenido: nunca se descarga, así que no hace falta que coincida
+        sha = hashlib.sha256(f"{semilla}-{i}".encode()).hexdigest()
+
+        nombre_contenido = blob_contenido(sha)
+        almacen.subir(
+            nombre_contenido, b"",
+            metadata={
+                "referencias": "1",
+                "nombre_original": urllib.parse.quote(nombre, safe=""),
+                "blob": urllib.parse.quote(blob_name, safe="")
+            },
+            content_type=mimetypes.guess_type(nombre)[0]
+        )
+        # Fichero disperso del tamaño indicado, sin escribir sus datos
+        os.truncate(almacen._ruta(nombre_contenido), size)
+
+        metadata = referencia_a_metadata_blob(sha, size)
+        if modo_metadatos == "blob":
+            metadata.update(meta_a_metadata_blob(meta))
+        almacen.subir(blob_name, b"", metadata=metadata)
+        if modo_metadatos == "sidecar":
+            almacen.subir(f"{blob_name}.meta.json", json.dumps(meta, ensure_ascii=False).encode("utf-8"))
+        nombres.append(nombre)
+        total += size
+    return nombres, total
+
+
+def poblar_usuarios(almacen, coste_bcrypt):
+    import bcrypt
+
+    from usuarios import NOMBRE_BLOB_USUARIOS, serializar_usuarios
+
+    registro = {
+        "usuario": SESION["usuario"], "rol": SESION["rol"], "area": AREA, "mail": MAIL,
+        "contraseña": bcrypt.hashpw(CLAVE.encode(), bcrypt.gensalt(rounds=coste_bcrypt)).decode(),
+        "permisos": ",".join(SESION["permisos"]), "jerarquía": ""
+    }
+    almacen.subir(NOMBRE_BLOB_USUARIOS, serializar_usuarios({MAIL: registro}))
+
+
+def rss_maximo_mb():
+    try:
+        import resource
+    except ImportError:
+        # Windows: no hay getrusage
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux lo da en KB y macOS en bytes
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def ejecutar_escenario(num_archivos, modo_metadatos, modo_almacenamiento, repeticiones, max_mb_video, coste_bcrypt,
+                       semilla):
+    """Mide un escenario en este proceso y devuelve sus resultados. Se llama desde un proceso nuevo."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    import almacenamiento
+
+    # Sin navegador: cookies en memoria y un file_uploader que devuelve el lote preparado para su clave
+    sys.modules["streamlit_cookies_manager"] = types.ModuleType("streamlit_cookies_manager")
+    sys.modules["streamlit_cookies_manager"].EncryptedCookieManager = CookiesEnMemoria
+    lotes_subida = {}
+    st.file_uploader = lambda *args, key=None, **kwargs: lotes_subida.get(key)
+
+    # Cada vez que la app crea su almacenamiento (al vaciar las cachés) se guarda para sumar sus peticiones
+    instancias = []
+    clase_local = almacenamiento.AlmacenamientoLocal
+    if modo_almacenamiento == "azure-simulado":
+        # La app crea su almacenamiento local, pero recibe el código de Azure sobre un contenedor simulado
+        clase = almacenamiento.AlmacenamientoAzure
+        almacenamiento.AlmacenamientoLocal = lambda raiz: clase(ContenedorSimulado(clase_local(raiz)))
+    else:
+        clase = clase_local
+    init_original = clase.__init__
+
+    def init_registrando(self, *args, **kwargs):
+        init_original(self, *args, **kwargs)
+        instancias.append(self)
+
+    clase.__init__ = init_registrando
+
+    def peticiones():
+        return sum((instancia.peticiones for instancia in instancias), Counter())
+
+    with tempfile.TemporaryDirectory(prefix="benchmark_") as directorio:
+        raiz = Path(directorio) / "archivos"
+        almacen = clase_local(raiz)
+        nombres, total_bytes = poblar_area(almacen, num_archivos, modo_metadatos, max_mb_video, semilla)
+        poblar_usuarios(almacen, coste_bcrypt)
+        instancias.clear()
+
+        secretos = {
+            "SECRET_KEY": "benchmark", "APP_URL": "http://localhost:8501",
+            "SMTP_SERVER": "localhost", "SMTP_PORT": 1025, "SMTP_USER": "", "SMTP_PASS": "",
+            "ALMACENAMIENTO": "local", "DIRECTORIO_ALMACENAMIENTO": str(raiz),
+            "DIRECTORIO_CACHE": str(Path(directorio) / "cache"),
+            "MODO_METADATOS": modo_metadatos, "BCRYPT_COSTE": coste_bcrypt
+        }
+
+        def nueva_app(con_sesion=True):
+            at = AppTest.from_file(str(RUTA_APP), default_timeout=SEGUNDOS_MAX_EJECUCION)
+            for clave, valor in secretos.items():
+                at.secrets[clave] = valor
+            if con_sesion:
+                for clave, valor in SESION.items():
+                    at.session_state[clave] = valor
+            return at
+
+        def medir(at):
+            """Ejecuta la página una vez y devuelve su duración y las peticiones al almacenamiento."""
+            antes = peticiones()
+            inicio = time.perf_counter()
+            at.run()
+            segundos = time.perf_counter() - inicio
+            if at.exception:
+                raise RuntimeError(f"La app ha fallado: {at.exception[0].value}")
+            hechas = peticiones() - antes
+            return {"s": round(segundos, 4), "peticiones": sum(hechas.values()), "por_operacion": dict(hechas)}
+
+        def boton(at, etiqueta):
+            return next(b for b in at.button if b.label.startswith(etiqueta))
+
+        resultado = {
+            "archivos": num_archivos,
+            "mb_area": round(total_bytes / 1024 / 1024, 1),
+            "metadatos": modo_metadatos,
+            "almacenamiento": modo_almacenamiento
+        }
+
+        # Primera visita al área: aún no tiene índice y se reconstruye desde los metadatos de los blobs
+        resultado["indice_reconstruido"] = medir(nueva_app())
+
+        # Proceso recién arrancado: el índice existe pero el estado en memoria está vacío
+        st.cache_resource.clear()
+        at = nueva_app()
+        resultado["listado_frio"] = medir(at)
+        resultado["listado_caliente"] = medir(at)
+
+        # Reejecuciones completas de la página con el estado en memoria (lo que provoca cada clic)
+        reruns = [medir(at) for _ in range(repeticiones)]
+        tiempos = sorted(r["s"] for r in reruns)
+        resultado["rerun"] = {
+            "mediana_s": round(statistics.median(tiempos), 4),
+            "p95_s": tiempos[min(len(tiempos) - 1, math.ceil(0.95 * len(tiempos)) - 1)],
+            "max_s": tiempos[-1],
+            "peticiones": round(statistics.mean(r["peticiones"] for r in reruns), 2)
+        }
+
+        # Subida de un lote con un conflicto de nombre (se sobrescribe): primero la ejecución que
+        # comprueba los conflictos al elegir los archivos, después la que sube al pulsar el botón
+        rng = random.Random(semilla)
+        lote = [ArchivoSubido(nombres[0], rng.randbytes(int(TAMANOS_SUBIDA_MB[0] * 1024 * 1024)))]
+        lote += [
+            ArchivoSubido(f"subida {i}.docx", rng.randbytes(int(mb * 1024 * 1024)))
+            for i, mb in enumerate(TAMANOS_SUBIDA_MB[1:], start=1)
+        ]
+        clave_subida = at.session_state["clave_subida"] if "clave_subida" in at.session_state else 0
+        lotes_subida[f"subida_{clave_subida}"] = lote
+        comprobacion = medir(at)
+        at.selectbox(key=f"politica_{clave_subida}_{nombres[0]}").set_value("Sobrescribir")
+        boton(at, "📤 Subir").click()
+        subida = medir(at)
+        lotes_subida.clear()
+        resultado["subida"] = {
+            "archivos": len(lote),
+            "mb": round(sum(f.size for f in lote) / 1024 / 1024, 2),
+            "comprobacion_conflictos": comprobacion,
+            "subida": subida
+        }
+
+        # Inicio de sesión en un proceso recién arrancado: carga de usuarios, bcrypt y primera página
+        st.cache_resource.clear()
+        at = nueva_app(con_sesion=False)
+        at.run()
+        next(t for t in at.text_input if t.label == "Correo electrónico").input(MAIL)
+        next(t for t in at.text_input if t.label == "Contraseña").input(CLAVE)
+        boton(at, "Acceder").click()
+        resultado["login"] = medir(at)
+        if "usuario" not in at.session_state:
+            raise RuntimeError("El inicio de sesión del benchmark no ha funcionado.")
+
+    resultado["rss_max_mb"] = rss_maximo_mb()
+    return resultado
+
+
+def version_actual():
+    try:
+        salida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=RAIZ, capture_output=True, text=True, check=True
+        )
+        return salida.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide los tiempos de la página según el tamaño del área.")
+    parser.add_argument("--archivos", type=int, nargs="+", default=[10, 100, 1000], help="Archivos de cada escenario")
+    parser.add_argument("--metadatos", choices=["blob", "sidecar"], default="blob", help="Formato de los metadatos")
+    parser.add_argument(
+        "--almacenamiento", choices=["local", "azure-simulado"], default="local",
+        help="Carpeta local, o el código de Azure sobre un contenedor simulado en la carpeta"
+    )
+    parser.add_argument("--repeticiones", type=int, default=10, help="Reejecuciones medidas por escenario")
+    parser.add_argument("--max-mb-video", type=float, default=2048, help="Tamaño máximo de los vídeos sintéticos")
+    parser.add_argument("--coste", type=int, default=12, help="Factor de coste de bcrypt de la contraseña")
+    parser.add_argument("--semilla", type=int, default=1, help="Semilla de los datos sintéticos")
+    parser.add_argument("--salida", help="Fichero JSON de resultados (por defecto, la salida estándar)")
+    parser.add_argument("--escenario", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    parametros = [
+        "--metadatos", args.metadatos, "--almacenamiento", args.almacenamiento,
+        "--repeticiones", str(args.repeticiones), "--max-mb-video", str(args.max_mb_video),
+        "--coste", str(args.coste), "--semilla", str(args.semilla)
+    ]
+    if args.escenario is not None:
+        resultado = ejecutar_escenario(
+            args.escenario, args.metadatos, args.almacenamiento, args.repeticiones, args.max_mb_video, args.coste,
+            args.semilla
+        )
+        print(json.dumps(resultado, ensure_ascii=False))
+        return
+
+    escenarios = []
+    for num_archivos in args.archivos:
+        print(f"⏱️ Escenario de {num_archivos} archivos…", file=sys.stderr)
+        proceso = subprocess.run(
+            [sys.executable, str(Path(__file__).resolve()), "--escenario", str(num_archivos), *parametros],
+            cwd=RAIZ, capture_output=True, text=True
+        )
+        if proceso.returncode:
+            sys.exit(f"❌ Ha fallado el escenario de {num_archivos} archivos:\n{proceso.stderr}")
+        # La última línea es el JSON del escenario; antes puede haber avisos de Streamlit
+        escenarios.append(json.loads(proceso.stdout.strip().splitlines()[-1]))
+
+    informe = {
+        "version": version_actual(),
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "parametros": {
+            "metadatos": args.metadatos, "almacenamiento": args.almacenamiento, "repeticiones": args.repeticiones,
+            "max_mb_video": args.max_mb_video, "coste": args.coste, "semilla": args.semilla
+        },
+        "escenarios": escenarios
+    }
+    texto = json.dumps(informe, ensure_ascii=False, indent=2)
+    if args.salida:
+        Path(args.salida).write_text(texto + "\n", encoding="utf-8")
+        print(f"✅ Resultados guardados en {args.salida}", file=sys.stderr)
+    else:
+        print(texto)
+
+
+if __name__ == "__main__":
+    main()
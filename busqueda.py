@@ -0,0 +1,100 @@
+import re
+import unicodedata
+from bisect import bisect_left, insort
+
+# Peso de cada campo en la relevancia: coincidir en el nombre cuenta más que en el comentario
+PESO_NOMBRE = 3.0
+PESO_COMENTARIO = 1.0
+# Factor aplicado cuando el término de búsqueda es solo el prefijo de la palabra indexada
+FACTOR_PREFIJO = 0.5
+
+
+def normalizar(texto):
+    """Pasa a minúsculas y elimina tildes y diacríticos: "Médicos" -> "medicos"."""
+    descompuesto = unicodedata.normalize("NFKD", texto or "")
+    return "".join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def tokenizar(texto):
+    return re.findall(r"\w+", normalizar(texto))
+
+
+class IndiceBusqueda:
+    """
+    Índice invertido en memoria sobre el nombre y el comentario de los archivos de un área.
+
+    Admite altas, reemplazos y bajas incrementales, búsqueda por prefijo (vocabulario ordenado
+    + bisect), consultas de varios términos con semántica AND y ordenación por relevancia.
+    No es seguro entre hilos por sí mismo: se usa bajo el lock del estado del área.
+    """
+
+    def __init__(self):
+        self._postings = {}  # token -> {doc_id: peso}
+        self._tokens_doc = {}  # doc_id -> tokens indexados, para poder darlo de baja
+        self._vocabulario = []  # tokens ordenados, para buscar por prefijo
+
+    def __len__(self):
+        return len(self._tokens_doc)
+
+    def agregar(self, doc_id, nombre, comentario=""):
+        """Indexa (o reindexa) un documento."""
+        self.eliminar(doc_id)
+        pesos = {}
+        for token in tokenizar(nombre):
+            pesos[token] = pesos.get(token, 0.0) + PESO_NOMBRE
+        for token in tokenizar(comentario):
+            pesos[token] = pesos.get(token, 0.0) + PESO_COMENTARIO
+        for token, peso in pesos.items():
+            if token not in self._postings:
+                self._postings[token] = {}
+                insort(self._vocabulario, token)
+            self._postings[token][doc_id] = peso
+        self._tokens_doc[doc_id] = list(pesos)
+
+    def eliminar(self, doc_id):
+        for token in self._tokens_doc.pop(doc_id, []):
+            docs = self._postings[token]
+            docs.pop(doc_id, None)
+            if not docs:
+                del self._postings[token]
+                del self._vocabulario[bisect_left(self._vocabulario, token)]
+
+    def _puntuar_termino(self, termino):
+        """Documentos que contienen alguna palabra que empieza por `termino`, con su puntuación."""
+        puntuaciones = {}
+        i = bisect_left(self._vocabulario, termino)
+        while i < len(self._vocabulario) and self._vocabulario[i].startswith(termino):
+            token = self._vocabulario[i]
+            factor = 1.0 if token == termino else FACTOR_PREFIJO
+            for doc_id, peso in self._postings[token].items():
+                puntuaciones[doc_id] = max(puntuaciones.get(doc_id, 0.0), peso * factor)
+            i += 1
+        return puntuaciones
+
+    def buscar(self, consulta):
+        """
+        Devuelve los doc_id que contienen todos los términos de la consulta (como palabra o prefijo),
+        ordenados de más a menos relevante.
+        """
+        return [doc_id for doc_id, _ in self.buscar_con_puntuacion(consulta)]
+
+    def buscar_con_puntuacion(self, consulta):
+        """Como `buscar`, pero devuelve pares (doc_id, puntuación), para combinar resultados de varios índices."""
+        terminos = tokenizar(consulta)
+        if not terminos:
+            return []
+        resultado = None
+        # Se empieza por el término más largo, que suele ser el más selectivo
+        for termino in sorted(set(terminos), key=len, reverse=True):
+            puntuaciones = self._puntuar_termino(termino)
+            if resultado is None:
+                resultado = puntuaciones
+            else:
+                resultado = {
+                    doc_id: puntuacion + puntuaciones[doc_id]
+                    for doc_id, puntuacion in resultado.items()
+                    if doc_id in puntuaciones
+                }
+            if not resultado:
+                return []
+        return sorted(resultado.items(), key=lambda item: (-item[1], item[0]))
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+
+def _hash(texto, longitud):
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()[:longitud]
+
+
+class CacheContenidos:
+    """
+    Caché local en disco del contenido de los blobs, con expulsión LRU y un presupuesto máximo de bytes.
+
+    Cada entrada se identifica por nombre de blob + ETag: al sobrescribir un archivo cambia su ETag,
+    así que la copia anterior deja de usarse y se elimina en cuanto se guarda la nueva.
+    Es segura para varias sesiones de Streamlit en el mismo proceso y escribe cada archivo de forma
+    atómica (fichero temporal + os.replace), de modo que un fallo nunca deja archivos a medias.
+    """
+
+    def __init__(self, directorio, max_bytes):
+        self.directorio = Path(directorio)
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entradas = OrderedDict()  # clave -> tamaño, de menos a más recientemente usada
+        self._por_blob = {}  # hash del nombre del blob -> clave vigente
+        self._bytes = 0
+        self.aciertos = 0
+        self.fallos = 0
+        self.expulsiones = 0
+        self._cargar_existentes()
+
+    def _clave(self, blob_name, etag):
+        return f"{_hash(blob_name, 32)}-{_hash(etag, 16)}"
+
+    def _cargar_existentes(self):
+        """Recupera las entradas que quedaron en disco de ejecuciones anteriores, por orden de último uso."""
+        existentes = []
+        with os.scandir(self.directorio) as it:
+            for entrada in it:
+                if not entrada.is_file():
+                    continue
+                if entrada.name.endswith(".tmp"):
+                    # Restos de una escritura interrumpida
+                    os.remove(entrada.path)
+                    continue
+                stat = entrada.stat()
+                existentes.append((stat.st_mtime, entrada.name, stat.st_size))
+        for _, clave, size in sorted(existentes):
+            self._entradas[clave] = size
+            self._por_blob[clave.split("-")[0]] = clave
+            self._bytes += size
+        self._expulsar()
+
+    def _expulsar(self):
+        """Elimina las entradas menos usadas hasta quedar dentro del presupuesto. Requiere el lock."""
+        while self._bytes > self.max_bytes and self._entradas:
+            clave, size = self._entradas.popitem(last=False)
+            self._eliminar_fichero(clave, size)
+            self.expulsiones += 1
+
+    def _eliminar_fichero(self, clave, size):
+        self._bytes -= size
+        if self._por_blob.get(clave.split("-")[0]) == clave:
+            del self._por_blob[clave.split("-")[0]]
+        try:
+            os.remove(self.directorio / clave)
+        except FileNotFoundError:
+            pass
+
+    def obtener(self, blob_name, etag, descargar):
+        """
+        Devuelve el contenido del blob desde disco si está en caché con ese ETag.
+        Si no, llama a `descargar()`, que debe devolver (contenido, etag_real), y guarda el resultado.
+        """
+        clave = self._clave(blob_name, etag)
+        with self._lock:
+            en_cache = clave in self._entradas
+            if en_cache:
+                self._entradas.move_to_end(clave)
+        if en_cache:
+            try:
+                ruta = self.directorio / clave
+                contenido = ruta.read_bytes()
+                os.utime(ruta)
+                with self._lock:
+                    self.aciertos += 1
+                return contenido
+            except FileNotFoundError:
+                # Expulsada por otra sesión entre la comprobación y la lectura
+                pass
+
+        with self._lock:
+            self.fallos += 1
+        contenido, etag_real = descargar()
+        self.guardar(blob_name, etag_real, contenido)
+        return contenido
+
+    def guardar(self, blob_name, etag, contenido):
+        size = len(contenido)
+        if size > self.max_bytes:
+            return
+        clave = self._clave(blob_name, etag)
+        fd, ruta_tmp = tempfile.mkstemp(dir=self.directorio, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(contenido)
+            os.replace(ruta_tmp, self.directorio / clave)
+        except BaseException:
+            try:
+                os.remove(ruta_tmp)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            hash_blob = clave.split("-")[0]
+            anterior = self._por_blob.get(hash_blob)
+            if anterior is not None and anterior != clave and anterior in self._entradas:
+                # Versión anterior del mismo blob (se ha sobrescrito): ya no sirve
+                self._eliminar_fichero(anterior, self._entradas.pop(anterior))
+            if clave in self._entradas:
+                self._bytes -= self._entradas[clave]
+            self._entradas[clave] = size
+            self._entradas.move_to_end(clave)
+            self._por_blob[hash_blob] = clave
+            self._bytes += size
+            self._expulsar()
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "expulsiones": self.expulsiones,
+                "ratio_aciertos": self.aciertos / consultas if consultas else 0.0,
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+            }
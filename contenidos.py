@@ -0,0 +1,36 @@
+import hashlib
+
+# Almacenamiento direccionado por contenido: cada contenido distinto se guarda una sola vez en
+# _contenidos/<sha256>, y en cada área el archivo es un blob vacío que lo referencia por su hash
+# (con sus propios metadatos). El blob de contenido lleva en sus metadatos cuántas referencias tiene.
+PREFIJO_CONTENIDOS = "_contenidos/"
+TAMANO_TROZO_HASH = 1024 * 1024
+
+
+def sha256_fichero(fichero, tamano_trozo=TAMANO_TROZO_HASH):
+    """Calcula el SHA-256 leyendo el fichero por trozos (no lo carga entero). Lo deja al principio."""
+    fichero.seek(0)
+    h = hashlib.sha256()
+    while True:
+        trozo = fichero.read(tamano_trozo)
+        if not trozo:
+            break
+        h.update(trozo)
+    fichero.seek(0)
+    return h.hexdigest()
+
+
+def blob_contenido(sha):
+    return f"{PREFIJO_CONTENIDOS}{sha[:2]}/{sha}"
+
+
+def referencia_a_metadata_blob(sha, size):
+    """Metadatos nativos que convierten el blob de un área en una referencia a un contenido."""
+    return {"contenido": sha, "tamano": str(size)}
+
+
+def referencia_desde_metadata(metadata):
+    """Devuelve (sha, tamaño) si el blob es una referencia a un contenido, o (None, None) si guarda sus datos."""
+    if not metadata or "contenido" not in metadata:
+        return None, None
+    return metadata["contenido"], int(metadata.get("tamano", 0))
@@ -0,0 +1,144 @@
+import heapq
+import itertools
+import smtplib
+import threading
+import time
+
+
+class ColaCorreo:
+    """
+    Cola de correo saliente del proceso, vaciada por un hilo en segundo plano.
+
+    El hilo mantiene una única conexión SMTP autenticada que reutiliza entre envíos, la reabre si
+    el servidor la corta y la cierra tras un rato sin actividad. Los envíos fallidos se reintentan
+    con espera exponencial y se limita la frecuencia de envío a cada dirección.
+
+    Para probarla en local sin enviar correos reales se puede usar un servidor SMTP de depuración
+    (p. ej. `python -m aiosmtpd -n -l localhost:1025`) con usar_tls=False y sin usuario.
+    """
+
+    def __init__(self, servidor, puerto, usuario=None, clave=None, usar_tls=True, max_intentos=5,
+                 espera_base_s=2.0, intervalo_por_destinatario_s=60.0, inactividad_max_s=300.0, metricas=None):
+        self.servidor = servidor
+        self.puerto = int(puerto)
+        self.usuario = usuario
+        self.clave = clave
+        self.usar_tls = usar_tls
+        self.max_intentos = max_intentos
+        self.espera_base_s = espera_base_s
+        self.intervalo_por_destinatario_s = intervalo_por_destinatario_s
+        self.inactividad_max_s = inactividad_max_s
+        self.metricas = metricas  # metricas.Metricas opcional: duración y resultado de cada envío
+
+        self._pendientes = []  # montículo de (instante de envío, secuencia, intento, mensaje)
+        self._secuencia = itertools.count()
+        self._condicion = threading.Condition()
+        self._ultimo_por_destinatario = {}
+        self._smtp = None  # solo lo usa el hilo de envío
+
+        self.enviados = 0
+        self.reintentos = 0
+        self.fallidos = 0
+        self.ultimo_error = None
+
+        self._hilo = threading.Thread(target=self._trabajar, name="cola-correo", daemon=True)
+        self._hilo.start()
+
+    def encolar(self, mensaje):
+        """
+        Añade un mensaje a la cola y vuelve de inmediato.
+        Devuelve False (y no lo encola) si ya se envió algo a ese destinatario hace menos de
+        intervalo_por_destinatario_s segundos.
+        """
+        destinatario = mensaje["To"]
+        with self._condicion:
+            ahora = time.monotonic()
+            ultimo = self._ultimo_por_destinatario.get(destinatario)
+            if ultimo is not None and ahora - ultimo < self.intervalo_por_destinatario_s:
+                return False
+            self._ultimo_por_destinatario[destinatario] = ahora
+            if len(self._ultimo_por_destinatario) > 1000:
+                self._ultimo_por_destinatario = {
+                    d: t for d, t in self._ultimo_por_destinatario.items()
+                    if ahora - t < self.intervalo_por_destinatario_s
+                }
+            heapq.heappush(self._pendientes, (ahora, next(self._secuencia), 1, mensaje))
+            self._condicion.notify()
+        return True
+
+    def pendientes(self):
+        with self._condicion:
+            return len(self._pendientes)
+
+    def _siguiente(self):
+        """Espera hasta que toque enviar el siguiente mensaje. Devuelve None tras un periodo sin actividad."""
+        with self._condicion:
+            while True:
+                ahora = time.monotonic()
+                if self._pendientes and self._pendientes[0][0] <= ahora:
+                    return heapq.heappop(self._pendientes)
+                espera = self._pendientes[0][0] - ahora if self._pendientes else self.inactividad_max_s
+                if not self._condicion.wait(timeout=espera) and not self._pendientes:
+                    return None
+
+    def _trabajar(self):
+        while True:
+            siguiente = self._siguiente()
+            if siguiente is None:
+                self._cerrar_conexion()
+                continue
+            _, _, intento, mensaje = siguiente
+            self._enviar(intento, mensaje)
+
+    def _conectar(self):
+        smtp = smtplib.SMTP(self.servidor, self.puerto, timeout=30)
+        if self.usar_tls:
+            smtp.starttls()
+        if self.usuario:
+            smtp.login(self.usuario, self.clave)
+        return smtp
+
+    def _cerrar_conexion(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self._smtp = None
+
+    def _enviar(self, intento, mensaje):
+        inicio = time.perf_counter()
+        try:
+            try:
+                reutilizada = self._smtp is not None
+                if not reutilizada:
+                    self._smtp = self._conectar()
+                self._smtp.send_message(mensaje)
+            except smtplib.SMTPServerDisconnected:
+                if not reutilizada:
+                    raise
+                # El servidor cerró la conexión mientras estaba inactiva: se reabre y se reenvía
+                self._smtp = self._conectar()
+                self._smtp.send_message(mensaje)
+            self.enviados += 1
+            self._registrar(inicio, "enviado")
+        except (smtplib.SMTPException, OSError) as e:
+            self._smtp = None
+            self.ultimo_error = f"{mensaje['To']}: {e}"
+            if intento >= self.max_intentos:
+                self.fallidos += 1
+                self._registrar(inicio, "fallido")
+                return
+            self.reintentos += 1
+            self._registrar(inicio, "reintento")
+            espera = self.espera_base_s * 2 ** (intento - 1)
+            with self._condicion:
+                heapq.heappush(
+                    self._pendientes, (time.monotonic() + espera, next(self._secuencia), intento + 1, mensaje)
+                )
+
+    def _registrar(self, inicio, resultado):
+        if self.metricas is not None:
+            self.metricas.observar("correo_segundos", time.perf_counter() - inicio, resultado=resultado)
@@ -1,18 +1,95 @@
-import pandas as pd
+import argparse
+import os
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
 import bcrypt
+import pandas as pd
+
+# Cifra con bcrypt las contraseñas que aún estén en claro. Uso:
+#   python encriptar_contraseñas.py [usuarios.xlsx]   -> Excel local (por defecto usuarios.xlsx)
+#   python encriptar_contraseñas.py --blob            -> almacén de usuarios de la app en Azure (usuarios.jsonl)
+#   --simular muestra el informe sin guardar nada; --procesos y --coste ajustan el cifrado
+
+# Prefijos de los hashes bcrypt: las filas que empiezan por ellos ya están cifradas
+PREFIJOS_BCRYPT = ("$2a$", "$2b$", "$2y$")
+
+
+def hashear(clave, coste):
+    return bcrypt.hashpw(clave.encode(), bcrypt.gensalt(rounds=coste)).decode()
+
+
+def cadena_de_conexion():
+    if os.environ.get("AZURE_CONNECTION_STRING"):
+        return os.environ["AZURE_CONNECTION_STRING"]
+    with open(Path(".streamlit") / "secrets.toml", "rb") as f:
+        return tomllib.load(f)["AZURE_CONNECTION_STRING"]
+
+
+def cifrar_pendientes(usuarios_df, coste, procesos, simular):
+    """Cifra en paralelo las contraseñas en claro del DataFrame. Devuelve cuántas se han cifrado."""
+    claves = usuarios_df["contraseña"].fillna("").astype(str)
+    vacias = claves.str.strip() == ""
+    cifradas = claves.str.startswith(PREFIJOS_BCRYPT)
+    pendientes = ~cifradas & ~vacias
+
+    print(f"Usuarios: {len(usuarios_df)}. Ya cifradas: {int(cifradas.sum())}. "
+          f"Sin contraseña: {int(vacias.sum())}. Por cifrar: {int(pendientes.sum())}.")
+    if vacias.any():
+        print(f"⚠️ Sin contraseña: {', '.join(usuarios_df.loc[vacias, 'mail'].astype(str))}")
+    if simular or not pendientes.any():
+        if simular and pendientes.any():
+            print(f"Se cifrarían: {', '.join(usuarios_df.loc[pendientes, 'mail'].astype(str))}")
+        return 0
+
+    # bcrypt es intensivo en CPU: se reparte entre procesos y se asigna la columna de una vez
+    a_cifrar = claves[pendientes].tolist()
+    with ProcessPoolExecutor(max_workers=procesos) as executor:
+        hashes = list(executor.map(hashear, a_cifrar, [coste] * len(a_cifrar), chunksize=max(1, len(a_cifrar) // 64)))
+    usuarios_df.loc[pendientes, "contraseña"] = hashes
+    return len(hashes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cifra con bcrypt las contraseñas en claro de los usuarios.")
+    parser.add_argument("archivo", nargs="?", default="usuarios.xlsx", help="Excel local de usuarios")
+    parser.add_argument("--blob", action="store_true", help="Trabajar sobre el almacén de usuarios en Azure")
+    parser.add_argument("--simular", action="store_true", help="Mostrar el informe sin guardar cambios")
+    parser.add_argument("--procesos", type=int, default=os.cpu_count(), help="Procesos en paralelo")
+    parser.add_argument("--coste", type=int, default=12, help="Factor de coste de bcrypt")
+    args = parser.parse_args()
+
+    if not args.blob:
+        # Carga el archivo de usuarios
+        usuarios_df = pd.read_excel(args.archivo)
+        cifradas = cifrar_pendientes(usuarios_df, args.coste, args.procesos, args.simular)
+        if cifradas:
+            # Guardamos el Excel actualizado
+            usuarios_df.to_excel(args.archivo, index=False)
+        print(f"✅ Contraseñas cifradas con bcrypt: {cifradas}.")
+        return
+
+    from azure.core import MatchConditions
+    from azure.storage.blob import BlobServiceClient
+
+    from usuarios import NOMBRE_BLOB_USUARIOS, parsear_usuarios, serializar_usuarios
+
+    container_client = BlobServiceClient.from_connection_string(cadena_de_conexion()).get_container_client("archivos-app")
+    blob_client = container_client.get_blob_client(NOMBRE_BLOB_USUARIOS)
+    descarga = blob_client.download_blob()
+    etag = descarga.properties.etag
+    usuarios_df = pd.DataFrame(list(parsear_usuarios(descarga.readall()).values()))
+
+    cifradas = cifrar_pendientes(usuarios_df, args.coste, args.procesos, args.simular)
+    if cifradas:
+        usuarios = {registro["mail"]: registro for registro in usuarios_df.to_dict("records")}
+        # Escritura condicional: si la app cambió alguna contraseña mientras tanto, no se pisa
+        blob_client.upload_blob(
+            serializar_usuarios(usuarios), overwrite=True, etag=etag, match_condition=MatchConditions.IfNotModified
+        )
+    print(f"✅ Contraseñas cifradas con bcrypt en {NOMBRE_BLOB_USUARIOS}: {cifradas}.")
+
 
-# Carga el archivo de usuarios
-archivo = "usuarios.xlsx"
-usuarios_df = pd.read_excel(archivo)
-
-# Recorremos todas las filas
-for i in usuarios_df.index:
-    clave = str(usuarios_df.loc[i, "contraseña"])
-    # Solo si aún no está encriptada (los hash bcrypt comienzan por $2b$)
-    if not clave.startswith("$2b$"):
-        hashed = bcrypt.hashpw(clave.encode(), bcrypt.gensalt()).decode()
-        usuarios_df.loc[i, "contraseña"] = hashed
-
-# Guardamos el Excel actualizado
-usuarios_df.to_excel(archivo, index=False)
-print("✅ Contraseñas actualizadas con bcrypt.")
+if __name__ == "__main__":
+    main()
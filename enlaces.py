@@ -0,0 +1,83 @@
+import json
+import uuid
+from datetime import datetime, timezone
+
+# Enlaces compartidos de cada área: registro de solo-añadir (append blob) con un evento JSON por línea.
+# Cada alta lleva un id estable; una baja referencia ese id. Editar cuesta un único append pequeño.
+NOMBRE_LOG_ENLACES = "enlaces.jsonl"
+NOMBRE_ENLACES_ANTIGUO = "enlaces.txt"
+# Se compacta cuando hay al menos este número de eventos y más del doble que enlaces vivos
+MIN_EVENTOS_COMPACTAR = 50
+
+
+def _evento(operacion, id_enlace, usuario, **datos):
+    return {
+        "op": operacion, "id": id_enlace, "usuario": usuario,
+        "fecha": datetime.now(timezone.utc).isoformat(timespec="seconds"), **datos
+    }
+
+
+def evento_alta(nombre, url, usuario):
+    return _evento("alta", uuid.uuid4().hex, usuario, nombre=nombre, url=url)
+
+
+def evento_baja(id_enlace, usuario):
+    return _evento("baja", id_enlace, usuario)
+
+
+def serializar_eventos(eventos):
+    return "".join(json.dumps(evento, ensure_ascii=False) + "\n" for evento in eventos).encode("utf-8")
+
+
+def eventos_desde_txt(contenido):
+    """Convierte el antiguo enlaces.txt (nombre::url por línea) en eventos de alta."""
+    eventos = []
+    for linea in contenido.decode("utf-8").splitlines():
+        if "::" in linea:
+            nombre, url = linea.strip().split("::", 1)
+            eventos.append(evento_alta(nombre, url, "migración"))
+    return eventos
+
+
+class VistaEnlaces:
+    """
+    Estado de los enlaces de un área reconstruido a partir de su registro de eventos.
+
+    Se alimenta de forma incremental: `aplicar` recibe los bytes del registro a partir de
+    `desplazamiento` y solo procesa líneas completas. `generacion` identifica la versión del
+    registro (cambia al compactarlo), para saber si basta con leer lo añadido desde la última vez.
+    """
+
+    def __init__(self, generacion=None):
+        self.generacion = generacion
+        self.desplazamiento = 0
+        self.eventos = 0
+        self._enlaces = {}  # id -> evento de alta, en orden de alta
+        self._bajas = set()
+
+    def aplicar(self, datos):
+        fin = datos.rfind(b"\n") + 1
+        for linea in datos[:fin].decode("utf-8").splitlines():
+            if not linea.strip():
+                continue
+            evento = json.loads(linea)
+            self.eventos += 1
+            if evento["op"] == "alta":
+                # Un alta de un id ya borrado solo puede venir de una compactación concurrente: se ignora
+                if evento["id"] not in self._bajas:
+                    self._enlaces[evento["id"]] = evento
+            elif evento["op"] == "baja":
+                self._bajas.add(evento["id"])
+                self._enlaces.pop(evento["id"], None)
+        self.desplazamiento += fin
+
+    def enlaces(self):
+        """Lista de (id, nombre, url) de los enlaces vivos, en orden de alta."""
+        return [(evento["id"], evento["nombre"], evento["url"]) for evento in self._enlaces.values()]
+
+    def necesita_compactar(self):
+        return self.eventos >= MIN_EVENTOS_COMPACTAR and self.eventos > 2 * len(self._enlaces)
+
+    def contenido_compactado(self):
+        """Registro equivalente con solo las altas de los enlaces vivos (conserva ids, autores y fechas)."""
+        return serializar_eventos(self._enlaces.values())
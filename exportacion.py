@@ -0,0 +1,115 @@
+import queue
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Formatos que ya vienen comprimidos: se guardan tal cual en el ZIP para no gastar CPU en balde
+EXTENSIONES_COMPRIMIDAS = {
+    ".jpg", ".jpeg", ".png", ".gif", ".webp", ".mp4", ".mov", ".zip", ".docx", ".xlsx", ".pptx"
+}
+
+_FIN = object()
+
+
+def nombres_unicos(nombres):
+    """Evita nombres repetidos dentro del ZIP: "informe.pdf", "informe (2).pdf", ..."""
+    usados = set()
+    resultado = []
+    for nombre in nombres:
+        ruta = Path(nombre)
+        candidato, n = nombre, 1
+        while candidato.lower() in usados:
+            n += 1
+            candidato = f"{ruta.stem} ({n}){ruta.suffix}"
+        usados.add(candidato.lower())
+        resultado.append(candidato)
+    return resultado
+
+
+def escribir_zip(destino, archivos, abrir, max_simultaneos=4, max_trozos_en_cola=2, progreso=None):
+    """
+    Escribe en `destino` (cualquier objeto con write(), no hace falta que admita seek) un ZIP con
+    `archivos`, una lista de (blob_name, nombre_en_zip, fecha). `abrir(blob_name)` devuelve un
+    iterable con los trozos del contenido.
+
+    Hasta `max_simultaneos` archivos se descargan a la vez mientras el ZIP se escribe en orden;
+    cada descarga espera si tiene ya `max_trozos_en_cola` trozos sin escribir, así que la memoria
+    usada está acotada sea cual sea el tamaño de los archivos. `progreso(n)` se llama desde el
+    hilo que invoca esta función tras escribir cada archivo.
+    """
+    cancelado = threading.Event()
+    colas = [queue.Queue(maxsize=max_trozos_en_cola) for _ in archivos]
+
+    def poner(cola, elemento):
+        while not cancelado.is_set():
+            try:
+                cola.put(elemento, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def descargar(indice):
+        if cancelado.is_set():
+            return
+        cola = colas[indice]
+        try:
+            for trozo in abrir(archivos[indice][0]):
+                if not poner(cola, trozo):
+                    return
+            poner(cola, _FIN)
+        except Exception as e:
+            poner(cola, e)
+
+    executor = ThreadPoolExecutor(max_workers=max_simultaneos, thread_name_prefix="zip")
+    try:
+        for indice in range(len(archivos)):
+            executor.submit(descargar, indice)
+        with zipfile.ZipFile(destino, "w", allowZip64=True) as zf:
+            for n, ((_, nombre, fecha), cola) in enumerate(zip(archivos, colas), start=1):
+                info = zipfile.ZipInfo(nombre, date_time=fecha.timetuple()[:6] if fecha else (1980, 1, 1, 0, 0, 0))
+                comprimido = Path(nombre).suffix.lower() in EXTENSIONES_COMPRIMIDAS
+                info.compress_type = zipfile.ZIP_STORED if comprimido else zipfile.ZIP_DEFLATED
+                with zf.open(info, "w", force_zip64=True) as salida:
+                    while True:
+                        trozo = cola.get()
+                        if trozo is _FIN:
+                            break
+                        if isinstance(trozo, Exception):
+                            raise trozo
+                        salida.write(trozo)
+                if progreso:
+                    progreso(n)
+    finally:
+        cancelado.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+class EscritorPorBloques:
+    """
+    Objeto de solo escritura que agrupa lo escrito en bloques de `tamano_bloque` bytes y entrega
+    cada bloque completo a `subir_bloque(datos)`. Permite generar un ZIP directamente en un blob
+    sin tenerlo entero en memoria ni en disco.
+    """
+
+    def __init__(self, subir_bloque, tamano_bloque):
+        self.subir_bloque = subir_bloque
+        self.tamano_bloque = tamano_bloque
+        self._buffer = bytearray()
+
+    def write(self, datos):
+        self._buffer += datos
+        while len(self._buffer) >= self.tamano_bloque:
+            self.subir_bloque(bytes(self._buffer[:self.tamano_bloque]))
+            del self._buffer[:self.tamano_bloque]
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def cerrar(self):
+        """Entrega el último bloque, aunque esté incompleto."""
+        if self._buffer:
+            self.subir_bloque(bytes(self._buffer))
+            self._buffer.clear()
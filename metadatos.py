@@ -0,0 +1,37 @@
+import urllib.parse
+
+# Campos de los metadatos de un archivo que se guardan como metadatos nativos del blob
+CAMPOS_META = ("usuario", "fecha", "comentario", "nombre_original")
+# Azure admite como mucho 8 KB de metadatos por blob, sumando nombres y valores
+MAX_BYTES_METADATA = 8 * 1024
+
+
+def meta_a_metadata_blob(meta):
+    """
+    Convierte el diccionario de metadatos de un archivo en metadatos nativos de Azure.
+    Los valores viajan como cabeceras HTTP (solo ASCII), así que se codifican en formato URL.
+    """
+    return {
+        campo: urllib.parse.quote(str(meta[campo]), safe="")
+        for campo in CAMPOS_META
+        if meta.get(campo) is not None
+    }
+
+
+def cabe_en_metadata(metadata):
+    """Indica si los metadatos nativos caben en el límite de Azure (un comentario largo puede no caber)."""
+    return sum(len(clave) + len(valor) for clave, valor in metadata.items()) <= MAX_BYTES_METADATA
+
+
+def metadata_blob_a_meta(metadata):
+    """
+    Recupera el diccionario de metadatos desde los metadatos nativos de un blob.
+    Devuelve None si el blob no tiene metadatos de la app (archivo con .meta.json antiguo).
+    """
+    if not metadata or "nombre_original" not in metadata:
+        return None
+    return {
+        campo: urllib.parse.unquote(valor)
+        for campo, valor in metadata.items()
+        if campo in CAMPOS_META
+    }
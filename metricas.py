@@ -0,0 +1,234 @@
+import bisect
+import contextlib
+import functools
+import math
+import threading
+import time
+from collections import defaultdict, deque
+
+# Métricas del proceso: contadores, indicadores e histogramas de duración con etiquetas, más los
+# tramos de las últimas ejecuciones de la página. Se exportan en el formato de texto de Prometheus.
+PREFIJO_METRICAS = "centro_recursos_"
+# Límites superiores (en segundos) de las cubetas de los histogramas
+LIMITES_S = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NADA = contextlib.nullcontext()
+
+
+class Histograma:
+    """Histograma de cubetas fijas, acumulable y exportable tal cual a Prometheus."""
+
+    def __init__(self, limites=LIMITES_S):
+        self.limites = limites
+        self.cubetas = [0] * (len(limites) + 1)  # la última es +Inf
+        self.cuenta = 0
+        self.suma = 0.0
+        self.maximo = 0.0
+
+    def observar(self, valor):
+        self.cubetas[bisect.bisect_left(self.limites, valor)] += 1
+        self.cuenta += 1
+        self.suma += valor
+        self.maximo = max(self.maximo, valor)
+
+    def percentil(self, p):
+        """Estimación del percentil `p` (0-1): el límite de la cubeta en la que cae."""
+        if not self.cuenta:
+            return None
+        objetivo = p * self.cuenta
+        acumulado = 0
+        for limite, n in zip(self.limites, self.cubetas):
+            acumulado += n
+            if acumulado >= objetivo:
+                return min(limite, self.maximo)
+        return self.maximo
+
+
+class _Cronometro:
+    def __init__(self, metricas, nombre, etiquetas):
+        self.metricas = metricas
+        self.nombre = nombre
+        self.etiquetas = etiquetas
+
+    def __enter__(self):
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, traza):
+        self.metricas.observar(f"{self.nombre}_segundos", time.perf_counter() - self.inicio, **self.etiquetas)
+        if tipo is not None:
+            self.metricas.contar(f"{self.nombre}_errores_total", error=tipo.__name__, **self.etiquetas)
+        return False
+
+
+class Ejecucion:
+    """
+    Tramos de una ejecución de la página (un rerun de Streamlit), en orden.
+    `tramo(nombre)` cierra el tramo que acaba en ese punto del script: su duración es el tiempo desde
+    el tramo anterior. Si la ejecución se corta (st.stop, st.rerun) se queda sin `duracion_s`.
+    """
+
+    def __init__(self, metricas):
+        self._metricas = metricas
+        self.fecha = time.time()
+        self.tramos = []
+        self.duracion_s = None
+        self._inicio = self._ultimo = time.perf_counter()
+
+    def tramo(self, nombre):
+        ahora = time.perf_counter()
+        self.tramos.append((nombre, ahora - self._ultimo))
+        self._metricas.observar("tramo_segundos", ahora - self._ultimo, tramo=nombre)
+        self._ultimo = ahora
+
+    def terminar(self):
+        self.duracion_s = time.perf_counter() - self._inicio
+        self._metricas.observar("ejecucion_segundos", self.duracion_s)
+
+
+class _EjecucionInactiva:
+    def tramo(self, nombre):
+        pass
+
+    def terminar(self):
+        pass
+
+
+def _valor_prometheus(valor):
+    """Valor con precisión completa (con :g un contador de bytes perdería dígitos y rate() saldría mal)."""
+    valor = float(valor)
+    if math.isnan(valor):
+        return "NaN"
+    if math.isinf(valor):
+        return "+Inf" if valor > 0 else "-Inf"
+    return repr(valor)
+
+
+def _etiquetas_prometheus(etiquetas):
+    if not etiquetas:
+        return ""
+    escapar = lambda v: str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{clave}="{escapar(valor)}"' for clave, valor in etiquetas) + "}"
+
+
+class Metricas:
+    """
+    Registro de métricas compartido por todas las sesiones del proceso.
+
+    Con `activadas=False` todas las operaciones vuelven de inmediato (y `cronometrado` devuelve la
+    función sin envolver), así que instrumentar el código apenas cuesta nada si no se usan.
+    """
+
+    def __init__(self, activadas=True, max_ejecuciones=20):
+        self.activadas = activadas
+        self.inicio = time.time()
+        self._lock = threading.Lock()
+        self._contadores = defaultdict(float)  # (nombre, etiquetas) -> valor
+        self._indicadores = {}
+        self._histogramas = {}
+        self.ejecuciones = deque(maxlen=max_ejecuciones)
+
+    @staticmethod
+    def _clave(nombre, etiquetas):
+        return nombre, tuple(sorted(etiquetas.items()))
+
+    def contar(self, nombre, valor=1, **etiquetas):
+        """Suma `valor` a un contador (los nombres de contador terminan en _total)."""
+        if not self.activadas:
+            return
+        with self._lock:
+            self._contadores[self._clave(nombre, etiquetas)] += valor
+
+    def fijar(self, nombre, valor, **etiquetas):
+        """Fija el valor actual de un indicador."""
+        if not self.activadas:
+            return
+        with self._lock:
+            self._indicadores[self._clave(nombre, etiquetas)] = valor
+
+    def observar(self, nombre, valor, **etiquetas):
+        """Añade una observación (en segundos) a un histograma."""
+        if not self.activadas:
+            return
+        clave = self._clave(nombre, etiquetas)
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = Histograma()
+            histograma.observar(valor)
+
+    def medir(self, nombre, **etiquetas):
+        """
+        Context manager que registra la duración del bloque en el histograma <nombre>_segundos y, si
+        lanza una excepción, la cuenta en <nombre>_errores_total con su tipo.
+        """
+        if not self.activadas:
+            return _NADA
+        return _Cronometro(self, nombre, etiquetas)
+
+    def cronometrado(self, nombre, **etiquetas):
+        """Decorador equivalente a `medir` para una función entera."""
+        def decorador(funcion):
+            if not self.activadas:
+                return funcion
+
+            @functools.wraps(funcion)
+            def envoltura(*args, **kwargs):
+                with _Cronometro(self, nombre, etiquetas):
+                    return funcion(*args, **kwargs)
+            return envoltura
+        return decorador
+
+    def iniciar_ejecucion(self):
+        if not self.activadas:
+            return _EjecucionInactiva()
+        ejecucion = Ejecucion(self)
+        with self._lock:
+            self.ejecuciones.append(ejecucion)
+        return ejecucion
+
+    def ultimas_ejecuciones(self):
+        """Copia de las últimas ejecuciones de la página, de la más reciente a la más antigua."""
+        with self._lock:
+            return list(reversed(self.ejecuciones))
+
+    def contadores(self, nombre):
+        """Valores de un contador como {etiquetas: valor}, con las etiquetas como tupla de pares."""
+        with self._lock:
+            return {etiquetas: valor for (n, etiquetas), valor in self._contadores.items() if n == nombre}
+
+    def histogramas(self, nombre):
+        with self._lock:
+            return {etiquetas: h for (n, etiquetas), h in self._histogramas.items() if n == nombre}
+
+    def prometheus(self):
+        """Todas las métricas en el formato de texto de exposición de Prometheus."""
+        lineas = []
+        with self._lock:
+            contadores = sorted(self._contadores.items())
+            indicadores = sorted(self._indicadores.items())
+            histogramas = sorted(self._histogramas.items(), key=lambda item: item[0])
+            for tipo, valores in (("counter", contadores), ("gauge", indicadores)):
+                anterior = None
+                for (nombre, etiquetas), valor in valores:
+                    if nombre != anterior:
+                        lineas.append(f"# TYPE {PREFIJO_METRICAS}{nombre} {tipo}")
+                        anterior = nombre
+                    lineas.append(f"{PREFIJO_METRICAS}{nombre}{_etiquetas_prometheus(etiquetas)} {_valor_prometheus(valor)}")
+            anterior = None
+            for (nombre, etiquetas), h in histogramas:
+                if nombre != anterior:
+                    lineas.append(f"# TYPE {PREFIJO_METRICAS}{nombre} histogram")
+                    anterior = nombre
+                acumulado = 0
+                for limite, n in zip(list(h.limites) + ["+Inf"], h.cubetas):
+                    acumulado += n
+                    le = limite if limite == "+Inf" else f"{limite:g}"
+                    lineas.append(
+                        f"{PREFIJO_METRICAS}{nombre}_bucket{_etiquetas_prometheus(etiquetas + (('le', le),))} {acumulado}"
+                    )
+                lineas.append(f"{PREFIJO_METRICAS}{nombre}_sum{_etiquetas_prometheus(etiquetas)} {_valor_prometheus(h.suma)}")
+                lineas.append(f"{PREFIJO_METRICAS}{nombre}_count{_etiquetas_prometheus(etiquetas)} {h.cuenta}")
+        lineas.append(f"# TYPE {PREFIJO_METRICAS}inicio_proceso_segundos gauge")
+        lineas.append(f"{PREFIJO_METRICAS}inicio_proceso_segundos {self.inicio:.0f}")
+        return "\n".join(lineas) + "\n"
@@ -0,0 +1,81 @@
+import argparse
+import json
+import os
+import tomllib
+from pathlib import Path
+
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient
+
+from metadatos import CAMPOS_META, meta_a_metadata_blob, metadata_blob_a_meta
+
+# Migra los metadatos de los archivos desde los blobs <nombre>.meta.json a los metadatos
+# nativos de cada blob. Uso:
+#   python migrar_metadatos.py [--prefijo direccion_deportiva/] [--conservar-sidecars] [--simular]
+# La cadena de conexión se toma de AZURE_CONNECTION_STRING o de .streamlit/secrets.toml
+# Al cambiar los metadatos cambia el ETag de cada archivo, así que se borra el índice (_index.json) de
+# las áreas migradas: la app lo reconstruye en la siguiente visita con los ETag nuevos.
+
+NOMBRE_INDICE = "_index.json"
+
+
+def cadena_de_conexion():
+    if os.environ.get("AZURE_CONNECTION_STRING"):
+        return os.environ["AZURE_CONNECTION_STRING"]
+    with open(Path(".streamlit") / "secrets.toml", "rb") as f:
+        return tomllib.load(f)["AZURE_CONNECTION_STRING"]
+
+
+parser = argparse.ArgumentParser(description="Mueve los .meta.json a metadatos nativos de Azure Blob Storage.")
+parser.add_argument("--prefijo", default="", help="Migrar solo un área (p. ej. direccion_deportiva/)")
+parser.add_argument("--conservar-sidecars", action="store_true", help="No eliminar los .meta.json tras migrarlos")
+parser.add_argument("--simular", action="store_true", help="Mostrar qué se haría sin modificar nada")
+args = parser.parse_args()
+
+container_client = BlobServiceClient.from_connection_string(cadena_de_conexion()).get_container_client("archivos-app")
+
+# Un único listado con metadatos: se sabe qué archivos ya están migrados y qué .meta.json existen
+blobs = {}
+sidecars = []
+for blob in container_client.list_blobs(name_starts_with=args.prefijo, include=["metadata"]):
+    if blob.name.endswith(".meta.json"):
+        sidecars.append(blob.name)
+    else:
+        blobs[blob.name] = blob
+
+migrados = huerfanos = ya_migrados = 0
+areas_migradas = set()
+for sidecar in sidecars:
+    blob_name = sidecar[:-len(".meta.json")]
+    if blob_name not in blobs:
+        huerfanos += 1
+        print(f"⚠️ {sidecar} no tiene archivo asociado, se deja como está.")
+        continue
+
+    if metadata_blob_a_meta(blobs[blob_name].metadata) is not None:
+        ya_migrados += 1
+    else:
+        meta = json.loads(container_client.get_blob_client(sidecar).download_blob().readall())
+        meta = {campo: meta[campo] for campo in CAMPOS_META if campo in meta}
+        meta.setdefault("nombre_original", Path(blob_name).name)
+        print(f"→ {blob_name}: {meta}")
+        if not args.simular:
+            metadata = {**(blobs[blob_name].metadata or {}), **meta_a_metadata_blob(meta)}
+            container_client.get_blob_client(blob_name).set_blob_metadata(metadata)
+            areas_migradas.add(blob_name.split("/", 1)[0] + "/")
+        migrados += 1
+
+    if not args.conservar_sidecars and not args.simular:
+        container_client.get_blob_client(sidecar).delete_blob()
+
+# El índice guarda el ETag de cada archivo: con los antiguos fallarían las lecturas condicionadas
+# (exportación en ZIP) y la caché de contenidos no acertaría nunca
+for prefijo in sorted(areas_migradas):
+    try:
+        container_client.get_blob_client(f"{prefijo}{NOMBRE_INDICE}").delete_blob()
+        print(f"🗑️ Índice de {prefijo} eliminado: se reconstruirá en la próxima visita al área.")
+    except ResourceNotFoundError:
+        pass
+
+modo = " (simulación)" if args.simular else ""
+print(f"✅ Metadatos migrados{modo}: {migrados}. Ya migrados: {ya_migrados}. Sidecars huérfanos: {huerfanos}.")
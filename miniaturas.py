@@ -0,0 +1,96 @@
+import os
+import shutil
+import subprocess
+import tempfile
+from io import BytesIO
+
+from PIL import Image
+
+# Derivados (miniaturas) generados a partir de los archivos subidos
+TAMANO_MINIATURA = (320, 320)
+CALIDAD_WEBP = 75
+
+EXTENSIONES_IMAGEN = {".jpg", ".jpeg", ".png", ".gif"}
+EXTENSIONES_VIDEO = {".mp4", ".mov"}
+EXTENSIONES_PDF = {".pdf"}
+
+try:
+    # Opcional: renderizado de la primera página de los PDF
+    import pypdfium2
+except ImportError:
+    pypdfium2 = None
+
+
+def admite_miniatura(extension):
+    """Indica si se puede generar una miniatura para esa extensión con las dependencias instaladas."""
+    if extension in EXTENSIONES_IMAGEN:
+        return True
+    if extension in EXTENSIONES_PDF:
+        return pypdfium2 is not None
+    if extension in EXTENSIONES_VIDEO:
+        return shutil.which("ffmpeg") is not None
+    return False
+
+
+def _a_webp(imagen):
+    imagen.thumbnail(TAMANO_MINIATURA)
+    if imagen.mode not in ("RGB", "RGBA"):
+        imagen = imagen.convert("RGBA" if "transparency" in imagen.info else "RGB")
+    salida = BytesIO()
+    imagen.save(salida, format="WEBP", quality=CALIDAD_WEBP)
+    return salida.getvalue()
+
+
+def _miniatura_pdf(fichero):
+    pdf = pypdfium2.PdfDocument(fichero)
+    try:
+        pagina = pdf[0]
+        # Escala para que el lado mayor quede cerca del tamaño de la miniatura
+        ancho, alto = pagina.get_size()
+        escala = max(TAMANO_MINIATURA) / max(ancho, alto)
+        return _a_webp(pagina.render(scale=escala).to_pil())
+    finally:
+        pdf.close()
+
+
+def _fotograma_video(origen):
+    """Extrae con ffmpeg un fotograma (segundo 1, o el primero si el vídeo es más corto) de una ruta o URL."""
+    for instante in ("1", "0"):
+        resultado = subprocess.run(
+            ["ffmpeg", "-v", "error", "-ss", instante, "-i", origen, "-frames:v", "1",
+             "-vf", f"scale={TAMANO_MINIATURA[0]}:-2", "-f", "image2pipe", "-vcodec", "png", "-"],
+            capture_output=True, timeout=60
+        )
+        if resultado.returncode == 0 and resultado.stdout:
+            return _a_webp(Image.open(BytesIO(resultado.stdout)))
+    return None
+
+
+def generar_miniatura(origen, extension):
+    """
+    Genera una miniatura WebP (bytes) de una imagen, de la primera página de un PDF o de un fotograma
+    de un vídeo. `origen` es un objeto fichero o, para vídeos, también una ruta o URL (p. ej. una SAS),
+    de modo que ffmpeg solo lee el trozo del vídeo que necesita.
+    Devuelve None si el tipo no está soportado o no se puede procesar.
+    """
+    extension = extension.lower()
+    if not admite_miniatura(extension):
+        return None
+    try:
+        if extension in EXTENSIONES_IMAGEN:
+            return _a_webp(Image.open(origen))
+        if extension in EXTENSIONES_PDF:
+            return _miniatura_pdf(origen)
+        if isinstance(origen, str):
+            return _fotograma_video(origen)
+        # ffmpeg necesita poder buscar en el archivo (el índice de un mp4 suele ir al final)
+        # delete=False: en Windows ffmpeg no puede abrir el temporal mientras siga abierto aquí
+        tmp = tempfile.NamedTemporaryFile(suffix=extension, delete=False)
+        try:
+            with tmp:
+                shutil.copyfileobj(origen, tmp)
+            return _fotograma_video(tmp.name)
+        finally:
+            os.remove(tmp.name)
+    except Exception:
+        return None
@@ -0,0 +1,134 @@
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from azure.core.exceptions import ResourceModifiedError, ResourceNotFoundError
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+# Servidor de rangos para reproducir vídeos cuando el almacenamiento no da enlaces firmados (carpeta
+# local, memoria o Azure sin clave de cuenta). El reproductor del navegador pide por HTTP Range solo
+# los trozos que va a reproducir, así que se puede saltar a cualquier punto de un partido entero
+# sin que el proceso de la app tenga nunca más de un trozo en memoria por petición.
+SALT_VIDEO = "salt-video"
+TAMANO_TROZO_VIDEO = 1024 * 1024
+
+
+def rango_solicitado(cabecera, size):
+    """
+    Devuelve (inicio, fin) (fin incluido) del rango de una cabecera Range de un solo rango, o None si
+    no hay cabecera o no se entiende (se sirve el archivo entero). Lanza ValueError si el rango no
+    se puede satisfacer (respuesta 416).
+    """
+    coincidencia = re.fullmatch(r"bytes=(\d*)-(\d*)", (cabecera or "").strip())
+    if not coincidencia or not any(coincidencia.groups()):
+        return None
+    inicio, fin = coincidencia.groups()
+    if size == 0:
+        raise ValueError("El archivo está vacío.")
+    if not inicio:
+        # "bytes=-N": los últimos N bytes
+        if int(fin) == 0:
+            raise ValueError("Rango vacío.")
+        return max(0, size - int(fin)), size - 1
+    inicio = int(inicio)
+    fin = min(int(fin), size - 1) if fin else size - 1
+    if inicio >= size or fin < inicio:
+        raise ValueError("Rango fuera del archivo.")
+    return inicio, fin
+
+
+class ServidorVideo:
+    """
+    Servidor HTTP mínimo, en un hilo del proceso, que sirve blobs del almacenamiento por rangos.
+
+    Cada URL lleva el nombre del blob firmado y con caducidad (como un enlace SAS), así que el
+    servidor no da acceso a nada que la app no haya ofrecido. Los datos se leen del almacenamiento
+    en trozos de `tamano_trozo` y se escriben en el socket según llegan.
+    """
+
+    def __init__(self, almacenamiento, clave, puerto, url_publica, segundos_validez, tamano_trozo=TAMANO_TROZO_VIDEO):
+        self.almacenamiento = almacenamiento
+        self.url_publica = url_publica.rstrip("/")
+        self.segundos_validez = segundos_validez
+        self.tamano_trozo = tamano_trozo
+        self._serializer = URLSafeTimedSerializer(clave, salt=SALT_VIDEO)
+
+        servidor = self
+
+        class Manejador(BaseHTTPRequestHandler):
+            def do_GET(self):
+                servidor._servir(self, con_cuerpo=True)
+
+            def do_HEAD(self):
+                servidor._servir(self, con_cuerpo=False)
+
+            def log_message(self, *args):
+                pass
+
+        # Lanza OSError si el puerto está ocupado (p. ej. por otro proceso de la app)
+        self._http = ThreadingHTTPServer(("", puerto), Manejador)
+        self._http.daemon_threads = True
+        threading.Thread(target=self._http.serve_forever, name="servidor-video", daemon=True).start()
+
+    def url(self, nombre, content_type=None):
+        """URL firmada y temporal desde la que el navegador puede reproducir el blob."""
+        token = self._serializer.dumps({"blob": nombre, "tipo": content_type})
+        return f"{self.url_publica}/video/{token}"
+
+    def _servir(self, peticion, con_cuerpo):
+        partes = peticion.path.split("/")
+        if len(partes) != 3 or partes[1] != "video":
+            peticion.send_error(404)
+            return
+        try:
+            datos = self._serializer.loads(partes[2], max_age=self.segundos_validez)
+        except BadSignature:
+            # Incluye los enlaces caducados
+            peticion.send_error(403)
+            return
+        nombre = datos["blob"]
+        try:
+            propiedades = self.almacenamiento.propiedades(nombre)
+        except ResourceNotFoundError:
+            peticion.send_error(404)
+            return
+
+        size = propiedades.size
+        try:
+            rango = rango_solicitado(peticion.headers.get("Range"), size)
+        except ValueError:
+            peticion.send_response(416)
+            peticion.send_header("Content-Range", f"bytes */{size}")
+            peticion.send_header("Content-Length", "0")
+            peticion.end_headers()
+            return
+        inicio, fin = rango or (0, size - 1)
+
+        peticion.send_response(206 if rango else 200)
+        peticion.send_header("Content-Type", datos["tipo"] or propiedades.content_type or "application/octet-stream")
+        peticion.send_header("Content-Length", str(fin - inicio + 1))
+        peticion.send_header("Accept-Ranges", "bytes")
+        peticion.send_header("ETag", propiedades.etag)
+        peticion.send_header("Cache-Control", "private, max-age=3600")
+        if rango:
+            peticion.send_header("Content-Range", f"bytes {inicio}-{fin}/{size}")
+        peticion.end_headers()
+        if not con_cuerpo:
+            return
+
+        posicion = inicio
+        try:
+            while posicion <= fin:
+                # Condicionado al ETag: si el blob cambia a mitad, se corta en lugar de mezclar versiones
+                trozo, _ = self.almacenamiento.descargar(
+                    nombre, posicion, min(self.tamano_trozo, fin - posicion + 1), etag=propiedades.etag
+                )
+                if not trozo:
+                    break
+                peticion.wfile.write(trozo)
+                posicion += len(trozo)
+        except (BrokenPipeError, ConnectionResetError):
+            # El navegador cancela la petición en curso cada vez que se salta a otro punto del vídeo
+            pass
+        except (ResourceModifiedError, ResourceNotFoundError):
+            peticion.close_connection = True
@@ -0,0 +1,41 @@
+import json
+
+# Almacén de usuarios: un registro JSON por línea, indexado en memoria por mail.
+# usuarios.xlsx queda solo como formato de intercambio para los administradores.
+NOMBRE_BLOB_USUARIOS = "usuarios.jsonl"
+NOMBRE_BLOB_USUARIOS_EXCEL = "usuarios.xlsx"
+COLUMNAS_USUARIOS = ["usuario", "rol", "area", "mail", "contraseña", "permisos", "jerarquía"]
+
+
+def parsear_usuarios(contenido):
+    """Convierte el contenido de usuarios.jsonl en un diccionario mail -> registro."""
+    usuarios = {}
+    for linea in contenido.decode("utf-8").splitlines():
+        if linea.strip():
+            registro = json.loads(linea)
+            usuarios[registro["mail"]] = registro
+    return usuarios
+
+
+def serializar_usuarios(usuarios):
+    """Convierte el diccionario mail -> registro en el contenido de usuarios.jsonl."""
+    lineas = [json.dumps(registro, ensure_ascii=False, default=str) for registro in usuarios.values()]
+    return ("\n".join(lineas) + "\n").encode("utf-8")
+
+
+def usuarios_desde_excel(fichero):
+    """Lee un Excel de usuarios (ruta o fichero) y devuelve el diccionario mail -> registro."""
+    # pandas/openpyxl solo se cargan para importar/exportar, nunca en el arranque de la app
+    import pandas as pd
+
+    df = pd.read_excel(fichero, dtype=str).fillna("")
+    return {registro["mail"]: registro for registro in df.to_dict("records") if registro.get("mail")}
+
+
+def usuarios_a_excel(usuarios, fichero):
+    """Escribe el diccionario mail -> registro como Excel (ruta o fichero)."""
+    import pandas as pd
+
+    df = pd.DataFrame(list(usuarios.values()))
+    columnas = [c for c in COLUMNAS_USUARIOS if c in df.columns] + [c for c in df.columns if c not in COLUMNAS_USUARIOS]
+    df[columnas].to_excel(fichero, index=False)
@@ -0,0 +1,42 @@
+import argparse
+import os
+import tomllib
+from pathlib import Path
+
+from azure.storage.blob import BlobServiceClient
+
+from usuarios import NOMBRE_BLOB_USUARIOS, parsear_usuarios, serializar_usuarios, usuarios_a_excel, usuarios_desde_excel
+
+# Importa/exporta el almacén de usuarios (usuarios.jsonl en Azure) desde/hacia Excel. Uso:
+#   python usuarios_excel.py exportar usuarios.xlsx   -> descarga el almacén como Excel para editarlo
+#   python usuarios_excel.py importar usuarios.xlsx   -> sustituye el almacén por el contenido del Excel
+# La cadena de conexión se toma de AZURE_CONNECTION_STRING o de .streamlit/secrets.toml
+
+
+def cadena_de_conexion():
+    if os.environ.get("AZURE_CONNECTION_STRING"):
+        return os.environ["AZURE_CONNECTION_STRING"]
+    with open(Path(".streamlit") / "secrets.toml", "rb") as f:
+        return tomllib.load(f)["AZURE_CONNECTION_STRING"]
+
+
+parser = argparse.ArgumentParser(description="Importa o exporta los usuarios de la app en formato Excel.")
+parser.add_argument("accion", choices=["importar", "exportar"])
+parser.add_argument("archivo", nargs="?", default="usuarios.xlsx")
+args = parser.parse_args()
+
+container_client = BlobServiceClient.from_connection_string(cadena_de_conexion()).get_container_client("archivos-app")
+blob_client = container_client.get_blob_client(NOMBRE_BLOB_USUARIOS)
+
+if args.accion == "exportar":
+    usuarios = parsear_usuarios(blob_client.download_blob().readall())
+    usuarios_a_excel(usuarios, args.archivo)
+    print(f"✅ {len(usuarios)} usuarios exportados a {args.archivo}.")
+else:
+    usuarios = usuarios_desde_excel(args.archivo)
+    sin_cifrar = [mail for mail, registro in usuarios.items() if not str(registro.get("contraseña", "")).startswith("$2")]
+    if sin_cifrar:
+        print(f"⚠️ {len(sin_cifrar)} contraseñas sin cifrar. Ejecuta antes encriptar_contraseñas.py: {', '.join(sin_cifrar)}")
+    else:
+        blob_client.upload_blob(serializar_usuarios(usuarios), overwrite=True)
+        print(f"✅ {len(usuarios)} usuarios importados en {NOMBRE_BLOB_USUARIOS}.")